@@ -0,0 +1,192 @@
+import numpy as np
+import neighbours as nb
+
+
+def spherical_kmeans(vectors, n_clusters, n_iter=10, seed=0):
+    """
+    Clusters unit-length vectors by cosine similarity (k-means with centroids re-normalised after every step).
+
+    Args:
+        vectors: A 2D numpy array of unit-length vectors.
+        n_clusters: An integer, the number of clusters.
+        n_iter: (default 10) the number of assignment/update rounds.
+        seed: (default 0) seed for choosing the initial centroids.
+    Returns:
+        A 2D numpy array of unit-length centroids, one row per cluster.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        # Assign every vector to its most similar centroid.
+        assign = nb.top_k_rows(vectors, centroids, 1)[0][:, 0]
+
+        # Move each centroid to the (normalised) mean of its vectors. Empty clusters get a random vector instead.
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=n_clusters)
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), empty.sum())]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1), 1e-12)[:, np.newaxis]
+
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """
+    An approximate nearest-neighbour index over word embeddings (an inverted file index: the vectors are split into
+    clusters by k-means, and a query only scans the n_probe clusters whose centroids are closest to it).
+
+    The index has the same most_similar() as a gensim model and passes the other model attributes through, so it can
+    be passed to the card generator in place of the model itself. n_probe is the recall/latency knob: more probed
+    clusters find more of the exact neighbours but scan more vectors.
+    """
+
+    def __init__(self, gensim_model, centroids, list_offsets, list_rows, n_probe=8):
+        """
+        Args:
+            gensim_model: The pre-trained word embeddings the index was built from.
+            centroids: A 2D numpy array of unit-length cluster centroids.
+            list_offsets: A 1D numpy array; the rows of cluster c are list_rows[list_offsets[c]:list_offsets[c+1]].
+            list_rows: A 1D numpy array of embedding rows, grouped by cluster.
+            n_probe: (default 8) the number of clusters to scan per query.
+        """
+        self.model = gensim_model
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.n_probe = n_probe
+
+    @classmethod
+    def build(cls, gensim_model, n_lists=None, n_iter=10, sample_size=None, n_probe=8, seed=0):
+        """
+        Builds an index for the given embeddings.
+
+        Args:
+            gensim_model: The pre-trained word embeddings.
+            n_lists: (optional) the number of clusters. Defaults to about 4 * sqrt(vocabulary size).
+            n_iter: (default 10) the number of k-means rounds.
+            sample_size: (optional) the number of vectors to train k-means on. Defaults to 64 per cluster.
+            n_probe: (default 8) the number of clusters to scan per query.
+            seed: (default 0) seed for sampling the training vectors and the initial centroids.
+        Returns:
+            An IVFIndex object.
+        """
+        vectors = nb.unit_vectors(gensim_model)
+        n_vectors = len(vectors)
+        if n_lists is None:
+            n_lists = max(1, int(4 * np.sqrt(n_vectors)))
+        if sample_size is None:
+            sample_size = 64 * n_lists
+        sample_size = min(max(sample_size, n_lists), n_vectors)
+
+        # Train the centroids on a random sample (sorted, so the memory map is read front to back).
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(n_vectors, sample_size, replace=False))
+        centroids = spherical_kmeans(np.asarray(vectors[sample_rows], dtype=np.float32), n_lists, n_iter, seed)
+
+        # Assign all vectors to their closest centroid, block by block.
+        assign = np.empty(n_vectors, dtype=np.int32)
+        block_rows = 100000
+        for start in range(0, n_vectors, block_rows):
+            block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+            assign[start:start + block_rows] = nb.top_k_rows(block, centroids, 1)[0][:, 0]
+
+        # Group the rows by cluster.
+        list_rows = np.argsort(assign, kind='stable').astype(np.int32)
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))]).astype(np.int64)
+        return cls(gensim_model, centroids, list_offsets, list_rows, n_probe)
+
+    def save(self, filename):
+        """
+        Saves the index (but not the embeddings themselves) to a .npz file.
+
+        Arg:
+            filename: Path of the file to write.
+        """
+        np.savez(filename, centroids=self.centroids, list_offsets=self.list_offsets, list_rows=self.list_rows,
+                 n_probe=self.n_probe)
+
+    @classmethod
+    def load(cls, filename, gensim_model):
+        """
+        Loads an index saved with save().
+
+        Args:
+            filename: Path of the .npz file.
+            gensim_model: The pre-trained word embeddings the index was built from.
+        Returns:
+            An IVFIndex object.
+        """
+        with np.load(filename) as data:
+            return cls(gensim_model, data['centroids'], data['list_offsets'], data['list_rows'], int(data['n_probe']))
+
+    def search(self, queries, topn=10, n_probe=None):
+        """
+        Finds the approximate nearest neighbours of the given vectors.
+
+        Args:
+            queries: A 2D numpy array of unit-length query vectors.
+            topn: (default 10) the number of neighbours to return per query.
+            n_probe: (optional) the number of clusters to scan, overriding the index's default.
+        Returns:
+            A list with one tuple (rows, similarities) of 1D arrays per query, most similar first.
+        """
+        if n_probe is None:
+            n_probe = self.n_probe
+        n_probe = min(n_probe, len(self.centroids))
+
+        vectors = nb.unit_vectors(self.model)
+        queries = np.asarray(queries, dtype=np.float32)
+        probe_lists = nb.top_k_rows(queries, self.centroids, n_probe)[0]
+
+        results = []
+        for query, lists in zip(queries, probe_lists):
+            # Collect the candidate rows of the probed clusters (sorted for sequential reads) and scan only those.
+            rows = np.sort(np.concatenate([self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]] for c in lists]))
+            nbr_idx, nbr_sim = nb.top_k_rows(query[np.newaxis, :], vectors[rows], topn)
+            results.append((rows[nbr_idx[0]], nbr_sim[0]))
+        return results
+
+    def candidate_similarities(self, row):
+        """
+        Computes the similarities between the vector in the given row and the vectors in the clusters closest to it
+        (see neighbours.candidate_similarities() ).
+
+        Arg:
+            row: An integer, the row of the query word.
+        Returns:
+            A tuple (rows, similarities) of 1D arrays.
+        """
+        vectors = nb.unit_vectors(self.model)
+        query = np.asarray(vectors[row], dtype=np.float32)
+        lists = nb.top_k_rows(query[np.newaxis, :], self.centroids, min(self.n_probe, len(self.centroids)))[0][0]
+        rows = np.sort(np.concatenate([self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]] for c in lists]))
+        return rows, np.dot(vectors[rows], query)
+
+    def most_similar(self, positive, topn=10):
+        """
+        Returns the (approximately) most similar words to the given word, like gensim's most_similar().
+
+        Args:
+            positive: A string that is in the vocabulary.
+            topn: (default 10) the number of most similar words to return.
+        Returns:
+            A list of (word, cosine similarity) tuples, most similar first.
+        """
+        row = nb.word_index(self.model, positive)
+        query = np.asarray(nb.unit_vectors(self.model)[row], dtype=np.float32)[np.newaxis, :]
+        nbr_rows, nbr_sim = self.search(query, topn + 1)[0]
+        index2word = self.model.index2word
+        return [(index2word[j], float(s)) for j, s in zip(nbr_rows, nbr_sim) if j != row][:topn]
+
+    # Everything else (vocab, index2word, vectors_norm, ...) comes from the underlying embeddings.
+
+    @property
+    def wv(self):
+        return self
+
+    def __getattr__(self, name):
+        if name == 'model':
+            raise AttributeError(name)
+        return getattr(self.model, name)
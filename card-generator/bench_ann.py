@@ -0,0 +1,82 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+import ann
+import embeddings as emb
+import gs_probdist as gspd
+
+
+def recall_benchmark(index, words, topn=10, n_probes=(1, 2, 4, 8, 16, 32, 64)):
+    """
+    Compares the approximate neighbours returned by an IVFIndex with the exact ones for a list of words.
+
+    Args:
+        index: An ann.IVFIndex object.
+        words: A list of strings (words not in the vocabulary are skipped).
+        topn: (default 10) the number of neighbours to compare per word.
+        n_probes: (default (1, 2, 4, 8, 16, 32, 64)) the n_probe settings to try.
+    Returns:
+        A list of dictionaries, one per n_probe setting, with the mean recall@topn and the mean and 95th percentile
+        query latency in milliseconds (plus one entry for exact search).
+    """
+    model = index.model
+    words = [w for w in dict.fromkeys(words) if w in model.vocab]
+
+    # Exact neighbours (timed word by word, like the card generator queries them).
+    exact = {}
+    latencies = []
+    for w in words:
+        start = time.perf_counter()
+        exact[w] = set(t[0] for t in model.most_similar(w, topn=topn))
+        latencies.append(time.perf_counter() - start)
+    results = [{'n_probe': 'exact', 'recall': 1.0, 'mean_ms': float(1000 * np.mean(latencies)),
+                'p95_ms': float(1000 * np.percentile(latencies, 95))}]
+
+    for n_probe in n_probes:
+        index.n_probe = n_probe
+        recalls = []
+        latencies = []
+        for w in words:
+            start = time.perf_counter()
+            approx = set(t[0] for t in index.most_similar(w, topn=topn))
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len(approx & exact[w]) / max(len(exact[w]), 1))
+        results.append({'n_probe': n_probe, 'recall': float(np.mean(recalls)), 'mean_ms': float(1000 * np.mean(latencies)),
+                        'p95_ms': float(1000 * np.percentile(latencies, 95))})
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure recall and latency of the approximate collocation search.')
+    parser.add_argument('embeddings', help='binary word2vec file or directory converted by embeddings.py')
+    parser.add_argument('--index', default=None, help='saved IVF index (.npz); built and saved here if missing')
+    parser.add_argument('--n-lists', type=int, default=None, help='number of clusters when building the index')
+    parser.add_argument('--topn', type=int, default=10, help='number of neighbours to compare')
+    parser.add_argument('--json', default=None, help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    model = emb.load_model(args.embeddings, use_neighbour_table=False)
+
+    if args.index is not None and os.path.exists(args.index):
+        index = ann.IVFIndex.load(args.index, model)
+    else:
+        start = time.perf_counter()
+        index = ann.IVFIndex.build(model, n_lists=args.n_lists)
+        print('Built index with', len(index.centroids), 'clusters in', round(time.perf_counter() - start, 1), 's')
+        if args.index is not None:
+            index.save(args.index)
+
+    # Benchmark on the main words of the transcribed Taboo cards.
+    words = list(gspd.get_card_dicts().keys())
+    results = recall_benchmark(index, words, topn=args.topn)
+
+    print('n_probe    recall@%-4d mean ms    p95 ms' % args.topn)
+    for r in results:
+        print('%-10s %-11.3f %-10.2f %.2f' % (r['n_probe'], r['recall'], r['mean_ms'], r['p95_ms']))
+
+    if args.json is not None:
+        with open(args.json, 'w', encoding='utf-8') as json_out:
+            json.dump(results, json_out, indent=2)
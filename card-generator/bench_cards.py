@@ -0,0 +1,237 @@
+import argparse
+import json
+import platform
+import time
+import zlib
+import numpy as np
+import cardgen as cg
+import embeddings as emb
+import gs_probdist as gspd
+import neighbours as nb
+import profiling as prof
+import semrel as sr
+
+
+# Vocabulary sizes benchmarked by default, from a small test vocabulary up to the size of the GoogleNews vectors.
+DEFAULT_SIZES = (10000, 100000, 1000000, 3000000)
+
+
+class StubRelationIndex:
+    """
+    A stand-in for WordNet with the same interface as semrel.RelationIndex, for benchmarking without the WordNet data.
+    Every word gets a deterministic, WordNet-shaped set of relations drawn from the vocabulary: a few synonyms, now and
+    then an antonym, one to three hypernyms and up to a dozen hyponyms.
+    """
+
+    def __init__(self, index2word, seed=0):
+        """
+        Args:
+            index2word: A list of the words to draw the related words from.
+            seed: (default 0) an integer; the same seed gives the same relations.
+        """
+        self.index2word = index2word
+        self.seed = seed
+
+    def lookup(self, word):
+        """
+        Returns the made-up semantic relations of the given word.
+
+        Arg:
+            word: a string like 'cat'
+        Returns:
+            A dictionary like the one semrel.make_semrel_dict() returns.
+        """
+        rng = np.random.default_rng([self.seed, zlib.crc32(word.encode('utf-8'))])
+        sizes = {
+            'semrel_synonym': rng.integers(0, 5),
+            'semrel_antonym': rng.integers(0, 2),
+            'semrel_hypernym': rng.integers(1, 4),
+            'semrel_hyponym': rng.integers(0, 13)
+        }
+        rows = rng.integers(0, len(self.index2word), size=sum(sizes.values())).tolist()
+        semrel_dict = {}
+        for label in sr.SEMRELS:
+            semrel_dict[label] = set(self.index2word[j] for j in rows[:sizes[label]] if self.index2word[j] != word)
+            rows = rows[sizes[label]:]
+        return semrel_dict
+
+
+class StubLemmatizer:
+    """
+    A stand-in for NLTK's WordNetLemmatizer: strips common plural endings when what is left is in the vocabulary.
+    """
+
+    def __init__(self, vocab):
+        """
+        Arg:
+            vocab: A collection of the words that count as lemmas.
+        """
+        self.vocab = vocab
+
+    def lemmatize(self, word):
+        for suffix, replacement in (('ies', 'y'), ('es', ''), ('s', '')):
+            if word.endswith(suffix) and word[:-len(suffix)] + replacement in self.vocab:
+                return word[:-len(suffix)] + replacement
+        return word
+
+
+def install_wordnet_stub(gensim_model, seed=0):
+    """
+    Makes semrel answer from a StubRelationIndex and lemmatise with a StubLemmatizer instead of using WordNet.
+
+    Args:
+        gensim_model: The (synthetic) embeddings whose vocabulary the stub draws from.
+        seed: (default 0) an integer.
+    """
+    sr.set_relation_index(StubRelationIndex(gensim_model.index2word, seed))
+    sr.set_lemmatizer(StubLemmatizer(gensim_model.vocab))
+
+
+def percentiles(latencies):
+    """
+    Summarises a list of latencies.
+
+    Arg:
+        latencies: A list of durations in seconds.
+    Returns:
+        A dictionary with the count and the mean, median, 95th and 99th percentile and maximum in milliseconds.
+    """
+    ms = 1000 * np.asarray(latencies)
+    return {'n': len(ms), 'mean_ms': float(ms.mean()), 'p50_ms': float(np.percentile(ms, 50)),
+            'p95_ms': float(np.percentile(ms, 95)), 'p99_ms': float(np.percentile(ms, 99)), 'max_ms': float(ms.max())}
+
+
+def time_each(func, items):
+    """
+    Calls func on each item and returns the durations in seconds.
+    """
+    durations = []
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def benchmark(mws, prob_dist_dict, n_words, dim=100, seed=0):
+    """
+    Benchmarks the stages of card generation on synthetic embeddings of the given size, with the WordNet stub.
+    Every stage starts with empty WordNet caches.
+
+    Args:
+        mws: A list of strings, the main words (they are put into the vocabulary).
+        prob_dist_dict: a dictionary with semantic relation labels as keys and their probability as values.
+        n_words: An integer, the vocabulary size.
+        dim: (default 100) the number of dimensions.
+        seed: (default 0) an integer, the seed of the embeddings, the stub and the cards.
+    Returns:
+        A dictionary with the setup time, the latency percentiles of each stage (semantic relations, collocations
+        and whole cards, one main word at a time, and the batched neighbour search) and the cards per second when
+        generating one card at a time and when generating the whole list as one batch.
+    """
+    start = time.perf_counter()
+    model = emb.synthetic_embeddings(n_words, dim, words=mws, seed=seed)
+    install_wordnet_stub(model, seed)
+    setup_s = time.perf_counter() - start
+
+    stages = {}
+
+    sr.clear_caches()
+    stages['semrel'] = percentiles(time_each(sr.make_semrel_dict, mws))
+
+    def collocations(mw):
+        try:
+            sr.get_collocations(mw, {mw}, model, num_collocates=3)
+        except sr.NotEnoughCollocates:
+            pass
+    stages['collocations'] = percentiles(time_each(collocations, mws))
+
+    sr.clear_caches()
+    card_times = time_each(lambda mw: cg.card_generator(mw, prob_dist_dict, model, rng=cg.card_rng(mw, seed)), mws)
+    stages['card'] = percentiles(card_times)
+
+    start = time.perf_counter()
+    nb.most_similar_batch(mws, model, topn=50)
+    stages['neighbours_batch'] = percentiles([time.perf_counter() - start])
+
+    sr.clear_caches()
+    start = time.perf_counter()
+    cg.card_generator_batch(mws, prob_dist_dict, model, deck_seed=seed)
+    batch_s = time.perf_counter() - start
+
+    return {
+        'vocab_size': n_words,
+        'dim': dim,
+        'setup_s': setup_s,
+        'stages': stages,
+        'cards_per_sec': len(mws) / sum(card_times),
+        'batch_cards_per_sec': len(mws) / batch_s
+    }
+
+
+def compare(old_results, new_results):
+    """
+    Prints how the results of two runs differ, for the vocabulary sizes they have in common.
+
+    Args:
+        old_results: The 'results' list of an earlier run.
+        new_results: The 'results' list of this run.
+    """
+    old_by_size = {r['vocab_size']: r for r in old_results}
+    for new in new_results:
+        old = old_by_size.get(new['vocab_size'])
+        if old is None:
+            continue
+        print('%d words: cards/sec %.1f -> %.1f (x%.2f)' % (new['vocab_size'], old['cards_per_sec'], new['cards_per_sec'],
+                                                           new['cards_per_sec'] / old['cards_per_sec']))
+        for stage, stats in new['stages'].items():
+            if stage in old['stages']:
+                print('    %-18s p95 %8.2f -> %8.2f ms' % (stage, old['stages'][stage]['p95_ms'], stats['p95_ms']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark card generation on synthetic embeddings and a WordNet stub.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='vocabulary sizes to test')
+    parser.add_argument('--dim', type=int, default=100, help='number of dimensions of the synthetic embeddings')
+    parser.add_argument('--words', type=int, default=None, help='only use the first N main words of taboo_cards.txt')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the fixtures and the cards')
+    parser.add_argument('--json', default=None, help='also write the results to this JSON file')
+    parser.add_argument('--compare', default=None, help='JSON file of an earlier run to compare with')
+    parser.add_argument('--profile', default=None,
+                        help='also profile the runs and write the stage timings, counters and traces to this JSON file')
+    args = parser.parse_args()
+
+    # Profiling adds a little overhead to every stage, so the timings of a profiled run are not quite comparable.
+    if args.profile is not None:
+        prof.enable()
+
+    # The workload: the main words of the transcribed Taboo cards, and the gold-standard label distribution.
+    mws = list(gspd.get_card_dicts().keys())[:args.words]
+    prob_dist = cg.get_gold_probdist()
+
+    results = []
+    for n_words in args.sizes:
+        r = benchmark(mws, prob_dist, n_words, args.dim, args.seed)
+        results.append(r)
+        print('%8d words  %7.1f cards/sec  %7.1f cards/sec batched  (setup %.1f s)' %
+              (n_words, r['cards_per_sec'], r['batch_cards_per_sec'], r['setup_s']))
+        for stage, stats in r['stages'].items():
+            print('    %-18s p50 %8.2f ms   p95 %8.2f ms   p99 %8.2f ms' %
+                  (stage, stats['p50_ms'], stats['p95_ms'], stats['p99_ms']))
+
+    report = {
+        'config': {'dim': args.dim, 'seed': args.seed, 'main_words': len(mws), 'python': platform.python_version(),
+                   'numpy': np.__version__, 'machine': platform.machine(), 'time': time.strftime('%Y-%m-%d %H:%M:%S')},
+        'results': results
+    }
+
+    if args.compare is not None:
+        with open(args.compare, encoding='utf-8') as old_in:
+            compare(json.load(old_in)['results'], results)
+
+    if args.json is not None:
+        with open(args.json, 'w', encoding='utf-8') as json_out:
+            json.dump(report, json_out, indent=2)
+
+    if args.profile is not None:
+        prof.export_json(args.profile)
@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import numpy as np
+
+
+# Modules that are slow to import and that the card generator should only load when they are really needed.
+HEAVY_MODULES = ('pandas', 'nltk', 'gensim', 'matplotlib', 'torch', 'scipy', 'sklearn')
+
+# One line of `python -X importtime` output: "import time: <self us> | <cumulative us> | <indentation><module>".
+IMPORTTIME_RE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def parse_importtime(stderr):
+    """
+    Parses the report printed by `python -X importtime`.
+
+    Arg:
+        stderr: A string, the standard error output of the Python process.
+    Returns:
+        A list of (module, nesting level, self microseconds, cumulative microseconds) tuples, in the order printed
+        (each module after the modules it imported).
+    """
+    entries = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append((module, (len(indent) - 1) // 2, int(self_us), int(cumulative_us)))
+    return entries
+
+
+def time_import(module, runs=5, cwd=None):
+    """
+    Measures how long importing a module takes in a fresh Python process, using `python -X importtime`.
+
+    Args:
+        module: A string, the name of the module to import.
+        runs: (default 5) the number of fresh processes to measure; the median is reported.
+        cwd: (optional) the directory to run Python in. Defaults to the directory of this script.
+    Returns:
+        A dictionary with the median total import time in milliseconds, the time of each run, the heavy modules that
+        got imported, and the ten modules that took longest themselves and their packages (from the median run).
+    """
+    if cwd is None:
+        cwd = os.path.dirname(os.path.abspath(__file__))
+
+    totals = []
+    reports = []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], cwd=cwd,
+                              stderr=subprocess.PIPE, universal_newlines=True)
+        if proc.returncode != 0:
+            raise RuntimeError('importing ' + module + ' failed:\n' + proc.stderr)
+        entries = parse_importtime(proc.stderr)
+
+        # Everything imported because of the module is nested under it (the interpreter's own start-up is not).
+        total_us = sum(cumulative for name, level, self_us, cumulative in entries if level == 0 and name == module)
+        totals.append(total_us / 1000)
+        reports.append(entries)
+
+    median_run = int(np.argsort(totals)[len(totals) // 2])
+    entries = reports[median_run]
+
+    # Keep only the module and what it imported: the entries after the previous top-level one, up to the module itself.
+    end = max(i for i, (name, level, s, c) in enumerate(entries) if level == 0 and name == module)
+    start = max([i + 1 for i, (name, level, s, c) in enumerate(entries[:end]) if level == 0] + [0])
+    entries = entries[start:end + 1]
+
+    packages = {}
+    for name, level, self_us, cumulative in entries:
+        root = name.split('.')[0]
+        packages[root] = packages.get(root, 0) + self_us
+
+    return {
+        'module': module,
+        'median_ms': float(np.median(totals)),
+        'runs_ms': totals,
+        'heavy_modules': sorted(set(name.split('.')[0] for name, level, s, c in entries) & set(HEAVY_MODULES)),
+        'slowest_modules': [{'module': name, 'self_ms': self_us / 1000}
+                            for name, level, self_us, c in sorted(entries, key=lambda e: -e[2])[:10]],
+        'slowest_packages': [{'package': root, 'self_ms': us / 1000}
+                             for root, us in sorted(packages.items(), key=lambda item: -item[1])[:10]]
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the import time of the card generator modules.')
+    parser.add_argument('modules', nargs='*', default=['cardgen', 'deck'], help='modules to import (default: cardgen deck)')
+    parser.add_argument('--runs', type=int, default=5, help='number of fresh processes per module')
+    parser.add_argument('--json', default=None, help='also write the results to this JSON file')
+    parser.add_argument('--budget-ms', type=float, default=None, help='exit with status 1 if a median exceeds this')
+    args = parser.parse_args()
+
+    results = [time_import(module, args.runs) for module in args.modules]
+
+    for r in results:
+        print('%-12s median %7.1f ms   heavy modules: %s' % (r['module'], r['median_ms'],
+                                                             ', '.join(r['heavy_modules']) or 'none'))
+        for p in r['slowest_packages'][:5]:
+            print('    %-20s %7.1f ms' % (p['package'], p['self_ms']))
+
+    if args.json is not None:
+        with open(args.json, 'w', encoding='utf-8') as json_out:
+            json.dump(results, json_out, indent=2)
+
+    if args.budget_ms is not None and any(r['median_ms'] > args.budget_ms for r in results):
+        sys.exit(1)
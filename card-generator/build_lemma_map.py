@@ -0,0 +1,57 @@
+import argparse
+import numpy as np
+import embeddings as emb
+import neighbours as nb
+import semrel as sr
+
+
+def make_lemma_map(gensim_model):
+    """
+    Lemmatises every vocabulary entry of the given embeddings once (the way get_collocations() lemmatises its
+    candidates) and numbers the lemmas as described in embeddings.LemmaMap.
+
+    Arg:
+        gensim_model: The pre-trained word embeddings (a gensim model or an embeddings.Embeddings object).
+    Returns:
+        An embeddings.LemmaMap object. For a gensim model, assign it to model.lemma_map to have get_collocations() use it.
+    """
+    lemmatizer = sr.get_lemmatizer()
+    index2word = gensim_model.index2word
+    vocab = gensim_model.vocab
+
+    lemma_ids = np.empty(len(index2word), dtype=np.int32)
+    extra_ids = {}
+    for row, word in enumerate(index2word):
+        lemma = lemmatizer.lemmatize(word)
+        if lemma == word:
+            lemma_ids[row] = row
+        elif lemma in vocab:
+            lemma_ids[row] = nb.word_index(gensim_model, lemma)
+        else:
+            lemma_ids[row] = extra_ids.setdefault(lemma, len(index2word) + len(extra_ids))
+
+    return emb.LemmaMap(lemma_ids, index2word, list(extra_ids))
+
+
+def build_lemma_map(emb_dir):
+    """
+    Builds the lemma map of a converted embeddings directory and saves it there, so that embeddings.load_model() loads
+    it together with the model.
+
+    Arg:
+        emb_dir: Path to a directory converted by embeddings.py (or pruned by prune_vocab.py).
+    Returns:
+        A tuple (number of words, number of distinct lemmas).
+    """
+    lemma_map = make_lemma_map(emb.load_model(emb_dir, use_neighbour_table=False))
+    emb.save_lemma_map(emb_dir, lemma_map.lemma_ids, lemma_map.extra_lemmas)
+    return len(lemma_map), len(np.unique(lemma_map.lemma_ids))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute the WordNet lemma of every vocabulary entry.')
+    parser.add_argument('emb_dir', help='directory converted by embeddings.py (or pruned by prune_vocab.py)')
+    args = parser.parse_args()
+
+    n_words, n_lemmas = build_lemma_map(args.emb_dir)
+    print('Stored the lemmas of %d words (%d distinct) in %s' % (n_words, n_lemmas, args.emb_dir))
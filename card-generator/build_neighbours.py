@@ -0,0 +1,89 @@
+import argparse
+import multiprocessing as mp
+import os
+import numpy as np
+import embeddings as emb
+import neighbours as nb
+
+
+# Per-worker state, set up once by _init_worker() so that each task only has to pass a row range.
+_vectors = None
+_nbr_idx = None
+_nbr_sim = None
+
+
+def _init_worker(emb_dir, idx_file, sim_file):
+    """
+    Opens the (shared, memory-mapped) vectors and output tables in a worker process.
+    """
+    global _vectors, _nbr_idx, _nbr_sim
+    _vectors = emb.load_embeddings(emb_dir).vectors_norm
+    _nbr_idx = np.load(idx_file, mmap_mode='r+')
+    _nbr_sim = np.load(sim_file, mmap_mode='r+')
+
+
+def _fill_rows(row_range):
+    """
+    Computes the neighbours of the words in rows [start, end) and writes them into the output tables.
+    """
+    start, end = row_range
+    k = _nbr_idx.shape[1]
+    queries = np.asarray(_vectors[start:end], dtype=np.float32)
+
+    # Ask for one extra neighbour per word and then drop the word itself (it is normally, but not always, the first).
+    idx, sim = nb.top_k_rows(queries, _vectors, k + 1, max_block_elems=2**23)
+    is_self = idx == np.arange(start, end)[:, np.newaxis]
+    keep = np.argsort(is_self, axis=1, kind='stable')[:, :k]
+
+    _nbr_idx[start:end] = np.take_along_axis(idx, keep, axis=1)
+    _nbr_sim[start:end] = np.take_along_axis(sim, keep, axis=1)
+    _nbr_idx.flush()
+    _nbr_sim.flush()
+    return end - start
+
+
+def build_neighbour_table(emb_dir, k=100, n_jobs=None, chunk_rows=1024):
+    """
+    Precomputes the k most similar words of every word in a converted embeddings directory and saves them there as
+    memory-mappable tables (int32 rows and float16 similarities), which embeddings.load_model() then uses instead of
+    the vectors. The work is split into chunks of rows that are spread over n_jobs processes, which all share the
+    memory-mapped vectors.
+
+    Args:
+        emb_dir: Path to a directory converted by embeddings.py (ideally pruned with prune_vocab.py first).
+        k: (default 100) the number of neighbours to store per word.
+        n_jobs: (optional) the number of worker processes. Defaults to the number of CPU cores.
+        chunk_rows: (default 1024) the number of words per task.
+    Returns:
+        The number of words processed.
+    """
+    n_words = len(emb.load_embeddings(emb_dir))
+    k = min(k, n_words - 1)
+
+    # Write to temporary files and only move them into place once complete, so that an interrupted build never leaves
+    # a half-filled table behind for load_model() to pick up.
+    idx_file = os.path.join(emb_dir, 'tmp_' + emb.NEIGHBOUR_INDEX_FILE)
+    sim_file = os.path.join(emb_dir, 'tmp_' + emb.NEIGHBOUR_SIM_FILE)
+    np.lib.format.open_memmap(idx_file, mode='w+', dtype=np.int32, shape=(n_words, k)).flush()
+    np.lib.format.open_memmap(sim_file, mode='w+', dtype=np.float16, shape=(n_words, k)).flush()
+
+    chunks = [(start, min(start + chunk_rows, n_words)) for start in range(0, n_words, chunk_rows)]
+    done = 0
+    with mp.Pool(n_jobs, initializer=_init_worker, initargs=(emb_dir, idx_file, sim_file)) as pool:
+        for n in pool.imap_unordered(_fill_rows, chunks):
+            done += n
+
+    os.replace(idx_file, os.path.join(emb_dir, emb.NEIGHBOUR_INDEX_FILE))
+    os.replace(sim_file, os.path.join(emb_dir, emb.NEIGHBOUR_SIM_FILE))
+    return done
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute the most similar words of every vocabulary entry.')
+    parser.add_argument('emb_dir', help='directory converted by embeddings.py (or pruned by prune_vocab.py)')
+    parser.add_argument('-k', type=int, default=100, help='number of neighbours to store per word')
+    parser.add_argument('--jobs', type=int, default=None, help='number of worker processes (default: all cores)')
+    args = parser.parse_args()
+
+    n_words = build_neighbour_table(args.emb_dir, args.k, args.jobs)
+    print('Stored neighbours for', n_words, 'words in', args.emb_dir)
@@ -0,0 +1,50 @@
+import argparse
+import os
+import sqlite3
+import semrel as sr
+
+
+def build_relation_index(filename=sr.RELATION_INDEX_FILE, words=None):
+    """
+    Precomputes the semantic relations (the output of semrel.make_semrel_dict() ) of every WordNet lemma and stores
+    them in an SQLite file that semrel.load_relation_index() can load.
+
+    Args:
+        filename: (default 'wordnet-relations.sqlite') path of the file to write (replaced if it exists).
+        words: (optional) an iterable of the words to index. Defaults to all lemma names in WordNet.
+    Returns:
+        The number of words indexed.
+    """
+    # Make sure the relations are computed from WordNet itself, not read from an index loaded earlier.
+    sr.set_relation_index(None)
+
+    if words is None:
+        words = sorted(sr.wordnet().all_lemma_names())
+
+    # Write to a temporary file first, so that a running card generator never sees a half-written index.
+    tmp_filename = filename + '.tmp'
+    if os.path.exists(tmp_filename):
+        os.remove(tmp_filename)
+
+    conn = sqlite3.connect(tmp_filename)
+    conn.execute('CREATE TABLE semrels (word TEXT PRIMARY KEY, synonym TEXT, antonym TEXT, hypernym TEXT, hyponym TEXT)')
+
+    # Each relation is stored as a tab-separated, sorted string of words (WordNet lemma names contain no tabs).
+    rows = ((word, *('\t'.join(sorted(semrel_dict[label])) for label in sr.SEMRELS))
+            for word, semrel_dict in ((word, sr.make_semrel_dict(word)) for word in words))
+    conn.executemany('INSERT INTO semrels VALUES (?, ?, ?, ?, ?)', rows)
+    conn.commit()
+    n_words = conn.execute('SELECT COUNT(*) FROM semrels').fetchone()[0]
+    conn.close()
+
+    os.replace(tmp_filename, filename)
+    return n_words
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute the WordNet relations of every lemma for fast lookup.')
+    parser.add_argument('filename', nargs='?', default=sr.RELATION_INDEX_FILE, help='SQLite file to write')
+    args = parser.parse_args()
+
+    n_words = build_relation_index(args.filename)
+    print('Indexed the relations of', n_words, 'words in', args.filename)
@@ -0,0 +1,316 @@
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+import cardgen as cg
+import embeddings as emb
+import gs_probdist as gspd
+import neighbours as nb
+import profiling as prof
+
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class _Request:
+    # One pending card request: what to generate, when it arrived, and the future to put the card into.
+    __slots__ = ('mw', 'seed', 'arrived', 'future')
+
+    def __init__(self, mw, seed, future):
+        self.mw = mw
+        self.seed = seed
+        self.arrived = time.perf_counter()
+        self.future = future
+
+
+class CardService:
+    """
+    Serves Taboo cards over HTTP/JSON from a CardEngine that stays loaded. Requests that arrive within max_wait_ms of
+    each other are collected into one batch, whose neighbours are computed in a single pass over the embeddings
+    (neighbours.most_similar_batch() ); the rest of each card (WordNet lookups, filtering, sampling) is then made in a
+    thread pool, so the event loop keeps accepting requests meanwhile.
+
+    Endpoints:
+        GET  /card?mw=<word>[&seed=<int>]   one card: {"mw": ..., "tws": [...]} (404 if mw isn't in the vocabulary;
+                                            tws has fewer than five words if too few were found)
+        POST /cards  {"mws": [...], "seed": <int, optional>}   several cards: {"cards": {mw: [...] or null}} (null for
+                                            main words that aren't in the vocabulary)
+        GET  /stats                         latency histograms per stage and the batch sizes
+        GET  /profile[?traces=0]            the profiling report (see profiling.report() ), when profiling is enabled
+        GET  /health                        {"status": "ok"}
+    """
+
+    def __init__(self, engine, max_batch=64, max_wait_ms=5, n_threads=8, num_neighbours=50):
+        """
+        Args:
+            engine: A cardgen.CardEngine.
+            max_batch: (default 64) the largest number of requests handled as one batch.
+            max_wait_ms: (default 5) how long to wait for more requests after the first one of a batch arrived.
+            n_threads: (default 8) the number of threads making cards.
+            num_neighbours: (default 50) how many similar words to precompute per main word.
+        """
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.num_neighbours = num_neighbours
+        self.executor = ThreadPoolExecutor(n_threads)
+        self.histograms = {stage: prof.Histogram() for stage in ('queue', 'neighbours', 'card', 'total')}
+        self.batch_sizes = prof.Histogram(bounds=(1, 2, 4, 8, 16, 32, 64, 128, 256), unit='requests')
+        self._queue = None
+        self._batcher = None
+        self._running = set()
+
+    async def start(self):
+        """
+        Starts collecting requests into batches (called by serve(); call it yourself when using generate() directly).
+        """
+        if self._batcher is None:
+            self._queue = asyncio.Queue()
+            self._batcher = asyncio.get_running_loop().create_task(self._batch_loop())
+
+    async def stop(self):
+        """
+        Stops the batching loop and the thread pool.
+        """
+        if self._batcher is not None:
+            self._batcher.cancel()
+            self._batcher = None
+        self.executor.shutdown(wait=False)
+
+    async def generate(self, mw, seed=None):
+        """
+        Generates a card, batched together with the other requests arriving at about the same time.
+
+        Args:
+            mw: A string, the main word.
+            seed: (optional) an integer deck seed (see cardgen.card_rng() ). Defaults to the engine's deck_seed.
+        Returns:
+            The list of five taboo words, or False if the main word isn't in the vocabulary.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Request(mw, seed, future))
+        return await future
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Run the batch in the background, so the next one can be collected meanwhile.
+            task = loop.create_task(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        for request in batch:
+            self.histograms['queue'].record(1000 * (start - request.arrived))
+        self.batch_sizes.record(len(batch))
+
+        try:
+            similar = await loop.run_in_executor(self.executor, self._neighbours, batch)
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        self.histograms['neighbours'].record(1000 * (time.perf_counter() - start))
+
+        cards = await asyncio.gather(*(loop.run_in_executor(self.executor, self._make_card, r.mw, r.seed, similar.get(r.mw))
+                                       for r in batch), return_exceptions=True)
+
+        end = time.perf_counter()
+        for request, result in zip(batch, cards):
+            self.histograms['total'].record(1000 * (end - request.arrived))
+            if request.future.done():
+                continue
+            if isinstance(result, Exception):
+                request.future.set_exception(result)
+            else:
+                tws, card_ms = result
+                self.histograms['card'].record(card_ms)
+                request.future.set_result(tws)
+
+    def _neighbours(self, batch):
+        # Runs in the thread pool: the neighbours of the batch's main words, except those the card store will serve.
+        seeds = [r.seed if r.seed is not None else self.engine.deck_seed for r in batch]
+        by_seed = {}
+        if self.engine.store is not None:
+            for r, seed in zip(batch, seeds):
+                if seed is not None:
+                    by_seed.setdefault(seed, []).append(r.mw)
+        stored = {(mw, seed) for seed, mws in by_seed.items() for mw in self.engine.store.stored(mws, seed)}
+
+        todo = list({r.mw for r, seed in zip(batch, seeds) if (r.mw, seed) not in stored})
+        return nb.most_similar_batch(todo, self.engine.model, self.num_neighbours) if todo else {}
+
+    def _make_card(self, mw, seed, neighbours):
+        # Runs in the thread pool; the timing is recorded back in the event loop, which owns the histograms.
+        start = time.perf_counter()
+        card = self.engine.generate(mw, neighbours=neighbours, deck_seed=seed)
+        return (card[mw] if card else False), 1000 * (time.perf_counter() - start)
+
+    def stats(self):
+        """
+        Returns the service's statistics.
+
+        Returns:
+            A dictionary with the latency histogram of each stage (time spent queueing, computing the batch's
+            neighbours, making one card, and in total), the batch sizes, and the card store's statistics if there is one.
+        """
+        stats = {stage: histogram.stats() for stage, histogram in self.histograms.items()}
+        stats['batch_size'] = self.batch_sizes.stats()
+        if self.engine.store is not None:
+            stats['store'] = self.engine.store.stats()
+        return stats
+
+    async def handle(self, method, target, body):
+        """
+        Answers one HTTP request.
+
+        Args:
+            method: A string, the HTTP method.
+            target: A string, the request target (path and query string).
+            body: The request body as bytes.
+        Returns:
+            A tuple (status code, JSON-serialisable payload).
+        """
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        try:
+            if url.path == '/card':
+                if method != 'GET':
+                    return 405, {'error': 'use GET'}
+                if 'mw' not in query:
+                    return 400, {'error': 'missing parameter: mw'}
+                seed = int(query['seed']) if 'seed' in query else None
+                tws = await self.generate(query['mw'], seed)
+                # An empty list is still a card (of a word with too few related words); False means out of vocabulary.
+                if tws is False:
+                    return 404, {'mw': query['mw'], 'error': 'not in vocabulary'}
+                return 200, {'mw': query['mw'], 'tws': tws}
+
+            if url.path == '/cards':
+                if method != 'POST':
+                    return 405, {'error': 'use POST'}
+                request = json.loads(body.decode('utf-8'))
+                mws = request['mws']
+                seed = request.get('seed')
+                if not isinstance(mws, list) or not all(isinstance(mw, str) for mw in mws):
+                    return 400, {'error': 'mws must be a list of strings'}
+                if seed is not None and not isinstance(seed, int):
+                    return 400, {'error': 'seed must be an integer'}
+                cards = await asyncio.gather(*(self.generate(mw, seed) for mw in mws))
+                return 200, {'cards': {mw: None if tws is False else tws for mw, tws in zip(mws, cards)}}
+
+            if url.path == '/stats':
+                return 200, self.stats()
+
+            if url.path == '/profile':
+                if not prof.is_enabled():
+                    return 404, {'error': 'profiling is disabled (start the service with --profile)'}
+                return 200, prof.report(traces=query.get('traces', '1') != '0')
+
+            if url.path == '/health':
+                return 200, {'status': 'ok'}
+
+            return 404, {'error': 'unknown path: ' + url.path}
+
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {'error': 'bad request: ' + repr(e)}
+        except Exception as e:
+            return 500, {'error': repr(e)}
+
+    async def _handle_connection(self, reader, writer):
+        # A minimal HTTP/1.1 server: one request after the other per connection, with keep-alive.
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                parts = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                if len(parts) != 3:
+                    status, payload, keep_alive = 400, {'error': 'malformed request line'}, False
+                else:
+                    method, target, version = parts
+                    body = await reader.readexactly(int(headers.get('content-length', 0)))
+                    status, payload = await self.handle(method, target, body)
+                    keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+                data = json.dumps(payload).encode('utf-8')
+                writer.write(('HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: %s\r\n\r\n'
+                              % (status, REASONS[status], len(data), 'keep-alive' if keep_alive else 'close')).encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        """
+        Serves cards over HTTP until cancelled.
+
+        Args:
+            host: (default '127.0.0.1') the address to listen on.
+            port: (default 8080) the port to listen on.
+        """
+        await self.start()
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve Taboo cards over HTTP/JSON.')
+    parser.add_argument('--emb-dir', default='GoogleNews-vectors-negative300',
+                        help='converted embeddings directory (or binary word2vec file)')
+    parser.add_argument('--synthetic', type=int, default=None, metavar='N',
+                        help='use random embeddings with N words (plus the main words of taboo_cards.txt) instead')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on')
+    parser.add_argument('--seed', type=int, default=None, help='default deck seed, for reproducible cards')
+    parser.add_argument('--store', default=None, help='SQLite card store for seeded cards')
+    parser.add_argument('--threads', type=int, default=8, help='number of threads making cards')
+    parser.add_argument('--max-batch', type=int, default=64, help='largest number of requests per batch')
+    parser.add_argument('--max-wait-ms', type=float, default=5, help='how long to wait for more requests per batch')
+    parser.add_argument('--profile', action='store_true', help='record stage timings and counters, served at /profile')
+    parser.add_argument('--profile-memory', action='store_true', help='also record the peak memory use per card')
+    args = parser.parse_args()
+
+    if args.profile or args.profile_memory:
+        prof.enable(memory=args.profile_memory)
+
+    if args.synthetic is not None:
+        model = emb.synthetic_embeddings(args.synthetic, words=gspd.get_card_dicts().keys())
+    else:
+        model = emb.load_model(args.emb_dir)
+
+    engine = cg.CardEngine(model, deck_seed=args.seed, card_store_file=args.store)
+    service = CardService(engine, args.max_batch, args.max_wait_ms, args.threads)
+    print('Serving cards on http://%s:%d/card?mw=...' % (args.host, args.port))
+    asyncio.run(service.serve(args.host, args.port))
@@ -1,18 +1,75 @@
 import gs_probdist as gspd
 import semrel as sr
-import pandas as pd
+import neighbours as nb
+import embeddings as emb
+import cardstore as cs
+import profiling as prof
 import numpy as np
 import random as rd
+from collections import Counter
+import hashlib
+import os
 
 
-def select_five_categories(prob_dist_dict):
+def make_rng(seed):
+    """
+    Turns a seed into a random number generator for the card functions.
+
+    Arg:
+        seed: None, an integer, or a numpy Generator.
+    Returns:
+        None (meaning: use the global numpy and random state, as before), or a numpy Generator.
+    """
+    if seed is None or isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(seed)
+
+
+def card_rng(mw, deck_seed):
+    """
+    Returns the random number generator for one card of a deck. It depends only on the main word and the deck's seed
+    (not on Python's string hashing or on what was generated before), so a card comes out the same no matter which
+    process generates it or when.
+
+    Args:
+        mw: A string, the main word of the card.
+        deck_seed: An integer, the seed of the whole deck.
+    Returns:
+        A numpy Generator.
+    """
+    digest = hashlib.sha256((str(deck_seed) + '\t' + mw).encode('utf-8')).digest()
+    return np.random.default_rng(int.from_bytes(digest[:16], 'little'))
+
+
+def sample_words(words, count, rng=None):
+    """
+    Randomly selects count different words out of a collection of words.
+
+    Args:
+        words: A collection of strings (e.g. a set).
+        count: An integer, the number of words to select.
+        rng: (optional) a numpy Generator. Without one, Python's global random state is used.
+    Returns:
+        A list of count strings.
+    """
+    if rng is None:
+        return rd.sample( tuple(words), count )
+
+    # Sort first: the iteration order of a set of strings changes from process to process.
+    words = sorted(words)
+    return [words[i] for i in rng.choice(len(words), count, replace=False)]
+
+
+@prof.timed()
+def select_five_categories(prob_dist_dict, rng=None):
     """
     Given a probability distribution of semantic relation labels, randomly returns a list of five of them, weighted
     by probability.
 
-    Arg:
+    Args:
         prob_dist_dict: a dictionary with semantic relation labels as keys and their probability as values
         (output of freq_dist_to_prob_dist() )
+        rng: (optional) a numpy Generator. Without one, numpy's global random state is used.
     Returns:
         A list containing five semantic relation labels (intended as the starting point for each card).
     """
@@ -20,8 +77,11 @@ def select_five_categories(prob_dist_dict):
     labels = list( prob_dist_dict.keys() )
     probs = list( prob_dist_dict.values() )
 
-    # Use numpy's .choice() to return a label based on the given weight.
-    return list( np.random.choice(labels, 5, p=probs) )
+    # Use numpy's .choice() to return a label based on the given weight. (Drawing positions rather than the labels
+    # themselves gives the same draws without turning the labels into a numpy array every time.)
+    if rng is None:
+        rng = np.random
+    return [labels[i] for i in rng.choice(len(labels), 5, p=probs)]
 
 
 def get_good_label_distrib(semrel_dict, semrel_counts):
@@ -57,7 +117,7 @@ def get_good_label_distrib(semrel_dict, semrel_counts):
                 semrel_counts[label] = srdict_counts[label]
 
     # Adjust the values in 'collocation' in the dictionary.
-    if 'collocation' in set(semrel_counts.keys()):
+    if 'collocation' in semrel_counts:
         semrel_counts['collocation'] += num_coll_to_add
     else:
         semrel_counts['collocation'] = num_coll_to_add
@@ -65,7 +125,7 @@ def get_good_label_distrib(semrel_dict, semrel_counts):
     return semrel_counts
 
 
-def card_generator(mw, prob_dist_dict, gensim_model):
+def card_generator(mw, prob_dist_dict, gensim_model, neighbours = None, rng = None, dedupe_lemmas = False):
     """
     Generates a Taboo card with one main word and five Taboo words.
 
@@ -74,6 +134,11 @@ def card_generator(mw, prob_dist_dict, gensim_model):
         prob_dist_dict: a dictionary with semantic relation labels as keys and their probability as values
            (output of freq_dist_to_prob_dist() )
         gensim_model: The pre-trained word embeddings.
+        neighbours: (optional) a precomputed list of (word, similarity) tuples for mw, most similar first.
+        rng: (optional) a seed or numpy Generator to draw the card with (see card_rng() ). Without one, the global
+           random state is used.
+        dedupe_lemmas: (default False) skip similar words whose lemma already came up when looking for collocates
+           (see semrel.get_collocations() ).
     Returns:
         A dictionary with main word as key and a list of five taboo words as values.
     """
@@ -83,15 +148,18 @@ def card_generator(mw, prob_dist_dict, gensim_model):
     if mw not in gensim_model.wv.vocab:
         return False
 
+    rng = make_rng(rng)
+
     # Generate five categories with the weighted probabilities based on their frequency in the gold standard data.
-    five_semrels_list = select_five_categories(prob_dist_dict)
-    five_semrels = pd.Series(five_semrels_list)
+    five_semrels_list = select_five_categories(prob_dist_dict, rng)
 
-    # Count the number of instances of each semrel category in that list.
-    semrels_counts = dict( five_semrels.value_counts() )
+    # Count the number of instances of each semrel category in that list (most frequent first, ties in order of
+    # appearance, as pandas' value_counts() orders them).
+    semrels_counts = dict( Counter(five_semrels_list).most_common() )
 
     # Generate the semantic relations dictionary.
-    srdict = sr.make_semrel_dict(mw)
+    with prof.stage('card.semrel'):
+        srdict = sr.make_semrel_dict(mw)
 
     # Rejig five_semrels_list, if need be, to one whose labels are compatible with the cardinality of the sets available
     # in srdict.
@@ -105,23 +173,80 @@ def card_generator(mw, prob_dist_dict, gensim_model):
     # randomly select however many out of it.
     for label, count in good_five_labels.items():
         if label != 'collocation':
-            tws.extend( rd.sample( tuple( srdict[label] ), count ) )
+            tws.extend( sample_words( srdict[label], count, rng ) )
 
     # Now, take the number of collocations needed and return the most similar words according to gensim, removing the
     # words that are forbidden (i.e. the main word and also the other words that are already in tws)
     forbidden_words = set(tws + [mw])
     num_coll = good_five_labels['collocation']
-    collocates = sr.get_collocations(mw, forbidden_words, gensim_model, num_collocates =  num_coll)
+    try:
+        with prof.stage('card.collocations'):
+            collocates = sr.get_collocations(mw, forbidden_words, gensim_model, num_collocates =  num_coll,
+                                             neighbours = neighbours, dedupe_lemmas = dedupe_lemmas)
+    except sr.NotEnoughCollocates as e:
+        # Rare words may not have enough usable neighbours; the card then gets however many were found.
+        prof.count('card.not_enough_collocates')
+        collocates = e.collocates
 
     # If there are more collocates than needed, randomly select num_coll of them and add to tws. Else just add list to tws.
     if len(collocates) > num_coll:
-        tws.extend( rd.sample( tuple(collocates), num_coll ) )
+        tws.extend( sample_words( collocates, num_coll, rng ) )
     else:
-        tws.extend(collocates)
+        tws.extend( sorted(collocates) if rng is not None else collocates )
 
     return {mw: tws}
 
 
+def card_generator_batch(mws, prob_dist_dict, gensim_model, num_neighbours = 50, deck_seed = None, store = None,
+                         dedupe_lemmas = False):
+    """
+    Generates Taboo cards for many main words at once. The most similar words for the whole batch are computed in
+    one blocked pass over the embedding matrix, and then each card is put together as in card_generator().
+
+    Args:
+        mws: An iterable of strings, the main words to generate cards for.
+        prob_dist_dict: a dictionary with semantic relation labels as keys and their probability as values
+           (output of freq_dist_to_prob_dist() )
+        gensim_model: The pre-trained word embeddings.
+        num_neighbours: (default 50) how many similar words to precompute per main word. Main words that need more
+           candidates than this fall back to querying the model themselves.
+        deck_seed: (optional) an integer. If given, each card is drawn with its own generator card_rng(mw, deck_seed),
+           so the cards don't depend on the order or the batches they were generated in.
+        store: (optional) a cardstore.CardStore. If given together with deck_seed, stored cards are taken from it and
+           only the missing ones are generated (and then stored).
+        dedupe_lemmas: (default False) skip similar words whose lemma already came up (see card_generator() ).
+    Returns:
+        A dictionary with the main words as keys and lists of five taboo words as values (or False for main words
+        that aren't in the word2vec vocab).
+    """
+    mws = list(mws)
+
+    # Unseeded cards are meant to differ from draw to draw, so only seeded ones go through the store.
+    use_store = store is not None and deck_seed is not None
+    cards = store.get_many(mws, deck_seed) if use_store else {}
+    todo = [mw for mw in mws if mw not in cards]
+    prof.count('card_store.hit', len(mws) - len(todo))
+
+    # Score all remaining main words against the vocabulary in one go.
+    with prof.stage('neighbours_batch'):
+        similar = nb.most_similar_batch(todo, gensim_model, topn=num_neighbours) if todo else {}
+
+    # Then run the WordNet and sampling stage word by word, handing over the precomputed neighbours.
+    new_cards = {}
+    for mw in todo:
+        rng = card_rng(mw, deck_seed) if deck_seed is not None else None
+        with prof.request('card', mw=mw):
+            card = card_generator(mw, prob_dist_dict, gensim_model, neighbours=similar.get(mw), rng=rng,
+                                  dedupe_lemmas=dedupe_lemmas)
+        new_cards[mw] = card[mw] if card else False
+
+    if use_store and new_cards:
+        store.put_many(new_cards, deck_seed)
+    cards.update(new_cards)
+
+    return {mw: cards[mw] for mw in mws}
+
+
 def pretty_print(card):
     """
     Pretty-prints an ASCII Taboo card to the screen.
@@ -169,12 +294,142 @@ def get_gold_probdist():
         A dictionary whose keys are the five semantic relations and whose values are their probabilities.
     """
 
-    # Read in the dataset as a pandas dataframe.
-    card_data_annot = gspd.read_in_categorised()
+    # The counts are compiled into 'gold-std-compiled.json' the first time and only recounted when the csv (or the
+    # card transcript) changes; see gs_probdist.load_gold_standard().
+    return gspd.load_gold_probdist()
+
+
+class CardEngine:
+    """
+    Holds everything card generation needs (the embeddings, the gold-standard probability distribution, the
+    lemmatiser and WordNet) in memory, so that the setup cost is paid once and each following card is quick to make.
+    """
+
+    def __init__(self, gensim_model=None, embeddings_file='GoogleNews-vectors-negative300.bin', prob_dist_dict=None,
+                 relation_index_file=sr.RELATION_INDEX_FILE, deck_seed=None, card_store_file=None,
+                 max_stored_cards=100000, dedupe_lemmas=False):
+        """
+        Args:
+            gensim_model: (optional) the pre-trained word embeddings, if they have already been loaded.
+            embeddings_file: (default 'GoogleNews-vectors-negative300.bin') the binary word2vec file or the directory
+               converted by embeddings.py to load the embeddings from when no gensim_model is given.
+            prob_dist_dict: (optional) a dictionary with semantic relation labels as keys and their probability as
+               values. Defaults to the gold-standard distribution (output of get_gold_probdist() ).
+            relation_index_file: (default 'wordnet-relations.sqlite') the WordNet relation index built by
+               build_relation_index.py. Used for the semantic relations if it exists.
+            deck_seed: (optional) an integer. If given, every card is drawn with card_rng(mw, deck_seed), so the same
+               main word always gives the same card.
+            card_store_file: (optional) an SQLite file to keep the seeded cards in (see cardstore.CardStore), so that
+               they are looked up rather than generated again, also by later runs.
+            max_stored_cards: (default 100000) the maximum number of cards kept in the card store.
+            dedupe_lemmas: (default False) skip similar words whose lemma already came up when looking for collocates
+               (see semrel.get_collocations() ).
+        """
+        if gensim_model is None:
+            gensim_model = emb.load_model(embeddings_file)
+        self.model = gensim_model
+        self.deck_seed = deck_seed
+        self.dedupe_lemmas = dedupe_lemmas
+
+        if prob_dist_dict is None:
+            prob_dist_dict = get_gold_probdist()
+        self.prob_dist = prob_dist_dict
+
+        self.relation_index = None
+        if relation_index_file is not None and os.path.exists(relation_index_file):
+            self.relation_index = sr.load_relation_index(relation_index_file)
+
+        # Load WordNet and the lemmatiser now rather than during the first card, unless the cards won't need them (the
+        # embeddings come with their lemmas and the relations are looked up in the index).
+        if getattr(self.model, 'lemma_map', None) is None or self.relation_index is None:
+            sr.get_lemmatizer()
+
+        # Stored cards are only valid for this distribution and these embeddings; the store only serves those.
+        self.store = None
+        if card_store_file is not None:
+            self.store = cs.CardStore(card_store_file, cs.probdist_hash(self.prob_dist), cs.model_hash(self.model),
+                                      max_entries=max_stored_cards, options='dedupe' if dedupe_lemmas else '')
+
+    @property
+    def lemmatizer(self):
+        # The shared WordNet lemmatiser (see semrel.get_lemmatizer() ), loaded on first use.
+        return sr.get_lemmatizer()
+
+    def generate(self, mw, rng=None, neighbours=None, deck_seed=None):
+        """
+        Generates a Taboo card with one main word and five Taboo words.
+
+        Args:
+            mw: A string, the main word to generate the Taboo words for.
+            rng: (optional) a seed or numpy Generator to draw the card with, overriding any deck seed.
+            neighbours: (optional) a precomputed list of (word, similarity) tuples for mw, most similar first.
+            deck_seed: (optional) an integer, overriding the engine's deck_seed for this card.
+        Returns:
+            A dictionary with main word as key and a list of five taboo words as values (or False, if the main word
+            isn't in the word2vec vocab).
+        """
+        if deck_seed is None:
+            deck_seed = self.deck_seed
+
+        with prof.request('card', mw=mw):
+            if rng is None and deck_seed is not None:
+                if self.store is not None:
+                    tws = self.store.get(mw, deck_seed)
+                    if tws is not None:
+                        prof.count('card_store.hit')
+                        # An empty list is a card without taboo words; False a main word outside the vocabulary.
+                        return {mw: tws} if tws is not False else False
+
+                card = card_generator(mw, self.prob_dist, self.model, neighbours=neighbours, rng=card_rng(mw, deck_seed),
+                                      dedupe_lemmas=self.dedupe_lemmas)
+                if self.store is not None:
+                    self.store.put(mw, deck_seed, card[mw] if card else False)
+                return card
+
+            return card_generator(mw, self.prob_dist, self.model, neighbours=neighbours, rng=rng,
+                                  dedupe_lemmas=self.dedupe_lemmas)
+
+    def generate_batch(self, mws):
+        """
+        Generates Taboo cards for many main words at once (see card_generator_batch() ).
+
+        Arg:
+            mws: An iterable of strings, the main words to generate cards for.
+        Returns:
+            A dictionary with the main words as keys and lists of five taboo words as values (or False).
+        """
+        return card_generator_batch(mws, self.prob_dist, self.model, deck_seed=self.deck_seed, store=self.store,
+                                    dedupe_lemmas=self.dedupe_lemmas)
+
+    def draw(self, mw):
+        """
+        Generates a Taboo card with one main word and five Taboo words and pretty-prints it.
+
+        Arg:
+            mw: A string, the main word to generate the Taboo words for.
+        Returns:
+            Nothing. Prints a card.
+        """
+        pretty_print(self.generate(mw))
+
+
+# The engine behind draw_card(), kept between calls so that repeated draws with the same model don't redo the setup.
+_engine = None
+
+
+def get_engine(gensim_model):
+    """
+    Returns a CardEngine for the given embeddings, reusing the previous one if it was built for the same model.
 
-    # Based on the frequencies of each category in the data, create probability distribution and return.
-    probdist_dict = gspd.freq_dist_to_prob_dist(card_data_annot)
-    return probdist_dict
+    Arg:
+        gensim_model: The pre-trained word embeddings.
+    Returns:
+        A CardEngine object.
+    """
+    global _engine
+    if _engine is None or _engine.model is not gensim_model:
+        _engine = CardEngine(gensim_model)
+    return _engine
 
 
 def draw_card(mw, gensim_model):
@@ -188,10 +443,7 @@ def draw_card(mw, gensim_model):
         Nothing. Prints a card.
     """
 
-    # Get the probability distribution of labels for each TW slot, based on the frequency of each semantic category
-    # in the gold-standard Taboo cards.
-    prob_dist_dict = get_gold_probdist()
-
-    # Use this probability, the main word, and the model to generate a card, and then pretty-print it.
-    c = card_generator(mw, prob_dist_dict, gensim_model)
-    pretty_print(c)
+    # The engine reads in the probability distribution of labels for each TW slot (based on the frequency of each
+    # semantic category in the gold-standard Taboo cards) once, and uses it with the main word and the model to
+    # generate a card, which is then pretty-printed.
+    get_engine(gensim_model).draw(mw)
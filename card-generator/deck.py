@@ -0,0 +1,110 @@
+import argparse
+import multiprocessing as mp
+import os
+from collections import deque
+import cardgen as cg
+import embeddings as emb
+import semrel as sr
+
+
+# The card engine of a worker process, set up once by _init_worker().
+_engine = None
+
+
+def _init_worker(emb_dir, prob_dist_dict, relation_index_file, deck_seed, card_store_file, dedupe_lemmas):
+    """
+    Sets up a worker process. The embeddings are memory-mapped, so all workers share one copy of them.
+    """
+    global _engine
+    _engine = cg.CardEngine(emb.load_model(emb_dir), prob_dist_dict=prob_dist_dict,
+                            relation_index_file=relation_index_file, deck_seed=deck_seed,
+                            card_store_file=card_store_file, dedupe_lemmas=dedupe_lemmas)
+
+
+def _make_cards(mws):
+    """
+    Generates the cards for a chunk of main words in a worker process.
+    """
+    cards = _engine.generate_batch(mws)
+    return [(mw, cards[mw]) for mw in mws]
+
+
+def _chunks(mws, chunk_size):
+    """
+    Splits an iterable of main words into lists of chunk_size words (without reading it all in first).
+    """
+    chunk = []
+    for mw in mws:
+        chunk.append(mw)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def build_deck(mws, n_workers=None, emb_dir='GoogleNews-vectors-negative300', prob_dist_dict=None,
+               relation_index_file=sr.RELATION_INDEX_FILE, chunk_size=32, deck_seed=None,
+               card_store_file=None, dedupe_lemmas=False):
+    """
+    Generates Taboo cards for a list of main words in parallel. The main words are handed out to a pool of worker
+    processes in chunks, and each worker generates its chunk with card_generator_batch(). All workers use the same
+    memory-mapped embeddings, so adding workers doesn't add copies of the embedding matrix.
+
+    Args:
+        mws: An iterable of strings, the main words to generate cards for.
+        n_workers: (optional) the number of worker processes. Defaults to the number of CPU cores.
+        emb_dir: (default 'GoogleNews-vectors-negative300') a directory converted by embeddings.py (or pruned by
+           prune_vocab.py, optionally with a neighbour table).
+        prob_dist_dict: (optional) a dictionary with semantic relation labels as keys and their probability as
+           values. Defaults to the gold-standard distribution (output of get_gold_probdist() ).
+        relation_index_file: (default 'wordnet-relations.sqlite') the WordNet relation index, used if it exists.
+        chunk_size: (default 32) the number of main words per task.
+        deck_seed: (optional) an integer. If given, each card is drawn with its own generator derived from its main
+           word and deck_seed, so the deck comes out identical for any number of workers.
+        card_store_file: (optional) an SQLite card store (see cardstore.py) shared by the workers. Cards of a seeded
+           deck that are already in it are not generated again.
+        dedupe_lemmas: (default False) skip similar words whose lemma already came up when looking for collocates.
+    Yields:
+        (main word, list of five taboo words) tuples in the order of mws, with False instead of the list for main
+        words that aren't in the vocabulary.
+    """
+    # Sharing the embeddings between processes only works for the memory-mapped format; a word2vec .bin file would be
+    # parsed into a private copy by every single worker.
+    if not os.path.isdir(emb_dir):
+        raise ValueError(emb_dir + ' is not a converted embeddings directory (see embeddings.py)')
+
+    # Read the gold standard once here rather than once per worker.
+    if prob_dist_dict is None:
+        prob_dist_dict = cg.get_gold_probdist()
+
+    # Pool.imap() would read all of mws and queue up every finished chunk if the caller falls behind, so only a few
+    # chunks per worker are handed out at a time; memory use then doesn't depend on the number of main words.
+    max_pending = 2 * (n_workers or os.cpu_count() or 1)
+
+    with mp.Pool(n_workers, initializer=_init_worker, initargs=(emb_dir, prob_dist_dict, relation_index_file, deck_seed,
+                                                                 card_store_file, dedupe_lemmas)) as pool:
+        pending = deque()
+        for chunk in _chunks(mws, chunk_size):
+            pending.append(pool.apply_async(_make_cards, (chunk,)))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate Taboo cards for a list of main words in parallel.')
+    parser.add_argument('words', help='file with one main word per line')
+    parser.add_argument('--emb-dir', default='GoogleNews-vectors-negative300', help='converted embeddings directory')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: all cores)')
+    parser.add_argument('--seed', type=int, default=None, help='deck seed, for reproducible cards')
+    parser.add_argument('--store', default=None, help='SQLite card store to reuse seeded cards from (and add them to)')
+    parser.add_argument('--dedupe-lemmas', action='store_true', help='skip inflected forms of collocates already seen')
+    args = parser.parse_args()
+
+    with open(args.words, encoding='utf-8') as words_in:
+        mws = (line.strip() for line in words_in if line.strip())
+        for mw, tws in build_deck(mws, args.workers, args.emb_dir, deck_seed=args.seed,
+                                   card_store_file=args.store, dedupe_lemmas=args.dedupe_lemmas):
+            print(mw + '\t' + (', '.join(tws) if tws else '(not in vocabulary)'))
@@ -0,0 +1,486 @@
+import argparse
+import json
+import os
+import numpy as np
+import neighbours as nb
+
+
+# Names of the files that make up a converted embeddings directory.
+VECTORS_FILE = 'vectors.npy'
+NORMS_FILE = 'norms.npy'
+VOCAB_FILE = 'vocab.txt'
+META_FILE = 'meta.json'
+NEIGHBOUR_INDEX_FILE = 'neighbours_idx.npy'
+NEIGHBOUR_SIM_FILE = 'neighbours_sim.npy'
+LEMMA_IDS_FILE = 'lemma_ids.npy'
+EXTRA_LEMMAS_FILE = 'extra_lemmas.txt'
+FORMAT_VERSION = 1
+
+
+class Embeddings:
+    """
+    Word embeddings stored in the converted format written by convert_word2vec(): a raw float32 matrix of unit-length
+    vectors that is memory-mapped read-only, plus the vocabulary in row order.
+
+    Only the parts of gensim's KeyedVectors interface that the card generator uses are provided (vocab, index2word,
+    vectors_norm, most_similar() and friends), so an Embeddings object can be passed wherever a gensim model is
+    expected. Since the matrix is memory-mapped, loading is nearly instant and several processes using the same
+    directory share one copy of the vectors in the page cache.
+    """
+
+    def __init__(self, vectors_norm, norms, index2word):
+        """
+        Args:
+            vectors_norm: A 2D numpy array (or memory map) of unit-length vectors, one row per word.
+            norms: A 1D numpy array containing the original length of each vector.
+            index2word: A list of the words in row order.
+        """
+        self.vectors_norm = vectors_norm
+        self.norms = norms
+        self.index2word = index2word
+        self.vocab = {word: i for i, word in enumerate(index2word)}
+        self.vector_size = vectors_norm.shape[1]
+        self.lemma_map = None
+
+    @property
+    def wv(self):
+        # gensim models expose their vectors as model.wv, and KeyedVectors return themselves here too.
+        return self
+
+    @property
+    def vectors(self):
+        # The original (unnormalised) vectors. This materialises the whole matrix, so avoid on big vocabularies.
+        return np.asarray(self.vectors_norm) * self.norms[:, np.newaxis]
+
+    def init_sims(self, replace=False):
+        # The stored vectors are already normalised.
+        pass
+
+    def __len__(self):
+        return len(self.index2word)
+
+    def __contains__(self, word):
+        return word in self.vocab
+
+    def get_vector(self, word):
+        """
+        Returns the original (unnormalised) vector of the given word.
+
+        Arg:
+            word: A string that is in the vocabulary.
+        Returns:
+            A 1D numpy array.
+        """
+        i = self.vocab[word]
+        return np.asarray(self.vectors_norm[i]) * self.norms[i]
+
+    def __getitem__(self, word):
+        return self.get_vector(word)
+
+    def most_similar(self, positive, topn=10):
+        """
+        Returns the words most similar to the given word by cosine similarity (like gensim's most_similar(), but only
+        for a single positive word).
+
+        Args:
+            positive: A string that is in the vocabulary.
+            topn: (default 10) the number of most similar words to return.
+        Returns:
+            A list of (word, cosine similarity) tuples, most similar first.
+        """
+        # gensim raises a KeyError for out-of-vocabulary words, and so does this lookup.
+        row = self.vocab[positive]
+        query = np.asarray(self.vectors_norm[row], dtype=np.float32)[np.newaxis, :]
+        nbr_idx, nbr_sim = nb.top_k_rows(query, self.vectors_norm, topn + 1)
+        return [(self.index2word[j], float(s)) for j, s in zip(nbr_idx[0], nbr_sim[0]) if j != row][:topn]
+
+
+class NeighbourTable:
+    """
+    The precomputed most similar words of every vocabulary entry (written by build_neighbours.py), memory-mapped
+    read-only: an int32 matrix of neighbour rows and a float16 matrix of their similarities, one row per word and most
+    similar first.
+
+    Like Embeddings, it can be passed wherever a gensim model is expected. Finding a word's neighbours is then just
+    reading one row of the table, and the embedding matrix itself isn't needed at all.
+    """
+
+    def __init__(self, nbr_idx, nbr_sim, index2word):
+        """
+        Args:
+            nbr_idx: A 2D numpy array (or memory map) of neighbour rows, one row per word.
+            nbr_sim: A 2D numpy array (or memory map) of the corresponding similarities.
+            index2word: A list of the words in row order.
+        """
+        self.nbr_idx = nbr_idx
+        self.nbr_sim = nbr_sim
+        self.index2word = index2word
+        self.vocab = {word: i for i, word in enumerate(index2word)}
+        self.lemma_map = None
+
+    @property
+    def wv(self):
+        return self
+
+    def __len__(self):
+        return len(self.index2word)
+
+    def __contains__(self, word):
+        return word in self.vocab
+
+    def candidate_similarities(self, row):
+        """
+        Returns the precomputed neighbours of the word in the given row (see neighbours.candidate_similarities() ).
+
+        Arg:
+            row: An integer, the row of the query word.
+        Returns:
+            A tuple (rows, similarities) of 1D arrays.
+        """
+        return np.asarray(self.nbr_idx[row]), np.asarray(self.nbr_sim[row], dtype=np.float32)
+
+    def most_similar(self, positive, topn=10):
+        """
+        Returns the words most similar to the given word, like gensim's most_similar() (but at most as many as the
+        table holds per word).
+
+        Args:
+            positive: A string that is in the vocabulary.
+            topn: (default 10) the number of most similar words to return.
+        Returns:
+            A list of (word, cosine similarity) tuples, most similar first.
+        """
+        rows, sims = self.candidate_similarities(self.vocab[positive])
+        return [(self.index2word[j], float(s)) for j, s in zip(rows[:topn], sims[:topn])]
+
+
+class LemmaMap:
+    """
+    The WordNet lemma of every vocabulary entry (written by build_lemma_map.py), so that lemmatising a neighbour is an
+    array lookup rather than a call to the lemmatiser. Each row maps to an int32 lemma id: a lemma that is itself in the
+    vocabulary has that entry's row as its id, and the other lemmas are numbered from the vocabulary size on.
+    """
+
+    def __init__(self, lemma_ids, index2word, extra_lemmas):
+        """
+        Args:
+            lemma_ids: A 1D int32 numpy array (or memory map) with the lemma id of each row.
+            index2word: A list of the words in row order.
+            extra_lemmas: A list of the lemmas that aren't in the vocabulary, in id order.
+        """
+        self.lemma_ids = lemma_ids
+        self.index2word = index2word
+        self.extra_lemmas = extra_lemmas
+
+    def __len__(self):
+        return len(self.lemma_ids)
+
+    def lemma(self, lemma_id):
+        """
+        Returns the lemma with the given id.
+
+        Arg:
+            lemma_id: An integer.
+        Returns:
+            A string.
+        """
+        n_words = len(self.index2word)
+        return self.index2word[lemma_id] if lemma_id < n_words else self.extra_lemmas[lemma_id - n_words]
+
+    def lemmas(self, rows):
+        """
+        Returns the lemmas of the words in the given rows.
+
+        Arg:
+            rows: A 1D array of rows.
+        Returns:
+            A list of strings.
+        """
+        return [self.lemma(i) for i in np.asarray(self.lemma_ids[rows]).tolist()]
+
+
+def synthetic_embeddings(n_words=10000, dim=50, words=(), seed=0):
+    """
+    Creates random embeddings, for testing and benchmarking without the real word2vec file. The vocabulary consists
+    of the given words followed by made-up lowercase words of 4 to 10 letters.
+
+    Args:
+        n_words: (default 10000) the vocabulary size.
+        dim: (default 50) the number of dimensions.
+        words: (optional) words to include in the vocabulary (e.g. the main words to query).
+        seed: (default 0) the random seed.
+    Returns:
+        An Embeddings object.
+    """
+    rng = np.random.default_rng(seed)
+    index2word = list(dict.fromkeys(words))[:n_words]
+    seen = set(index2word)
+
+    # Make up words in bulk: random letter codes, cut to random lengths (zero code points end a numpy string).
+    while len(index2word) < n_words:
+        n_new = n_words - len(index2word)
+        codes = rng.integers(ord('a'), ord('z') + 1, size=(n_new, 10), dtype=np.uint32)
+        codes[np.arange(10) >= rng.integers(4, 11, size=n_new)[:, np.newaxis]] = 0
+        for word in codes.view('<U10').ravel().tolist():
+            if word not in seen:
+                seen.add(word)
+                index2word.append(word)
+
+    vectors = rng.standard_normal((n_words, dim), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1)
+    return Embeddings(vectors / norms[:, np.newaxis], norms, index2word)
+
+
+def _read_word2vec_header(fin):
+    """
+    Reads the header line of a binary word2vec file.
+
+    Arg:
+        fin: A file object opened in binary mode, positioned at the start of the file.
+    Returns:
+        A tuple (vocabulary size, vector size).
+    """
+    vocab_size, vector_size = (int(x) for x in fin.readline().split())
+    return vocab_size, vector_size
+
+
+def convert_word2vec(bin_file, out_dir, block_rows=100000, unicode_errors='strict'):
+    """
+    Converts binary word2vec embeddings (like GoogleNews-vectors-negative300.bin) once into a directory that
+    load_embeddings() can memory-map. The file is streamed block by block, so the conversion itself never holds more
+    than block_rows vectors in memory.
+
+    Args:
+        bin_file: Path to the binary word2vec file.
+        out_dir: Path to the directory to write the converted embeddings to (created if needed).
+        block_rows: (default 100000) how many vectors to read before normalising and writing them out.
+        unicode_errors: (default 'strict') how to handle words that aren't valid UTF-8 (as in bytes.decode()).
+    Returns:
+        The number of words converted.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+
+    with open(bin_file, 'rb') as fin:
+        vocab_size, vector_size = _read_word2vec_header(fin)
+        row_bytes = 4 * vector_size
+
+        vectors = np.lib.format.open_memmap(os.path.join(out_dir, VECTORS_FILE), mode='w+', dtype=np.float32,
+                                            shape=(vocab_size, vector_size))
+        norms = np.empty(vocab_size, dtype=np.float32)
+
+        with open(os.path.join(out_dir, VOCAB_FILE), 'w', encoding='utf-8') as vocab_out:
+            buf = b''
+            pos = 0
+            row = 0
+            while row < vocab_size:
+
+                # Each entry is the word, a space, and the vector as little-endian float32s. Collect a block of them.
+                n = min(block_rows, vocab_size - row)
+                block = np.empty((n, vector_size), dtype=np.float32)
+                words = []
+                for i in range(n):
+                    space = buf.find(b' ', pos)
+                    while space == -1 or len(buf) < space + 1 + row_bytes:
+                        # Top up the buffer, dropping what has already been consumed.
+                        more = fin.read(1 << 20)
+                        if not more:
+                            raise ValueError('unexpected end of file in ' + bin_file)
+                        buf = buf[pos:] + more
+                        pos = 0
+                        space = buf.find(b' ')
+
+                    # Words may be preceded by the newline ending the previous entry.
+                    words.append(buf[pos:space].lstrip(b'\n').decode('utf-8', errors=unicode_errors))
+                    block[i] = np.frombuffer(buf, dtype='<f4', count=vector_size, offset=space + 1)
+                    pos = space + 1 + row_bytes
+
+                # Normalise the block and write it out.
+                block_norms = np.linalg.norm(block, axis=1)
+                norms[row:row + n] = block_norms
+                vectors[row:row + n] = block / np.maximum(block_norms, 1e-12)[:, np.newaxis]
+                vocab_out.write('\n'.join(words) + '\n')
+                row += n
+
+    vectors.flush()
+    del vectors
+    np.save(os.path.join(out_dir, NORMS_FILE), norms)
+
+    with open(os.path.join(out_dir, META_FILE), 'w', encoding='utf-8') as meta_out:
+        json.dump({
+            'format_version': FORMAT_VERSION,
+            'source': os.path.basename(bin_file),
+            'vocab_size': vocab_size,
+            'vector_size': vector_size
+        }, meta_out, indent=2)
+
+    return vocab_size
+
+
+def save_embeddings(out_dir, vectors_norm, norms, index2word, source):
+    """
+    Writes vectors that are already in memory to a directory in the format load_embeddings() reads.
+
+    Args:
+        out_dir: Path to the directory to write to (created if needed).
+        vectors_norm: A 2D numpy array of unit-length vectors, one row per word.
+        norms: A 1D numpy array containing the original length of each vector.
+        index2word: A list of the words in row order.
+        source: A string describing where the vectors came from (saved in the metadata).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, VECTORS_FILE), np.asarray(vectors_norm, dtype=np.float32))
+    np.save(os.path.join(out_dir, NORMS_FILE), np.asarray(norms, dtype=np.float32))
+
+    with open(os.path.join(out_dir, VOCAB_FILE), 'w', encoding='utf-8') as vocab_out:
+        vocab_out.write('\n'.join(index2word) + '\n')
+
+    with open(os.path.join(out_dir, META_FILE), 'w', encoding='utf-8') as meta_out:
+        json.dump({
+            'format_version': FORMAT_VERSION,
+            'source': source,
+            'vocab_size': len(index2word),
+            'vector_size': int(vectors_norm.shape[1])
+        }, meta_out, indent=2)
+
+
+def load_embeddings(emb_dir):
+    """
+    Loads embeddings converted with convert_word2vec(), memory-mapping the vectors read-only.
+
+    Arg:
+        emb_dir: Path to the directory containing the converted embeddings.
+    Returns:
+        An Embeddings object.
+    """
+    with open(os.path.join(emb_dir, META_FILE), encoding='utf-8') as meta_in:
+        meta = json.load(meta_in)
+    if meta['format_version'] != FORMAT_VERSION:
+        raise ValueError('unsupported embeddings format version: ' + str(meta['format_version']))
+
+    vectors_norm = np.load(os.path.join(emb_dir, VECTORS_FILE), mmap_mode='r')
+    norms = np.load(os.path.join(emb_dir, NORMS_FILE))
+    return Embeddings(vectors_norm, norms, read_vocab(emb_dir, meta['vocab_size']))
+
+
+def read_vocab(emb_dir, vocab_size):
+    """
+    Reads the vocabulary of a converted embeddings directory.
+
+    Args:
+        emb_dir: Path to the directory containing the converted embeddings.
+        vocab_size: An integer, the number of words (from the metadata).
+    Returns:
+        A list of the words in row order.
+    """
+    # Each line holds one word; split on newlines only, since some vocabulary entries may contain other whitespace.
+    with open(os.path.join(emb_dir, VOCAB_FILE), encoding='utf-8') as vocab_in:
+        return vocab_in.read().split('\n')[:vocab_size]
+
+
+def has_neighbour_table(emb_dir):
+    """
+    Checks whether a neighbour table has been built for a converted embeddings directory.
+
+    Arg:
+        emb_dir: Path to the directory containing the converted embeddings.
+    Returns:
+        True or False.
+    """
+    return (os.path.exists(os.path.join(emb_dir, NEIGHBOUR_INDEX_FILE)) and
+            os.path.exists(os.path.join(emb_dir, NEIGHBOUR_SIM_FILE)))
+
+
+def load_neighbour_table(emb_dir):
+    """
+    Loads the neighbour table built for a converted embeddings directory, memory-mapping it read-only.
+
+    Arg:
+        emb_dir: Path to the directory containing the converted embeddings and the neighbour table.
+    Returns:
+        A NeighbourTable object.
+    """
+    with open(os.path.join(emb_dir, META_FILE), encoding='utf-8') as meta_in:
+        meta = json.load(meta_in)
+
+    nbr_idx = np.load(os.path.join(emb_dir, NEIGHBOUR_INDEX_FILE), mmap_mode='r')
+    nbr_sim = np.load(os.path.join(emb_dir, NEIGHBOUR_SIM_FILE), mmap_mode='r')
+    return NeighbourTable(nbr_idx, nbr_sim, read_vocab(emb_dir, meta['vocab_size']))
+
+
+def save_lemma_map(emb_dir, lemma_ids, extra_lemmas):
+    """
+    Writes a lemma map (see LemmaMap) into a converted embeddings directory.
+
+    Args:
+        emb_dir: Path to the directory containing the converted embeddings.
+        lemma_ids: A 1D array with the lemma id of each row.
+        extra_lemmas: A list of the lemmas that aren't in the vocabulary, in id order.
+    """
+    with open(os.path.join(emb_dir, EXTRA_LEMMAS_FILE), 'w', encoding='utf-8') as lemmas_out:
+        lemmas_out.write(''.join(lemma + '\n' for lemma in extra_lemmas))
+    np.save(os.path.join(emb_dir, LEMMA_IDS_FILE), np.asarray(lemma_ids, dtype=np.int32))
+
+
+def has_lemma_map(emb_dir):
+    """
+    Checks whether a lemma map has been built for a converted embeddings directory.
+
+    Arg:
+        emb_dir: Path to the directory containing the converted embeddings.
+    Returns:
+        True or False.
+    """
+    return (os.path.exists(os.path.join(emb_dir, LEMMA_IDS_FILE)) and
+            os.path.exists(os.path.join(emb_dir, EXTRA_LEMMAS_FILE)))
+
+
+def load_lemma_map(emb_dir, index2word):
+    """
+    Loads the lemma map built for a converted embeddings directory, memory-mapping the lemma ids read-only.
+
+    Args:
+        emb_dir: Path to the directory containing the converted embeddings and the lemma map.
+        index2word: A list of the words in row order (the vocabulary of the loaded model).
+    Returns:
+        A LemmaMap object.
+    """
+    lemma_ids = np.load(os.path.join(emb_dir, LEMMA_IDS_FILE), mmap_mode='r')
+    with open(os.path.join(emb_dir, EXTRA_LEMMAS_FILE), encoding='utf-8') as lemmas_in:
+        extra_lemmas = lemmas_in.read().split('\n')[:-1]
+    return LemmaMap(lemma_ids, index2word, extra_lemmas)
+
+
+def load_model(path, use_neighbour_table=True):
+    """
+    Loads word embeddings either from a directory converted with convert_word2vec() (fast) or from a binary word2vec
+    file through gensim (slow).
+
+    Args:
+        path: Path to a converted embeddings directory or a binary word2vec file.
+        use_neighbour_table: (default True) if the directory contains a neighbour table, load only that instead of the
+           vectors.
+    Returns:
+        A NeighbourTable, Embeddings or gensim KeyedVectors object. If the directory contains a lemma map, it is
+        loaded as the model's lemma_map.
+    """
+    if os.path.isdir(path):
+        if use_neighbour_table and has_neighbour_table(path):
+            model = load_neighbour_table(path)
+        else:
+            model = load_embeddings(path)
+        if has_lemma_map(path):
+            model.lemma_map = load_lemma_map(path, model.index2word)
+        return model
+
+    import gensim
+    return gensim.models.KeyedVectors.load_word2vec_format(path, binary=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert binary word2vec embeddings into a memory-mappable directory.')
+    parser.add_argument('bin_file', help='binary word2vec file, e.g. GoogleNews-vectors-negative300.bin')
+    parser.add_argument('out_dir', help='directory to write the converted embeddings to')
+    args = parser.parse_args()
+
+    n_words = convert_word2vec(args.bin_file, args.out_dir)
+    print('Converted', n_words, 'words to', args.out_dir)
@@ -0,0 +1,209 @@
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+import deck
+import semrel as sr
+
+
+# The output formats: one JSON object per line, or CSV with a header row.
+FORMATS = ('jsonl', 'csv')
+
+# The columns of the CSV format.
+CSV_COLUMNS = ['mw', 'tw1', 'tw2', 'tw3', 'tw4', 'tw5']
+
+# Appended to the name of the output file to name the checkpoint and the list of main words not in the vocabulary.
+CHECKPOINT_SUFFIX = '.checkpoint'
+OOV_SUFFIX = '.oov.txt'
+
+
+def read_words(words_in):
+    """
+    Reads main words one by one, without reading the whole input in first.
+
+    Arg:
+        words_in: A text file (or sys.stdin) with one main word per line.
+    Yields:
+        The main words, without surrounding whitespace and skipping empty lines.
+    """
+    for line in words_in:
+        mw = line.strip()
+        if mw:
+            yield mw
+
+
+def format_card(mw, tws, fmt):
+    """
+    Formats a card as one line of the output file.
+
+    Args:
+        mw: A string, the main word.
+        tws: A list of (usually five) taboo words.
+        fmt: 'jsonl' or 'csv'.
+    Returns:
+        A string ending in a newline.
+    """
+    if fmt == 'jsonl':
+        return json.dumps({'mw': mw, 'tws': tws}, ensure_ascii=False) + '\n'
+    line = io.StringIO()
+    # Cards with fewer than five taboo words (if a rare word has too few collocates) get empty cells.
+    csv.writer(line, lineterminator='\n').writerow([mw] + tws + [''] * (len(CSV_COLUMNS) - 1 - len(tws)))
+    return line.getvalue()
+
+
+def read_checkpoint(filename):
+    """
+    Reads a checkpoint written by write_checkpoint().
+
+    Arg:
+        filename: The path of the checkpoint file.
+    Returns:
+        The checkpoint as a dictionary, or None if there is no checkpoint.
+    """
+    if not os.path.exists(filename):
+        return None
+    with open(filename, encoding='utf-8') as checkpoint_in:
+        return json.load(checkpoint_in)
+
+
+def write_checkpoint(filename, checkpoint):
+    """
+    Writes a checkpoint atomically, so that an interruption leaves either the previous or the new one behind.
+
+    Args:
+        filename: The path of the checkpoint file.
+        checkpoint: A JSON-serialisable dictionary.
+    """
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w', encoding='utf-8') as checkpoint_out:
+        json.dump(checkpoint, checkpoint_out)
+        checkpoint_out.flush()
+        os.fsync(checkpoint_out.fileno())
+    os.replace(tmp_filename, filename)
+
+
+def _open_at(filename, size):
+    # Opens a file for appending after its first size bytes, dropping whatever was written after the last checkpoint.
+    # A file shorter than that was changed since the checkpoint, and resuming would leave a gap of zero bytes in it.
+    if size > 0 and (not os.path.exists(filename) or os.path.getsize(filename) < size):
+        raise ValueError('%s is shorter than at the last checkpoint (%d bytes); pass restart=True (--restart) to start '
+                         'over' % (filename, size))
+    out = open(filename, 'ab')
+    out.truncate(size)
+    out.seek(size)
+    return out
+
+
+def _sync(out):
+    out.flush()
+    os.fsync(out.fileno())
+    return out.tell()
+
+
+def export_deck(mws, output, fmt=None, oov_file=None, checkpoint_every=1000, restart=False, n_workers=None,
+                emb_dir='GoogleNews-vectors-negative300', prob_dist_dict=None,
+                relation_index_file=sr.RELATION_INDEX_FILE, chunk_size=32, deck_seed=None, card_store_file=None,
+                dedupe_lemmas=False):
+    """
+    Generates a deck with deck.build_deck() and writes the cards to a file as they come in, in the order of mws.
+    Main words that aren't in the vocabulary are written to a separate file. Every checkpoint_every main words, the
+    progress is saved in a checkpoint file next to the output; if the export is interrupted, running it again with the
+    same main words continues after the last checkpoint instead of starting over.
+
+    Args:
+        mws: An iterable of strings, the main words (e.g. read_words() of a file or sys.stdin).
+        output: The path of the file to write the cards to.
+        fmt: (optional) 'jsonl' or 'csv'. Defaults to 'csv' if output ends in '.csv', else 'jsonl'.
+        oov_file: (optional) the path of the file to write the main words that aren't in the vocabulary to, one per
+           line. Defaults to output + '.oov.txt'.
+        checkpoint_every: (default 1000) the number of main words between checkpoints.
+        restart: (default False) ignore an existing checkpoint and start over.
+        n_workers, emb_dir, prob_dist_dict, relation_index_file, chunk_size, deck_seed, card_store_file,
+           dedupe_lemmas: passed on to deck.build_deck().
+    Returns:
+        A dictionary with the number of main words skipped because they were done before, the number of cards
+        written, and the number of main words that aren't in the vocabulary (the last two counting this run only).
+    """
+    if fmt is None:
+        fmt = 'csv' if output.lower().endswith('.csv') else 'jsonl'
+    if fmt not in FORMATS:
+        raise ValueError('unknown format: ' + fmt)
+    if oov_file is None:
+        oov_file = output + OOV_SUFFIX
+    checkpoint_file = output + CHECKPOINT_SUFFIX
+
+    # Resuming is only safe if the cards would be made the same way as before.
+    options = {'format': fmt, 'emb_dir': os.path.abspath(emb_dir), 'deck_seed': deck_seed, 'dedupe_lemmas': dedupe_lemmas}
+    checkpoint = None if restart else read_checkpoint(checkpoint_file)
+    if checkpoint is not None and checkpoint['options'] != options:
+        raise ValueError('%s was made with different options (%s); pass restart=True (--restart) to start over'
+                         % (checkpoint_file, checkpoint['options']))
+    if checkpoint is None:
+        checkpoint = {'options': options, 'words_done': 0, 'cards_bytes': 0, 'oov_bytes': 0}
+
+    done = checkpoint['words_done']
+    stats = {'skipped': done, 'cards': 0, 'oov': 0}
+    remaining = itertools.islice(mws, done, None)
+
+    with _open_at(output, checkpoint['cards_bytes']) as cards_out, _open_at(oov_file, checkpoint['oov_bytes']) as oov_out:
+        if fmt == 'csv' and checkpoint['cards_bytes'] == 0:
+            cards_out.write((','.join(CSV_COLUMNS) + '\n').encode('utf-8'))
+
+        since_checkpoint = 0
+        for mw, tws in deck.build_deck(remaining, n_workers, emb_dir, prob_dist_dict, relation_index_file, chunk_size,
+                                       deck_seed, card_store_file, dedupe_lemmas):
+            # False marks a main word outside the vocabulary; an empty list is a card without taboo words.
+            if tws is False:
+                oov_out.write((mw + '\n').encode('utf-8'))
+                stats['oov'] += 1
+            else:
+                cards_out.write(format_card(mw, tws, fmt).encode('utf-8'))
+                stats['cards'] += 1
+
+            since_checkpoint += 1
+            if since_checkpoint == checkpoint_every:
+                checkpoint['words_done'] += since_checkpoint
+                checkpoint['cards_bytes'] = _sync(cards_out)
+                checkpoint['oov_bytes'] = _sync(oov_out)
+                write_checkpoint(checkpoint_file, checkpoint)
+                since_checkpoint = 0
+
+        checkpoint['words_done'] += since_checkpoint
+        checkpoint['cards_bytes'] = _sync(cards_out)
+        checkpoint['oov_bytes'] = _sync(oov_out)
+
+    # Keep the final checkpoint too: running the export again then only adds main words appended to the input.
+    write_checkpoint(checkpoint_file, checkpoint)
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate Taboo cards for a list of main words and write them to a '
+                                                 'JSONL or CSV file, resuming an interrupted export.')
+    parser.add_argument('words', help="file with one main word per line, or '-' to read them from standard input")
+    parser.add_argument('output', help='file to write the cards to (.csv for CSV, otherwise JSONL)')
+    parser.add_argument('--format', choices=FORMATS, default=None, help='output format (default: from the file name)')
+    parser.add_argument('--oov', default=None, help='file for main words not in the vocabulary (default: OUTPUT.oov.txt)')
+    parser.add_argument('--checkpoint-every', type=int, default=1000, help='main words between checkpoints')
+    parser.add_argument('--restart', action='store_true', help='ignore an existing checkpoint and start over')
+    parser.add_argument('--emb-dir', default='GoogleNews-vectors-negative300', help='converted embeddings directory')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: all cores)')
+    parser.add_argument('--seed', type=int, default=None, help='deck seed, for reproducible cards')
+    parser.add_argument('--store', default=None, help='SQLite card store to reuse seeded cards from (and add them to)')
+    parser.add_argument('--dedupe-lemmas', action='store_true', help='skip inflected forms of collocates already seen')
+    args = parser.parse_args()
+
+    words_in = sys.stdin if args.words == '-' else open(args.words, encoding='utf-8')
+    try:
+        stats = export_deck(read_words(words_in), args.output, args.format, args.oov, args.checkpoint_every,
+                            args.restart, args.workers, args.emb_dir, deck_seed=args.seed, card_store_file=args.store,
+                            dedupe_lemmas=args.dedupe_lemmas)
+    finally:
+        if words_in is not sys.stdin:
+            words_in.close()
+
+    print('%d cards written, %d main words not in the vocabulary, %d done before' %
+          (stats['cards'], stats['oov'], stats['skipped']), file=sys.stderr)
@@ -1,4 +1,32 @@
-import pandas as pd
+import csv
+import hashlib
+import json
+import os
+
+
+# pandas is only imported by the functions that build or analyse dataframes; the card generator itself doesn't need it.
+
+# The gold-standard annotation: one row per MW/TW combination, with a 1 in the column of its category.
+GS_CSV_FILE = 'gold-std-categorised.csv'
+
+# The category columns of the annotation, and the ones left out of the probability distribution.
+CATEGORIES = ('semrel_synonym', 'semrel_antonym', 'semrel_hyponym', 'semrel_hypernym', 'collocation', 'cultural_ref', 'other')
+IGNORED_CATEGORIES = ('cultural_ref', 'other')
+
+# The transcribed Taboo cards: the main word on one line, followed by the five taboo words, each preceded by a dash.
+CARDS_FILE = 'taboo_cards.txt'
+
+# The compiled gold standard (see compile_gold_standard() ), rebuilt whenever the files it was compiled from change.
+# It is kept next to the (first) csv it was compiled from, so that each copy of the sources has its own and running
+# from another directory neither leaves a stray copy behind nor reads one compiled from other files.
+GS_COMPILED_FILE = 'gold-std-compiled.json'
+COMPILED_VERSION = 1
+
+# The number of bytes read at a time when hashing the source files.
+HASH_CHUNK_SIZE = 1 << 20
+
+# Compiled gold standards already loaded by this process, by compiled file and source files.
+_compiled = {}
 
 
 def read_in(filename):
@@ -41,6 +69,32 @@ def format_cards(enum_list):
     return card_dict
 
 
+def iter_cards(filename=CARDS_FILE):
+    """
+    Reads transcribed Taboo cards one at a time, so that transcripts of any size can be read without loading them
+    (like read_in() and format_cards() do).
+
+    Arg:
+        filename: (default 'taboo_cards.txt') the transcribed cards.
+    Yields:
+        (main word, list of taboo words) tuples, in the order of the file.
+    """
+    card = []
+    with open(filename, "r", encoding='utf-8') as myfile:
+        for line in myfile:
+            if line.strip() != '':
+                card.append(line.strip())
+
+                # Every sixth line starts a new card; the word[1:] removes the dash from the beginning of each TW.
+                if len(card) == 6:
+                    yield card[0], [word[1:] for word in card[1:]]
+                    card = []
+
+    # An incomplete card at the end of the file is kept, as format_cards() does.
+    if card:
+        yield card[0], [word[1:] for word in card[1:]]
+
+
 def get_card_dicts():
     """
     Reads in transcribed Taboo cards (saved in taboo_cards.txt in current dir) and formats them as a dictionary.
@@ -48,11 +102,7 @@ def get_card_dicts():
     Returns:
         A dictionary with the main words of the cards as keys and the five taboo words in a list as the values.
     """
-    CARDS_FILE = 'taboo_cards.txt'
-
-    enum_lines = read_in(CARDS_FILE)
-    cards = format_cards(enum_lines)
-    return cards
+    return dict(iter_cards(CARDS_FILE))
 
 
 def cards_to_df(card_dict):
@@ -85,6 +135,7 @@ def cards_to_df(card_dict):
             rows_list.append(row)
 
     # Convert this list of dictionaries to a dataframe and return.
+    import pandas as pd
     data = pd.DataFrame(rows_list)
     return data
 
@@ -97,10 +148,8 @@ def read_in_categorised():
     Returns:
         A pandas dataframe with a row per MW/TW combination and a 1 in the category that combination belongs to.
     """
-    # Set file location.
-    GS_CSV_FILE = 'gold-std-categorised.csv'
-
     # Read the csv back in and save as pandas dataframe, replacing NaNs with 0, and return.
+    import pandas as pd
     gs_df = pd.read_csv(GS_CSV_FILE, encoding='utf-8')
     gs_df.fillna(0, inplace=True)
     return gs_df
@@ -141,15 +190,225 @@ def freq_dist_to_prob_dist(gs_dataframe):
     Returns:
         A dictionary containing the probability distribution (labels as keys, probabilities as values)
     """
-    # Get the sum of each column as a series.
+    # Get the sum of each column as a dictionary.
     gs_df_sum = gs_dataframe.loc[:, 'semrel_synonym':'other'].sum()
-    gs_df_sum.sort_values(ascending=False, inplace=True)
+    return counts_to_prob_dist({label: float(count) for label, count in gs_df_sum.items()})
+
 
-    # Before converting to a probability distribution, remove the categories we aren't interested in ("cultural_ref" and "other").
-    gs_df_sum.drop(labels=['cultural_ref', 'other'], inplace=True)
+def read_category_counts(filename=GS_CSV_FILE, counts=None):
+    """
+    Counts how often each category appears in the manually annotated csv, without pandas (so that the card generator
+    can start up without importing it). The csv is read row by row, so its size doesn't matter.
+
+    Args:
+        filename: (default 'gold-std-categorised.csv') the annotated csv.
+        counts: (optional) a dictionary of counts to add to, e.g. those of another annotated csv.
+    Returns:
+        A dictionary with the category labels as keys and their frequencies as values.
+    """
+    if counts is None:
+        counts = {label: 0.0 for label in CATEGORIES}
+    with open(filename, encoding='utf-8', newline='') as csv_in:
+        reader = csv.reader(csv_in)
+        header = next(reader, [])
+        columns = [(label, header.index(label)) for label in CATEGORIES]
+        for row in reader:
+            for label, i in columns:
+                # Empty (or missing) cells count as 0, like the NaNs that read_in_categorised() fills in.
+                if i < len(row) and row[i]:
+                    counts[label] += float(row[i])
+    return counts
+
+
+def counts_to_prob_dist(counts):
+    """
+    Converts category frequencies into a probability distribution over the categories we care about.
 
-    # Convert the frequency distribution to a probability distribution by dividing by the sum of all observations
-    prob_dist = gs_df_sum / gs_df_sum.sum()
+    Arg:
+        counts: A dictionary with category labels as keys and their frequencies as values.
+    Returns:
+        A dictionary containing the probability distribution (labels as keys, probabilities as values), most probable
+        label first.
+    """
+    # Sort by descending frequency (ties keep their column order), and remove the categories we aren't interested in
+    # ("cultural_ref" and "other").
+    freqs = sorted(counts.items(), key=lambda item: -item[1])
+    freqs = [(label, count) for label, count in freqs if label not in IGNORED_CATEGORIES]
 
-    # Convert this to a dictionary and return.
-    return dict(prob_dist)
+    # Convert the frequency distribution to a probability distribution by dividing by the sum of all observations.
+    total = sum(count for label, count in freqs)
+    return {label: count / total for label, count in freqs}
+
+
+def source_stats(filenames):
+    """
+    Returns what is needed to notice cheaply that files have changed.
+
+    Arg:
+        filenames: A list of paths.
+    Returns:
+        A list of [path, size, modification time in nanoseconds] lists (with None for size and time if a file doesn't
+        exist).
+    """
+    stats = []
+    for filename in filenames:
+        try:
+            st = os.stat(filename)
+            stats.append([filename, st.st_size, st.st_mtime_ns])
+        except FileNotFoundError:
+            stats.append([filename, None, None])
+    return stats
+
+
+def source_hash(filenames):
+    """
+    Hashes the contents of files, reading them in chunks.
+
+    Arg:
+        filenames: A list of paths (files that don't exist are skipped).
+    Returns:
+        A hexadecimal SHA-256 digest.
+    """
+    sha = hashlib.sha256()
+    for filename in filenames:
+        sha.update(filename.encode('utf-8') + b'\0')
+        if not os.path.exists(filename):
+            continue
+        with open(filename, 'rb') as source_in:
+            for chunk in iter(lambda: source_in.read(HASH_CHUNK_SIZE), b''):
+                sha.update(chunk)
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+def compiled_file_for(csv_files):
+    """
+    Returns where the gold standard compiled from some csvs is kept.
+
+    Arg:
+        csv_files: A list of paths of annotated csvs.
+    Returns:
+        The path of GS_COMPILED_FILE in the directory of the first csv.
+    """
+    return os.path.join(os.path.dirname(csv_files[0]) if csv_files else '', GS_COMPILED_FILE)
+
+
+def compile_gold_standard(csv_files=(GS_CSV_FILE,), cards_files=(CARDS_FILE,), compiled_file=None):
+    """
+    Reads the annotated csvs and the card transcripts, streaming them row by row, and saves the category counts and
+    probability distribution they give in a small JSON file, together with a hash of the source files.
+
+    Args:
+        csv_files: (default ['gold-std-categorised.csv']) the annotated csvs (see read_category_counts() ).
+        cards_files: (default ['taboo_cards.txt']) the card transcripts (see iter_cards() ). Missing ones are skipped.
+        compiled_file: (optional) the file to write. Defaults to gold-std-compiled.json next to the first csv (see
+           compiled_file_for() ); False only returns the result.
+    Returns:
+        A dictionary with the category counts, the probability distribution, the number of cards and taboo words in
+        the transcripts, and the hash, sizes and modification times of the source files.
+    """
+    csv_files = list(csv_files)
+    cards_files = list(cards_files)
+    sources = csv_files + cards_files
+    stats = source_stats(sources)
+
+    counts = {label: 0.0 for label in CATEGORIES}
+    for filename in csv_files:
+        read_category_counts(filename, counts)
+
+    num_cards = 0
+    num_taboo_words = 0
+    for filename in cards_files:
+        if os.path.exists(filename):
+            for mw, tws in iter_cards(filename):
+                num_cards += 1
+                num_taboo_words += len(tws)
+
+    compiled = {
+        'version': COMPILED_VERSION,
+        'sources': stats,
+        'source_hash': source_hash(sources),
+        'counts': counts,
+        'num_cards': num_cards,
+        'num_taboo_words': num_taboo_words,
+        'prob_dist': counts_to_prob_dist(counts)
+    }
+    if compiled_file is None:
+        compiled_file = compiled_file_for(csv_files)
+    if compiled_file is not False:
+        _write_compiled(compiled_file, compiled)
+    return compiled
+
+
+def _write_compiled(compiled_file, compiled):
+    # Written to a temporary file first, so that another process never reads half a file. If the directory isn't
+    # writable, the gold standard just gets compiled again next time.
+    tmp_file = compiled_file + '.%d.tmp' % os.getpid()
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as json_out:
+            json.dump(compiled, json_out, indent=1)
+        os.replace(tmp_file, compiled_file)
+    except OSError:
+        pass
+
+
+def load_gold_standard(csv_files=(GS_CSV_FILE,), cards_files=(CARDS_FILE,), compiled_file=None):
+    """
+    Returns the compiled gold standard, compiling it only if the source files have changed since it was compiled.
+    Whether they have is decided by their sizes and modification times (and, if those differ, by their hash), and
+    the result is kept in memory, so that calls after the first one don't read any files at all.
+
+    Args:
+        csv_files: (default ['gold-std-categorised.csv']) the annotated csvs.
+        cards_files: (default ['taboo_cards.txt']) the card transcripts.
+        compiled_file: (optional) the compiled gold standard. Defaults to gold-std-compiled.json next to the first
+           csv.
+    Returns:
+        A dictionary like the one compile_gold_standard() returns. (Don't change it: it is shared between calls.)
+    """
+    csv_files = list(csv_files)
+    cards_files = list(cards_files)
+    sources = csv_files + cards_files
+    if compiled_file is None:
+        compiled_file = compiled_file_for(csv_files)
+    stats = source_stats(sources)
+
+    key = (os.path.abspath(compiled_file), tuple(os.path.abspath(f) for f in sources))
+    compiled = _compiled.get(key)
+    if compiled is not None and compiled['sources'] == stats:
+        return compiled
+
+    try:
+        with open(compiled_file, encoding='utf-8') as json_in:
+            compiled = json.load(json_in)
+    except (OSError, ValueError):
+        compiled = None
+
+    if compiled is None or compiled.get('version') != COMPILED_VERSION or [s[0] for s in compiled['sources']] != sources:
+        compiled = compile_gold_standard(csv_files, cards_files, compiled_file)
+    elif compiled['sources'] != stats:
+        # The files were touched (e.g. by a checkout); only compile again if their contents changed.
+        if compiled['source_hash'] == source_hash(sources):
+            compiled['sources'] = stats
+            _write_compiled(compiled_file, compiled)
+        else:
+            compiled = compile_gold_standard(csv_files, cards_files, compiled_file)
+
+    _compiled[key] = compiled
+    return compiled
+
+
+def load_gold_probdist(csv_files=(GS_CSV_FILE,), cards_files=(CARDS_FILE,), compiled_file=None):
+    """
+    Returns the probability distribution of the compiled gold standard (see load_gold_standard() ).
+
+    Args:
+        csv_files: (default ['gold-std-categorised.csv']) the annotated csvs.
+        cards_files: (default ['taboo_cards.txt']) the card transcripts.
+        compiled_file: (optional) the compiled gold standard. Defaults to gold-std-compiled.json next to the first
+           csv.
+    Returns:
+        A dictionary containing the probability distribution (labels as keys, probabilities as values), most probable
+        label first.
+    """
+    return dict(load_gold_standard(csv_files, cards_files, compiled_file)['prob_dist'])
@@ -0,0 +1,147 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+import profiling as prof
+
+
+class LRUCache:
+    """
+    A bounded, thread-safe least-recently-used cache with an optional time-to-live, which counts its hits, misses,
+    evictions (entries pushed out because the cache was full) and expirations (entries older than the TTL).
+    """
+
+    def __init__(self, maxsize=10000, ttl=None):
+        """
+        Args:
+            maxsize: (default 10000) the maximum number of entries.
+            ttl: (optional) the number of seconds after which an entry expires. Entries never expire by default.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """
+        Looks up a key, marking it as recently used.
+
+        Arg:
+            key: A hashable key.
+        Returns:
+            A tuple (found, value); value is None if the key wasn't found (or had expired).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if self.ttl is None or time.monotonic() - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        """
+        Stores a value, evicting the least recently used entries if the cache is full.
+
+        Args:
+            key: A hashable key.
+            value: The value to store.
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            self._shrink()
+
+    def resize(self, maxsize=None, ttl=None):
+        """
+        Changes the size limit and/or TTL of the cache.
+
+        Args:
+            maxsize: (optional) the new maximum number of entries.
+            ttl: (optional) the new TTL in seconds.
+        """
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl
+            self._shrink()
+
+    def _shrink(self):
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Removes all entries (the statistics are kept).
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Returns the cache's statistics.
+
+        Returns:
+            A dictionary with the current size, the limits, the hit/miss/eviction/expiration counts and the hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+
+def memoize(maxsize=10000, ttl=None, freeze=None):
+    """
+    Decorator that caches a function's results in an LRUCache (available as the cache attribute of the decorated
+    function), keyed by its arguments.
+
+    Args:
+        maxsize: (default 10000) the maximum number of cached results.
+        ttl: (optional) the number of seconds after which a cached result expires.
+        freeze: (optional) a function applied to each result before it is cached, to make it immutable so that
+           callers can't change what later callers get.
+    Returns:
+        The decorator.
+    """
+    def decorator(func):
+        cache = LRUCache(maxsize, ttl)
+        hit_counter = func.__name__ + '.cache_hit'
+        miss_counter = func.__name__ + '.cache_miss'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = args + tuple(sorted(kwargs.items())) if kwargs else args
+            found, value = cache.get(key)
+            prof.count(hit_counter if found else miss_counter)
+            if not found:
+                value = func(*args, **kwargs)
+                if freeze is not None:
+                    value = freeze(value)
+                cache.put(key, value)
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
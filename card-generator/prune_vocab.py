@@ -0,0 +1,175 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import numpy as np
+import embeddings as emb
+import gs_probdist as gspd
+import neighbours as nb
+import semrel as sr
+
+
+# Vocabulary entries that can appear on a card: lowercase words, optionally hyphenated (no phrases, names, numbers...).
+TABOO_WORD_RE = re.compile(r'[a-z]+(?:-[a-z]+)*')
+
+MANIFEST_FILE = 'manifest.json'
+DROPPED_FILE = 'dropped.tsv'
+
+
+def drop_reason(word):
+    """
+    Decides whether a vocabulary entry could ever be used as a taboo word, using the same criteria as the filter in
+    semrel.get_collocations().
+
+    Arg:
+        word: A string from the embedding vocabulary.
+    Returns:
+        None if the entry is eligible, else a string naming the reason it is dropped.
+    """
+    if '_' in word:
+        return 'phrase'
+    if word != word.lower():
+        return 'not_lowercase'
+    if not TABOO_WORD_RE.fullmatch(word):
+        return 'not_a_word'
+    return None
+
+
+def prune_vocab(gensim_model, max_rank=None, main_words=()):
+    """
+    Selects the taboo-eligible part of an embedding vocabulary. Entries are kept if they are lowercase single words,
+    and are folded to their WordNet lemma (the way get_collocations() lemmatises its candidates), so that each lemma
+    is kept only once. A lemma keeps its own vector if it is in the vocabulary itself, or else the vector of its most
+    frequent inflected form. Main words are always kept as they are (whether inflected, beyond max_rank or not
+    taboo-eligible), since cards are asked for by main word.
+
+    Args:
+        gensim_model: The pre-trained word embeddings (a gensim model or an embeddings.Embeddings object), with the
+           vocabulary sorted by descending frequency as in the GoogleNews vectors.
+        max_rank: (optional) only consider the max_rank most frequent entries.
+        main_words: (optional) an iterable of main words to keep, e.g. those of taboo_cards.txt.
+    Returns:
+        A tuple (rows, words, dropped): a list of the rows to keep (in vocabulary order), a list of the words they are
+        kept as, and a list of (word, reason, lemma) tuples for the dropped entries. Main words that aren't in the
+        vocabulary at all are listed in dropped with the reason 'main_word_missing'.
+    """
+    lemmatizer = sr.get_lemmatizer()
+    n_rows = len(gensim_model.index2word)
+    if max_rank is not None:
+        n_rows = min(n_rows, max_rank)
+
+    dropped = []
+
+    # First pass: lemmatise all eligible entries and pick one row per lemma.
+    lemma_rows = {}
+    for row, word in enumerate(gensim_model.index2word[:n_rows]):
+        reason = drop_reason(word)
+        if reason is not None:
+            dropped.append((word, reason, ''))
+            continue
+
+        lemma = lemmatizer.lemmatize(word)
+        if lemma not in lemma_rows or word == lemma:
+            if lemma in lemma_rows:
+                dropped.append((gensim_model.index2word[lemma_rows[lemma]], 'lemma_duplicate', lemma))
+            lemma_rows[lemma] = row
+        else:
+            dropped.append((word, 'lemma_duplicate', lemma))
+
+    # Entries beyond the rank cap are dropped wholesale; record them as one range rather than word by word.
+    if n_rows < len(gensim_model.index2word):
+        dropped.append(('rows %d-%d' % (n_rows, len(gensim_model.index2word) - 1), 'rank_cap', ''))
+
+    # Main words are kept under their own name too; they then don't count as dropped.
+    main_rows = {}
+    for mw in sorted(set(main_words)):
+        if mw in lemma_rows:
+            continue
+        if mw in gensim_model.vocab:
+            main_rows[mw] = nb.word_index(gensim_model, mw)
+        else:
+            dropped.append((mw, 'main_word_missing', ''))
+    kept_words = set(main_rows)
+    dropped = [entry for entry in dropped if entry[0] not in kept_words]
+
+    # Second pass: keep the chosen rows in their original (frequency) order.
+    kept = sorted([(row, lemma) for lemma, row in lemma_rows.items()] + [(row, mw) for mw, row in main_rows.items()])
+    rows = [row for row, lemma in kept]
+    words = [lemma for row, lemma in kept]
+    return rows, words, dropped
+
+
+def build_pruned_embeddings(gensim_model, out_dir, max_rank=None, source='embeddings', main_words=()):
+    """
+    Writes the taboo-eligible part of the given embeddings (see prune_vocab()) to a directory that
+    embeddings.load_embeddings() can load, together with a manifest of how it was built and a list of what was dropped.
+
+    Args:
+        gensim_model: The pre-trained word embeddings (a gensim model or an embeddings.Embeddings object).
+        out_dir: Path to the directory to write to (created if needed).
+        max_rank: (optional) only consider the max_rank most frequent entries.
+        source: (default 'embeddings') a string describing the input embeddings, saved in the manifest.
+        main_words: (optional) an iterable of main words to keep (see prune_vocab() ).
+    Returns:
+        A dictionary, the manifest. Its 'main_words' and 'main_words_missing' entries count the main words given and
+        those that aren't in the pruned vocabulary (because they weren't in the source vocabulary either).
+    """
+    main_words = set(main_words)
+    rows, words, dropped = prune_vocab(gensim_model, max_rank, main_words)
+
+    # Gather the vectors of the rows to keep (sorted row order reads the memory map sequentially).
+    rows = np.array(rows, dtype=np.int64)
+    vectors = nb.unit_vectors(gensim_model)
+    vectors_norm = np.asarray(vectors[rows], dtype=np.float32)
+    norms = getattr(gensim_model, 'norms', None)
+    norms = norms[rows] if norms is not None else np.linalg.norm(gensim_model.vectors[rows], axis=1)
+
+    emb.save_embeddings(out_dir, vectors_norm, norms, words, source + ' (pruned)')
+
+    with open(os.path.join(out_dir, DROPPED_FILE), 'w', encoding='utf-8') as dropped_out:
+        dropped_out.write('word\treason\tlemma\n')
+        for word, reason, lemma in dropped:
+            dropped_out.write(word + '\t' + reason + '\t' + lemma + '\n')
+
+    # The manifest records everything needed to check that a rebuild gives the same result.
+    reasons = {}
+    for word, reason, lemma in dropped:
+        reasons[reason] = reasons.get(reason, 0) + 1
+    manifest = {
+        'source': source,
+        'source_vocab_size': len(gensim_model.index2word),
+        'max_rank': max_rank,
+        'kept': len(words),
+        'dropped': reasons,
+        'main_words': len(main_words),
+        'main_words_missing': reasons.get('main_word_missing', 0),
+        'vocab_sha256': hashlib.sha256('\n'.join(words).encode('utf-8')).hexdigest()
+    }
+    with open(os.path.join(out_dir, MANIFEST_FILE), 'w', encoding='utf-8') as manifest_out:
+        json.dump(manifest, manifest_out, indent=2)
+
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a reduced embedding table containing only taboo-eligible words.')
+    parser.add_argument('source', help='binary word2vec file or directory converted by embeddings.py')
+    parser.add_argument('out_dir', help='directory to write the pruned embeddings to')
+    parser.add_argument('--max-rank', type=int, default=None, help='only consider the N most frequent entries')
+    parser.add_argument('--cards', default=gspd.CARDS_FILE, help='transcribed cards whose main words are always kept')
+    args = parser.parse_args()
+
+    main_words = [mw for mw, tws in gspd.iter_cards(args.cards)] if os.path.exists(args.cards) else []
+    if not main_words:
+        print('Warning: no main words read from', args.cards, file=sys.stderr)
+
+    model = emb.load_model(args.source, use_neighbour_table=False)
+    manifest = build_pruned_embeddings(model, args.out_dir, args.max_rank, source=os.path.basename(args.source.rstrip('/')),
+                                       main_words=main_words)
+    print('Kept', manifest['kept'], 'of', manifest['source_vocab_size'], 'words; dropped:', manifest['dropped'])
+    if manifest['main_words_missing']:
+        print('Warning: %d of the %d main words are not in the vocabulary (see %s)' %
+              (manifest['main_words_missing'], manifest['main_words'], os.path.join(args.out_dir, DROPPED_FILE)),
+              file=sys.stderr)
@@ -0,0 +1,33 @@
+import numpy as np
+import ann
+import embeddings as emb
+import neighbours as nb
+
+
+def test_probing_every_list_finds_the_exact_neighbours():
+    model = emb.synthetic_embeddings(1000, 16, seed=0)
+    index = ann.IVFIndex.build(model, n_lists=16, seed=0)
+    queries = np.asarray(model.vectors_norm[::50])
+
+    exact_rows, exact_sims = nb.top_k_rows(queries, np.asarray(model.vectors_norm), 10)
+    results = index.search(queries, 10, n_probe=16)
+    for (rows, sims), expected_rows, expected_sims in zip(results, exact_rows, exact_sims):
+        assert np.array_equal(rows, expected_rows)
+        assert np.allclose(sims, expected_sims, atol=1e-6)
+
+    # Every word is in exactly one list.
+    assert np.array_equal(np.sort(index.list_rows), np.arange(1000))
+
+
+def test_save_and_load(tmp_path):
+    model = emb.synthetic_embeddings(500, 16, seed=1)
+    index = ann.IVFIndex.build(model, n_lists=8, n_probe=3, seed=0)
+    filename = str(tmp_path / 'index.npz')
+    index.save(filename)
+
+    loaded = ann.IVFIndex.load(filename, model)
+    for name in ('centroids', 'list_offsets', 'list_rows'):
+        assert np.array_equal(getattr(loaded, name), getattr(index, name))
+    assert loaded.n_probe == 3
+    word = model.index2word[42]
+    assert loaded.most_similar(word, topn=5) == index.most_similar(word, topn=5)
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import bench_cards
+import card_service
+import cardgen as cg
+import embeddings as emb
+import neighbours as nb
+import semrel as sr
+
+
+PROB_DIST = {'collocation': 0.6, 'semrel_synonym': 0.4}
+
+
+@pytest.fixture
+def model():
+    model = emb.synthetic_embeddings(400, 16, seed=0)
+    bench_cards.install_wordnet_stub(model, seed=0)
+    return model
+
+
+def make_service(model, card_store_file=None, **kwargs):
+    engine = cg.CardEngine(model, prob_dist_dict=PROB_DIST, relation_index_file=None, deck_seed=7,
+                           card_store_file=card_store_file)
+    return card_service.CardService(engine, **kwargs)
+
+
+def run(service, *requests):
+    # Sends the (method, target, body) requests all at once and returns their (status, payload) answers.
+    async def main():
+        await service.start()
+        try:
+            return await asyncio.gather(*(service.handle(*request) for request in requests))
+        finally:
+            await service.stop()
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_share_one_neighbour_pass(model, monkeypatch):
+    calls = []
+    most_similar_batch_orig = nb.most_similar_batch
+
+    def most_similar_batch(mws, gensim_model, topn):
+        calls.append(sorted(mws))
+        return most_similar_batch_orig(mws, gensim_model, topn)
+
+    monkeypatch.setattr(nb, 'most_similar_batch', most_similar_batch)
+
+    mws = model.index2word[10:20]
+    service = make_service(model, max_wait_ms=200)
+    answers = run(service, *(('GET', '/card?mw=' + mw, b'') for mw in mws))
+
+    assert [status for status, payload in answers] == [200] * len(mws)
+    assert calls == [sorted(mws)]
+    assert service.stats()['batch_size']['count'] == 1
+
+
+def test_words_outside_the_vocabulary(model):
+    mw = model.index2word[3]
+    status, payload = run(make_service(model), ('GET', '/card?mw=notaword', b''))[0]
+    assert status == 404 and payload['mw'] == 'notaword'
+
+    status, payload = run(make_service(model), ('POST', '/cards', json.dumps({'mws': [mw, 'notaword']}).encode()))[0]
+    assert status == 200
+    assert payload['cards']['notaword'] is None and len(payload['cards'][mw]) == 5
+
+
+def test_same_seed_gives_the_same_card(model):
+    mw = model.index2word[5]
+    first = run(make_service(model), ('GET', '/card?mw=%s&seed=3' % mw, b''))[0]
+    # Alone in its batch or together with other words, the card only depends on the main word and the seed.
+    second = run(make_service(model), ('GET', '/card?mw=%s&seed=3' % mw, b''),
+                 *(('GET', '/card?mw=%s&seed=3' % other, b'') for other in model.index2word[30:40]))[0]
+    assert first == second and first[0] == 200
+
+
+def test_partial_cards_are_served(model, tmp_path):
+    mw = model.index2word[8]
+    service = make_service(model, card_store_file=str(tmp_path / 'cards.sqlite'))
+    service.engine.store.put(mw, 7, ['only'])
+    service.engine.store.put(model.index2word[9], 7, [])
+
+    answers = run(service, ('GET', '/card?mw=' + mw, b''), ('GET', '/card?mw=' + model.index2word[9], b''))
+    assert answers == [(200, {'mw': mw, 'tws': ['only']}), (200, {'mw': model.index2word[9], 'tws': []})]
+
+
+def test_stats(model):
+    service = make_service(model)
+    answers = run(service, *(('GET', '/card?mw=' + mw, b'') for mw in model.index2word[:6]))
+    assert [status for status, payload in answers] == [200] * 6
+
+    status, stats = asyncio.run(service.handle('GET', '/stats', b''))
+    assert status == 200
+    for stage in ('queue', 'neighbours', 'card', 'total'):
+        assert stats[stage]['unit'] == 'ms'
+    assert stats['total']['count'] == stats['card']['count'] == 6
+    assert sum(stats['batch_size']['buckets'].values()) == stats['batch_size']['count'] >= 1
+
+
+def test_relation_index_can_be_shared_by_threads(tmp_path):
+    filename = str(tmp_path / 'relations.sqlite')
+    conn = sqlite3.connect(filename)
+    conn.execute('CREATE TABLE semrels (word TEXT PRIMARY KEY, synonym TEXT, antonym TEXT, hypernym TEXT, hyponym TEXT)')
+    conn.executemany('INSERT INTO semrels VALUES (?, ?, ?, ?, ?)',
+                     [('w%d' % i, 's%d\tt%d' % (i, i), '', 'h%d' % i, '') for i in range(100)])
+    conn.commit()
+    conn.close()
+
+    index = sr.RelationIndex(filename)
+    with ThreadPoolExecutor(8) as executor:
+        found = list(executor.map(index.lookup, ['w%d' % (i % 100) for i in range(2000)]))
+    assert found[:100] == [{'semrel_synonym': {'s%d' % i, 't%d' % i}, 'semrel_antonym': set(),
+                            'semrel_hypernym': {'h%d' % i}, 'semrel_hyponym': set()} for i in range(100)]
+    assert found[100:] == found[:100] * 19
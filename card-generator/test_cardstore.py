@@ -0,0 +1,51 @@
+import cardstore as cs
+import embeddings as emb
+
+
+def test_round_trip(tmp_path):
+    store = cs.CardStore(str(tmp_path / 'cards.sqlite'), 'p', 'e')
+    store.put_many({'cat': ['dog', 'pet', 'fur', 'meow', 'kitten'], 'zzz': False, 'rare': []}, seed=1)
+
+    assert store.get_many(['cat', 'zzz', 'rare', 'missing'], seed=1) == {
+        'cat': ['dog', 'pet', 'fur', 'meow', 'kitten'], 'zzz': False, 'rare': []}
+    assert store.get('cat', seed=2) is None
+    assert store.stats()['hits'] == 3 and store.stats()['misses'] == 2
+
+
+def test_versions_share_one_file(tmp_path):
+    filename = str(tmp_path / 'cards.sqlite')
+    a = cs.CardStore(filename, 'p', 'model-a')
+    a.put('cat', 1, ['a'])
+    b = cs.CardStore(filename, 'p', 'model-b')
+    b.put('cat', 1, ['b'])
+
+    # Opening a store for another model leaves the first model's cards alone.
+    assert cs.CardStore(filename, 'p', 'model-a').get('cat', 1) == ['a']
+    assert b.get('cat', 1) == ['b']
+    assert len(a) == 2
+
+
+def test_least_recently_used_cards_are_evicted(tmp_path):
+    store = cs.CardStore(str(tmp_path / 'cards.sqlite'), max_entries=10)
+    for i in range(10):
+        store.put('w%d' % i, 0, ['t'])
+    # Reading w0 makes it the most recently used card.
+    store.get('w0', 0)
+    store.put('w10', 0, ['t'])
+
+    # Eviction goes down to 90% of the limit.
+    assert len(store) == 9
+    assert set(store.get_many(['w%d' % i for i in range(11)], 0)) == {'w0'} | {'w%d' % i for i in range(3, 11)}
+
+
+def test_model_hash_is_stable():
+    model = emb.synthetic_embeddings(300, 8, seed=0)
+    assert cs.model_hash(model) == cs.model_hash(emb.synthetic_embeddings(300, 8, seed=0))
+    assert cs.model_hash(model) != cs.model_hash(emb.synthetic_embeddings(300, 8, seed=1))
+
+
+def test_stored_does_not_count(tmp_path):
+    store = cs.CardStore(str(tmp_path / 'cards.sqlite'))
+    store.put('cat', 1, ['dog'])
+    assert store.stored(['cat', 'dog'], 1) == {'cat'}
+    assert store.stats()['hits'] == 0 and store.stats()['misses'] == 0
@@ -0,0 +1,37 @@
+import pytest
+import bench_cards
+import deck
+import embeddings as emb
+
+
+@pytest.fixture(scope='module')
+def emb_dir(tmp_path_factory):
+    model = emb.synthetic_embeddings(400, 16, seed=0)
+    emb_dir = str(tmp_path_factory.mktemp('emb') / 'synthetic')
+    emb.save_embeddings(emb_dir, model.vectors_norm, model.norms, model.index2word, 'synthetic')
+    # The workers are forked, so they answer from the stub too.
+    bench_cards.install_wordnet_stub(model, seed=0)
+    return emb_dir, model.index2word[::-5] + ['notaword'] + model.index2word[1:40:3]
+
+
+def build(words, emb_dir, n_workers):
+    return list(deck.build_deck(iter(words), n_workers, emb_dir, relation_index_file=None, chunk_size=4, deck_seed=7,
+                                prob_dist_dict={'collocation': 0.6, 'semrel_synonym': 0.4}))
+
+
+def test_deck_keeps_the_order_of_the_main_words(emb_dir):
+    emb_dir, words = emb_dir
+    cards = build(words, emb_dir, 2)
+    assert [mw for mw, tws in cards] == words
+    assert dict(cards)['notaword'] is False
+    assert all(len(tws) == 5 for mw, tws in cards if mw != 'notaword')
+
+
+def test_seeded_deck_does_not_depend_on_the_number_of_workers(emb_dir):
+    emb_dir, words = emb_dir
+    assert build(words, emb_dir, 1) == build(words, emb_dir, 2)
+
+
+def test_refuses_word2vec_files(tmp_path):
+    with pytest.raises(ValueError, match='not a converted embeddings directory'):
+        next(deck.build_deck(['cat'], 1, str(tmp_path / 'vectors.bin')))
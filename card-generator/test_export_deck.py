@@ -0,0 +1,59 @@
+import pytest
+import bench_cards
+import embeddings as emb
+import export_deck as ed
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_after(words, n):
+    # Yields the first n words and then fails, like an export killed halfway through.
+    for i, word in enumerate(words):
+        if i == n:
+            raise Interrupted()
+        yield word
+
+
+@pytest.fixture(scope='module')
+def emb_dir(tmp_path_factory):
+    model = emb.synthetic_embeddings(400, 16, seed=0)
+    emb_dir = str(tmp_path_factory.mktemp('emb') / 'synthetic')
+    emb.save_embeddings(emb_dir, model.vectors_norm, model.norms, model.index2word, 'synthetic')
+    # The workers are forked, so they answer from the stub too.
+    bench_cards.install_wordnet_stub(model, seed=0)
+    return emb_dir, model.index2word[:60] + ['notaword'] + model.index2word[60:80]
+
+
+def export(words, output, emb_dir, **kwargs):
+    return ed.export_deck(words, str(output), checkpoint_every=10, n_workers=1, emb_dir=emb_dir,
+                          prob_dist_dict={'collocation': 0.6, 'semrel_synonym': 0.4}, relation_index_file=None,
+                          chunk_size=4, deck_seed=7, **kwargs)
+
+
+@pytest.mark.parametrize('fmt', ['jsonl', 'csv'])
+def test_resumed_export_matches_a_clean_one(tmp_path, emb_dir, fmt):
+    emb_dir, words = emb_dir
+    clean = tmp_path / ('clean.' + fmt)
+    assert export(iter(words), clean, emb_dir) == {'skipped': 0, 'cards': 80, 'oov': 1}
+
+    resumed = tmp_path / ('resumed.' + fmt)
+    with pytest.raises(Interrupted):
+        export(interrupt_after(words, 45), resumed, emb_dir)
+    stats = export(iter(words), resumed, emb_dir)
+
+    assert stats['skipped'] > 0 and stats['skipped'] + stats['cards'] + stats['oov'] == len(words)
+    assert resumed.read_bytes() == clean.read_bytes()
+    assert (tmp_path / ('resumed.' + fmt + ed.OOV_SUFFIX)).read_text() == 'notaword\n'
+
+
+def test_refuses_to_resume_a_truncated_file(tmp_path, emb_dir):
+    emb_dir, words = emb_dir
+    output = tmp_path / 'deck.jsonl'
+    export(iter(words[:30]), output, emb_dir)
+    output.write_bytes(output.read_bytes()[:10])
+
+    with pytest.raises(ValueError, match='shorter'):
+        export(iter(words), output, emb_dir)
+    assert export(iter(words), output, emb_dir, restart=True)['cards'] == 80
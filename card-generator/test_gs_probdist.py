@@ -0,0 +1,70 @@
+import json
+import os
+import pytest
+import gs_probdist as gspd
+
+
+HEADER = 'mw,tw,semrel_synonym,semrel_antonym,semrel_hyponym,semrel_hypernym,collocation,cultural_ref,other\n'
+
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    # Start without any gold standards loaded by earlier tests, and from another directory than the sources.
+    monkeypatch.setattr(gspd, '_compiled', {})
+    source_dir = tmp_path / 'sources'
+    source_dir.mkdir()
+    monkeypatch.chdir(tmp_path)
+
+    csv_file = source_dir / 'gold.csv'
+    csv_file.write_text(HEADER + 'cat,dog,1,,,,,,\ncat,meow,,,,,1,,\n', encoding='utf-8')
+    cards_file = source_dir / 'cards.txt'
+    cards_file.write_text('cat\n-dog\n-meow\n-pet\n-fur\n-kitten\n', encoding='utf-8')
+    return [str(csv_file)], [str(cards_file)]
+
+
+def compiled_counts(csv_files, cards_files):
+    compiled = gspd.load_gold_standard(csv_files, cards_files)
+    return compiled['counts']['semrel_synonym'], compiled['counts']['collocation'], compiled['num_cards']
+
+
+def test_compiled_next_to_the_sources(sources):
+    csv_files, cards_files = sources
+    assert compiled_counts(csv_files, cards_files) == (1, 1, 1)
+
+    compiled_file = os.path.join(os.path.dirname(csv_files[0]), gspd.GS_COMPILED_FILE)
+    with open(compiled_file, encoding='utf-8') as json_in:
+        assert json.load(json_in)['prob_dist'] == {'semrel_synonym': 0.5, 'collocation': 0.5, 'semrel_antonym': 0.0,
+                                                   'semrel_hyponym': 0.0, 'semrel_hypernym': 0.0}
+    assert not os.path.exists(gspd.GS_COMPILED_FILE)
+
+
+@pytest.mark.parametrize('in_memory', [True, False])
+def test_recompiled_when_the_sources_change(sources, monkeypatch, in_memory):
+    csv_files, cards_files = sources
+    assert compiled_counts(csv_files, cards_files) == (1, 1, 1)
+
+    with open(csv_files[0], 'a', encoding='utf-8') as csv_out:
+        csv_out.write('cat,tabby,1,,,,,,\n')
+    if not in_memory:
+        # Like a new process, which only has the compiled file to go on.
+        monkeypatch.setattr(gspd, '_compiled', {})
+    assert compiled_counts(csv_files, cards_files) == (2, 1, 1)
+
+    with open(cards_files[0], 'a', encoding='utf-8') as cards_out:
+        cards_out.write('dog\n-cat\n-bark\n-pet\n-puppy\n-bone\n')
+    if not in_memory:
+        monkeypatch.setattr(gspd, '_compiled', {})
+    assert compiled_counts(csv_files, cards_files) == (2, 1, 2)
+
+
+def test_not_recompiled_when_the_sources_are_only_touched(sources, monkeypatch):
+    csv_files, cards_files = sources
+    compiled_counts(csv_files, cards_files)
+    os.utime(csv_files[0], ns=(0, 0))
+    monkeypatch.setattr(gspd, '_compiled', {})
+
+    def compile_gold_standard(*args):
+        raise AssertionError('compiled again')
+
+    monkeypatch.setattr(gspd, 'compile_gold_standard', compile_gold_standard)
+    assert compiled_counts(csv_files, cards_files) == (1, 1, 1)
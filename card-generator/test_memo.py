@@ -0,0 +1,95 @@
+import types
+import pytest
+import bench_cards
+import embeddings as emb
+import memo
+import semrel as sr
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # A clock that only moves when the test says so.
+    now = [0.0]
+    monkeypatch.setattr(memo, 'time', types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = memo.LRUCache(maxsize=3)
+    for key in 'abc':
+        cache.put(key, key.upper())
+    # Reading a makes b the least recently used entry.
+    assert cache.get('a') == (True, 'A')
+    cache.put('d', 'D')
+
+    assert cache.get('b') == (False, None)
+    assert [cache.get(key)[0] for key in 'acd'] == [True, True, True]
+    assert cache.stats()['evictions'] == 1
+
+    cache.resize(maxsize=1)
+    assert len(cache) == 1 and cache.get('d') == (True, 'D')
+    assert cache.stats()['evictions'] == 3
+
+
+def test_entries_expire(clock):
+    cache = memo.LRUCache(ttl=10)
+    cache.put('a', 1)
+    clock[0] = 10
+    assert cache.get('a') == (True, 1)
+    clock[0] = 10.5
+    assert cache.get('a') == (False, None)
+    assert len(cache) == 0 and cache.stats()['expirations'] == 1
+
+    # Storing a value again starts its time to live over.
+    cache.put('a', 2)
+    clock[0] = 20
+    assert cache.get('a') == (True, 2)
+
+
+def test_memoize_counts_and_freezes():
+    calls = []
+
+    @memo.memoize(maxsize=2, freeze=tuple)
+    def letters(word, upper=False):
+        calls.append(word)
+        return list(word.upper() if upper else word)
+
+    assert letters('ab') == ('a', 'b')
+    assert letters('ab') == ('a', 'b')
+    assert letters('ab', upper=True) == ('A', 'B')
+    assert letters('cd') == ('c', 'd')
+    assert letters('ab') == ('a', 'b')
+    assert calls == ['ab', 'ab', 'cd', 'ab']
+
+    stats = letters.cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['size']) == (1, 4, 2, 2)
+    assert stats['hit_rate'] == 0.2
+
+
+def test_semrel_caches():
+    model = emb.synthetic_embeddings(200, 8, seed=0)
+    bench_cards.install_wordnet_stub(model, seed=0)
+    word = model.index2word[0]
+
+    # Cached results are shared by all callers, so they can't be changed.
+    hits = sr.cache_stats()['make_semrel_dict']['hits']
+    semrel_dict = sr.make_semrel_dict(word)
+    with pytest.raises(TypeError):
+        semrel_dict['semrel_synonym'] = set()
+    with pytest.raises(AttributeError):
+        semrel_dict['semrel_synonym'].add('x')
+    assert sr.make_semrel_dict(word) is semrel_dict
+    assert sr.cache_stats()['make_semrel_dict']['hits'] == hits + 1
+
+    try:
+        sr.configure_caches(maxsize=5)
+        for other in model.index2word[:20]:
+            sr.make_semrel_dict(other)
+        assert sr.cache_stats()['make_semrel_dict']['size'] == 5
+        assert all(stats['maxsize'] == 5 for stats in sr.cache_stats().values())
+    finally:
+        sr.configure_caches(maxsize=sr.CACHE_SIZE)
+
+    sr.clear_caches()
+    assert all(stats['size'] == 0 for stats in sr.cache_stats().values())
+    assert sr.make_semrel_dict(word) is not semrel_dict
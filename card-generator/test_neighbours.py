@@ -0,0 +1,45 @@
+import numpy as np
+import embeddings as emb
+import neighbours as nb
+
+
+def brute_force(model, word):
+    # Every other word, most similar first.
+    row = model.vocab[word]
+    sims = np.dot(np.asarray(model.vectors_norm), np.asarray(model.vectors_norm[row]))
+    order = [j for j in np.argsort(-sims, kind='stable') if j != row]
+    return np.array(order), sims[order]
+
+
+def test_most_similar_batch_matches_brute_force():
+    model = emb.synthetic_embeddings(800, 16, seed=2)
+    words = model.index2word[:5]
+    similar = nb.most_similar_batch(words, model, topn=20)
+    for word in words:
+        rows, sims = brute_force(model, word)
+        assert [w for w, s in similar[word]] == [model.index2word[j] for j in rows[:20]]
+
+
+def test_iter_similar_rows_matches_brute_force():
+    model = emb.synthetic_embeddings(1000, 16, seed=0)
+    for word in model.index2word[::97]:
+        chunks = list(nb.iter_similar_rows(word, model, chunk_size=32))
+        rows, sims = brute_force(model, word)
+
+        assert np.array_equal(np.concatenate([r for r, s in chunks]), rows)
+        assert np.allclose(np.concatenate([s for r, s in chunks]), sims, atol=1e-6)
+
+        # The chunks end at 32, 64, 128, ... candidates, and the last one at the end of the vocabulary.
+        ends = np.cumsum([len(r) for r, s in chunks])
+        assert list(ends[:-1]) == [32 * 2 ** k for k in range(len(chunks) - 1)]
+        assert ends[-1] == len(model.index2word) - 1
+
+
+def test_iter_similar_rows_continues_after_precomputed_neighbours():
+    model = emb.synthetic_embeddings(500, 16, seed=1)
+    word = model.index2word[7]
+    rows, sims = brute_force(model, word)
+    neighbours = [(model.index2word[j], float(s)) for j, s in zip(rows[:10], sims[:10])]
+
+    chunks = list(nb.iter_similar_rows(word, model, neighbours=neighbours, chunk_size=32))
+    assert np.array_equal(np.concatenate([r for r, s in chunks]), rows)
@@ -0,0 +1,55 @@
+import json
+import pytest
+import profiling as prof
+
+
+@pytest.fixture(autouse=True)
+def fresh_profile():
+    prof.disable()
+    prof.reset()
+    yield
+    prof.disable()
+    prof.reset()
+
+
+def work():
+    with prof.request('card', mw='cat'):
+        with prof.stage('neighbours'):
+            prof.count('rows', 3)
+        prof.count('rows')
+        # A request inside another one is only a stage of it.
+        with prof.request('inner'):
+            pass
+
+
+def test_disabled_records_nothing():
+    work()
+    assert prof.report() == {'stages': {}, 'counters': {}, 'traces': []}
+
+
+def test_report(tmp_path):
+    prof.enable()
+    work()
+    work()
+
+    report = prof.report()
+    assert sorted(report['stages']) == ['inner', 'neighbours', 'request:card']
+    assert all(stats['count'] == 2 for stats in report['stages'].values())
+    assert report['counters'] == {'rows': 8}
+
+    assert len(report['traces']) == 2
+    trace = report['traces'][0]
+    assert (trace['name'], trace['info'], trace['counters']) == ('card', {'mw': 'cat'}, {'rows': 4})
+    assert [(s['name'], s['depth']) for s in trace['stages']] == [('neighbours', 0), ('inner', 0)]
+    assert trace['peak_memory_bytes'] is None
+
+    filename = str(tmp_path / 'profile.json')
+    prof.export_json(filename, traces=False)
+    with open(filename, encoding='utf-8') as json_in:
+        exported = json.load(json_in)
+    assert exported == {'stages': report['stages'], 'counters': report['counters']}
+
+    # Disabling keeps what has been recorded, but records nothing more.
+    prof.disable()
+    work()
+    assert prof.report() == report
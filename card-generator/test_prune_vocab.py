@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pytest
+import embeddings as emb
+import prune_vocab as pv
+import semrel as sr
+
+
+# In frequency order. With max_rank=9, Apple is beyond the rank cap.
+VOCAB = ['cats', 'cat', 'New_York', 'Paris', 'b2b', 'mice', 'well-known', 'mouses', 'dog', 'Apple']
+MAIN_WORDS = ['cats', 'Paris', 'Apple', 'zebra']
+
+# Each kept word and the row it is kept from: inflected forms fold into their lemma (the lemma's own row if it has one,
+# else that of its most frequent form), and main words are kept as they are.
+KEPT = [('cats', 0), ('cat', 1), ('Paris', 3), ('mouse', 5), ('well-known', 6), ('dog', 8), ('Apple', 9)]
+DROPPED = [('New_York', 'phrase', ''), ('b2b', 'not_a_word', ''), ('mouses', 'lemma_duplicate', 'mouse'),
+           ('rows 9-9', 'rank_cap', ''), ('zebra', 'main_word_missing', '')]
+
+
+class DictLemmatizer:
+    # Lemmatises only the words it was told about.
+    lemmas = {'cats': 'cat', 'mice': 'mouse', 'mouses': 'mouse'}
+
+    def lemmatize(self, word):
+        return self.lemmas.get(word, word)
+
+
+@pytest.fixture
+def model():
+    sr.set_lemmatizer(DictLemmatizer())
+    yield emb.synthetic_embeddings(len(VOCAB), 8, words=VOCAB, seed=0)
+    sr.set_lemmatizer(None)
+
+
+def test_drop_reason():
+    assert [pv.drop_reason(word) for word in ('cat', 'well-known', 'New_York', 'Paris', 'b2b', '-cat')] == [
+        None, None, 'phrase', 'not_lowercase', 'not_a_word', 'not_a_word']
+
+
+def test_prune_vocab(model):
+    rows, words, dropped = pv.prune_vocab(model, max_rank=9, main_words=MAIN_WORDS)
+    assert list(zip(words, rows)) == KEPT
+    assert dropped == DROPPED
+
+    # Without main words, the inflected, capitalised and out-of-rank ones are dropped like any other.
+    rows, words, dropped = pv.prune_vocab(model, max_rank=9)
+    assert words == ['cat', 'mouse', 'well-known', 'dog']
+    assert ('cats', 'lemma_duplicate', 'cat') in dropped and ('Paris', 'not_lowercase', '') in dropped
+
+
+def test_build_pruned_embeddings(model, tmp_path):
+    out_dir = str(tmp_path / 'pruned')
+    manifest = pv.build_pruned_embeddings(model, out_dir, max_rank=9, source='synthetic', main_words=MAIN_WORDS)
+
+    words = [word for word, row in KEPT]
+    assert manifest == {
+        'source': 'synthetic',
+        'source_vocab_size': len(VOCAB),
+        'max_rank': 9,
+        'kept': len(KEPT),
+        'dropped': {'phrase': 1, 'not_a_word': 1, 'lemma_duplicate': 1, 'rank_cap': 1, 'main_word_missing': 1},
+        'main_words': 4,
+        'main_words_missing': 1,
+        'vocab_sha256': hashlib.sha256('\n'.join(words).encode('utf-8')).hexdigest()
+    }
+    with open(os.path.join(out_dir, pv.MANIFEST_FILE), encoding='utf-8') as manifest_in:
+        assert json.load(manifest_in) == manifest
+    with open(os.path.join(out_dir, pv.DROPPED_FILE), encoding='utf-8') as dropped_in:
+        assert dropped_in.read().splitlines() == ['word\treason\tlemma'] + ['\t'.join(entry) for entry in DROPPED]
+
+    pruned = emb.load_embeddings(out_dir)
+    assert pruned.index2word == words
+    rows = [row for word, row in KEPT]
+    assert np.allclose(pruned.vectors_norm, model.vectors_norm[rows])
+    assert np.allclose(pruned.norms, model.norms[rows])
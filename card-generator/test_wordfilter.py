@@ -0,0 +1,48 @@
+import random
+import numpy as np
+import wordfilter as wf
+
+
+def levenshtein(a, b):
+    # The textbook dynamic programme, to check the faster versions against.
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (a[i - 1] != b[j - 1]))
+        prev = cur
+    return prev[len(b)]
+
+
+def random_words(rng, n, max_len, alphabet='abcde'):
+    return [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, max_len))) for _ in range(n)]
+
+
+def test_bounded_edit_distance_matches_levenshtein():
+    rng = random.Random(0)
+    for a, b in zip(random_words(rng, 500, 10), random_words(rng, 500, 10)):
+        for max_dist in range(6):
+            assert wf.bounded_edit_distance(a, b, max_dist) == min(levenshtein(a, b), max_dist + 1)
+
+
+def test_exceeds_edit_distance_matches_levenshtein():
+    rng = random.Random(1)
+    candidates = random_words(rng, 300, 14)
+    for word in random_words(rng, 40, 14) + ['', 'abcdeabcdeabcde']:
+        distances = np.array([levenshtein(word, c) for c in candidates])
+        for max_dist in range(6):
+            assert (wf.exceeds_edit_distance(word, candidates, max_dist) == (distances > max_dist)).all()
+
+
+def test_exceeds_edit_distance_non_ascii_and_long_words():
+    rng = random.Random(2)
+    # Characters outside ASCII, and words longer than the 64 bits of the bit vectors (the fallback).
+    for max_len, alphabet in ((8, 'aéßж'), (70, 'ab')):
+        candidates = random_words(rng, 100, max_len, alphabet)
+        for word in random_words(rng, 10, max_len, alphabet):
+            distances = np.array([levenshtein(word, c) for c in candidates])
+            assert (wf.exceeds_edit_distance(word, candidates, 4) == (distances > 4)).all()
+
+
+def test_exceeds_edit_distance_no_candidates():
+    assert wf.exceeds_edit_distance('word', []).shape == (0,)
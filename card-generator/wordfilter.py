@@ -0,0 +1,159 @@
+import weakref
+import numpy as np
+
+
+# The phrase masks of the models seen so far (see phrase_mask()), dropped together with their model.
+_phrase_masks = weakref.WeakKeyDictionary()
+
+_ONE = np.uint64(1)
+
+
+def bounded_edit_distance(a, b, max_dist):
+    """
+    Computes the Levenshtein distance between two strings, but only as far as needed to tell whether it is larger
+    than max_dist: only the diagonal band of width 2 * max_dist + 1 is filled in, and the computation stops as soon
+    as a whole row exceeds max_dist.
+
+    Args:
+        a: A string.
+        b: A string.
+        max_dist: An integer, the largest distance of interest.
+    Returns:
+        The Levenshtein distance if it is at most max_dist, else max_dist + 1.
+    """
+    if abs(len(a) - len(b)) > max_dist:
+        return max_dist + 1
+
+    too_far = max_dist + 1
+    prev = [j if j <= max_dist else too_far for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        lo = max(1, i - max_dist)
+        hi = min(len(b), i + max_dist)
+        cur = [too_far] * (len(b) + 1)
+        cur[0] = i if i <= max_dist else too_far
+        for j in range(lo, hi + 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (a[i - 1] != b[j - 1]), too_far)
+        if min(cur[lo - 1:hi + 1]) > max_dist:
+            return too_far
+        prev = cur
+    return prev[len(b)]
+
+
+def exceeds_edit_distance(word, candidates, max_dist=4):
+    """
+    Checks for a whole array of candidate strings at once whether their Levenshtein distance from word is larger than
+    max_dist (the same distance as nltk.metrics.edit_distance() with its default arguments). Candidates whose length
+    alone differs by more than max_dist are decided without computing anything; the others are processed together,
+    one character position at a time, with the bit-parallel algorithm of Myers (1999) in the form given by Hyyrö
+    (2001), and the computation stops early once all of them are known to be too far away.
+
+    Args:
+        word: A string.
+        candidates: A sequence (list or numpy array) of strings.
+        max_dist: (default 4) an integer.
+    Returns:
+        A boolean numpy array, True where the candidate's distance from word is larger than max_dist.
+    """
+    candidates = np.asarray(candidates, dtype=str)
+    lengths = np.char.str_len(candidates) if len(candidates) else np.zeros(0, dtype=np.int64)
+    m = len(word)
+
+    # The difference in length is a lower bound of the distance.
+    result = np.abs(lengths - m) > max_dist
+    todo = np.flatnonzero(~result)
+    if len(todo) == 0:
+        return result
+    if m == 0:
+        result[todo] = lengths[todo] > max_dist
+        return result
+
+    # The bit vectors hold one bit per character of word, so longer words are compared one candidate at a time.
+    if m > 64:
+        result[todo] = [bounded_edit_distance(word, str(c), max_dist) > max_dist for c in candidates[todo]]
+        return result
+
+    sub = candidates[todo]
+    sub_len = lengths[todo]
+    width = int(sub_len.max())
+    if width == 0:
+        result[todo] = m > max_dist
+        return result
+    codes = np.ascontiguousarray(sub).view(np.uint32).reshape(len(sub), -1)[:, :width]
+
+    # eq[k, j] has bit i set where character j of candidate k equals character i of word.
+    eq = np.zeros(codes.shape, dtype=np.uint64)
+    for char in set(word):
+        bits = sum(1 << i for i, c in enumerate(word) if c == char)
+        eq[codes == ord(char)] |= np.uint64(bits)
+
+    mask = np.uint64((1 << m) - 1)
+    high = np.uint64(1 << (m - 1))
+    vp = np.full(len(sub), mask, dtype=np.uint64)
+    vn = np.zeros(len(sub), dtype=np.uint64)
+    score = np.full(len(sub), m, dtype=np.int64)
+
+    for j in range(width):
+        active = j < sub_len
+        e = eq[:, j]
+        xv = e | vn
+        xh = ((((e & vp) + vp) & mask) ^ vp) | e
+        ph = vn | (~(xh | vp) & mask)
+        mh = vp & xh
+        score += active & ((ph & high) != 0)
+        score -= active & ((mh & high) != 0)
+        ph = ((ph << _ONE) | _ONE) & mask
+        mh = (mh << _ONE) & mask
+        vp = np.where(active, mh | (~(xv | ph) & mask), vp)
+        vn = np.where(active, ph & xv, vn)
+
+        # Each remaining character can lower the distance by at most one.
+        if np.all(score - (sub_len - j - 1) > max_dist):
+            break
+
+    result[todo] = score > max_dist
+    return result
+
+
+def phrase_mask(gensim_model):
+    """
+    Returns a boolean array over the embedding vocabulary that is True for multi-word entries (those containing an
+    underscore). It is computed once per model.
+
+    Arg:
+        gensim_model: The pre-trained word embeddings.
+    Returns:
+        A 1D boolean numpy array with one entry per vocabulary row.
+    """
+    mask = _phrase_masks.get(gensim_model)
+    if mask is None:
+        index2word = gensim_model.index2word
+        mask = np.fromiter(('_' in w for w in index2word), dtype=bool, count=len(index2word))
+        _phrase_masks[gensim_model] = mask
+    return mask
+
+
+def keep_mask(word, candidates, forbidden_wds, max_dist=4):
+    """
+    Applies the collocate filter of semrel.get_collocations() to a whole array of (lemmatised) candidates: a candidate
+    is kept if it doesn't contain the main word, isn't forbidden, and is more than max_dist edits away from the main
+    word. The cheap checks run first, so the edit distance is only computed for the candidates still left.
+
+    Args:
+        word: A string, the main word.
+        candidates: A sequence of strings.
+        forbidden_wds: A set of strings that may not be kept.
+        max_dist: (default 4) an integer.
+    Returns:
+        A boolean numpy array, True for the candidates to keep.
+    """
+    candidates = np.asarray(candidates, dtype=str)
+    if len(candidates) == 0:
+        return np.zeros(0, dtype=bool)
+
+    keep = np.char.find(np.char.lower(candidates), word) < 0
+    if forbidden_wds:
+        keep &= ~np.isin(candidates, list(forbidden_wds))
+
+    left = np.flatnonzero(keep)
+    keep[left] = exceeds_edit_distance(word, candidates[left], max_dist)
+    return keep
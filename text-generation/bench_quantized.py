@@ -0,0 +1,109 @@
+import argparse
+import io
+import json
+import math
+import time
+import torch
+import torch.nn as nn
+import gru_decoder as gd
+import train_gru as tg
+
+
+def model_size(decoder):
+    """
+    Returns the number of bytes the decoder's state_dict takes when saved.
+    """
+    buffer = io.BytesIO()
+    torch.save(decoder.state_dict(), buffer)
+    return buffer.tell()
+
+
+def tokens_per_sec(engine, primes, predict_len=100, n_candidates=1, seed=0):
+    """
+    Measures how many tokens per second an engine generates.
+
+    Args:
+        engine: A gru_decoder.DecodingEngine.
+        primes: A list of primes (strings of at least two words from the vocabulary).
+        predict_len: (default 100) the number of tokens to generate per text.
+        n_candidates: (default 1) 1 to generate the texts one after the other, or the number of texts to generate
+           per prime in one batch (one batch per prime).
+        seed: (default 0) the seed of the sampling.
+    Returns:
+        A float.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    start = time.perf_counter()
+    for prime_str in primes:
+        engine.generate_batch([prime_str], predict_len, n_candidates=n_candidates, generator=generator)
+    return len(primes) * predict_len * n_candidates / (time.perf_counter() - start)
+
+
+def benchmark(decoder, vocab, heldout, n_primes=20, predict_len=100, n_candidates=16, batch_size=1024,
+              hidden_state='carry'):
+    """
+    Compares a decoder with its int8 copy (see gru_decoder.quantize() ).
+
+    Args:
+        decoder: A GRU.
+        vocab: The vocabulary.Vocabulary of the decoder.
+        heldout: A train_gru.TrigramDataset of trigrams the decoder wasn't trained on (see train_gru.heldout_split() ).
+        n_primes: (default 20) the number of texts to time generation with, primed with the contexts of the first
+           held-out trigrams.
+        predict_len: (default 100) the number of tokens per generated text.
+        n_candidates: (default 16) the number of texts per prime in the batched timing.
+        batch_size: (default 1024) the number of trigrams per batch when computing the perplexity.
+        hidden_state: (default 'carry') how to generate: 'carry' or 'reset' (see gru_decoder.DecodingEngine).
+    Returns:
+        A dictionary with, for 'fp32' and 'int8', the size of the weights, the perplexity on the held-out trigrams
+        (each predicted from a fresh hidden state, as in training) and the tokens per second generating one text at a
+        time and in batches; and the number of held-out trigrams.
+    """
+    loader = tg.make_loader(heldout, batch_size, shuffle=False)
+    primes = [' '.join(words) for words in vocab.words(heldout.contexts[:n_primes])]
+
+    results = {'heldout_trigrams': len(heldout)}
+    for name, model in (('fp32', decoder), ('int8', gd.quantize(decoder))):
+        engine = gd.DecodingEngine(model, vocab, hidden_state)
+        # One short run first, so that one-off set-up costs aren't measured.
+        tokens_per_sec(engine, primes[:1], 5)
+        results[name] = {
+            'size_mb': model_size(model) / 2**20,
+            'perplexity': math.exp(tg.evaluate_loss(model, loader, nn.CrossEntropyLoss())),
+            'tokens_per_sec': tokens_per_sec(engine, primes, predict_len),
+            'batched_tokens_per_sec': tokens_per_sec(engine, primes, predict_len, n_candidates)
+        }
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare int8 (dynamically quantised) and fp32 inference of the GRU.')
+    parser.add_argument('bundle', help='model bundle saved by train_gru.py --valid ... --bundle')
+    parser.add_argument('--trigrams', default=None, help='the trigrams the model was trained on, if they have moved')
+    parser.add_argument('--primes', type=int, default=20, help='number of texts to time generation with')
+    parser.add_argument('--tokens', type=int, default=100, help='tokens per generated text')
+    parser.add_argument('--candidates', type=int, default=16, help='texts per prime in the batched timing')
+    parser.add_argument('--threads', type=int, default=1, help='torch threads (1 = one generator worker per core)')
+    parser.add_argument('--json', default=None, help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    decoder, vocab, metadata = gd.load_bundle(args.bundle)
+    # Only the trigrams train_gru.py held out are used, so the perplexity is measured on text the model hasn't seen.
+    heldout = tg.heldout_split(metadata, vocab, args.trigrams)
+    results = benchmark(decoder, vocab, heldout, args.primes, args.tokens, args.candidates,
+                        hidden_state=metadata.get('hidden_state', 'carry'))
+
+    print('%d held-out trigrams' % results['heldout_trigrams'])
+    for name in ('fp32', 'int8'):
+        r = results[name]
+        print('%s  %6.1f MB   perplexity %8.1f   %7.1f tokens/sec   %8.1f tokens/sec batched' %
+              (name, r['size_mb'], r['perplexity'], r['tokens_per_sec'], r['batched_tokens_per_sec']))
+    print('int8/fp32: x%.2f tokens/sec, x%.2f batched, perplexity %+.1f%%' % (
+        results['int8']['tokens_per_sec'] / results['fp32']['tokens_per_sec'],
+        results['int8']['batched_tokens_per_sec'] / results['fp32']['batched_tokens_per_sec'],
+        100 * (results['int8']['perplexity'] / results['fp32']['perplexity'] - 1)))
+
+    if args.json is not None:
+        with open(args.json, 'w', encoding='utf-8') as json_out:
+            json.dump(results, json_out, indent=2)
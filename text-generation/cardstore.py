@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+
+# Bump this whenever a change to the card generator makes previously stored cards invalid.
+STORE_VERSION = 1
+
+CARD_STORE_FILE = 'cards.sqlite'
+
+
+def probdist_hash(prob_dist_dict):
+    """
+    Fingerprints a probability distribution of semantic relation labels (so it changes whenever the gold standard
+    it was computed from changes in a way that matters for the cards).
+
+    Arg:
+        prob_dist_dict: a dictionary with semantic relation labels as keys and their probability as values.
+    Returns:
+        A hex string.
+    """
+    items = sorted((label, round(float(prob), 12)) for label, prob in prob_dist_dict.items())
+    return hashlib.sha256(json.dumps(items).encode('utf-8')).hexdigest()
+
+
+def model_hash(gensim_model, n_samples=64):
+    """
+    Fingerprints word embeddings (or a neighbour table / ANN index over them) from their type, vocabulary size, a
+    sample of the vocabulary and a sample of rows of the underlying arrays, without reading all of them. Only arrays
+    that are there from the moment the model is loaded are sampled: gensim only computes vectors_norm on the first
+    similarity query, so that is only used for models that are stored normalised with their norms alongside (like
+    embeddings.Embeddings, whose vectors would have to be computed in full).
+
+    Args:
+        gensim_model: The pre-trained word embeddings.
+        n_samples: (default 64) the number of words and rows to sample.
+    Returns:
+        A hex string.
+    """
+    h = hashlib.sha256()
+    index2word = gensim_model.index2word
+    h.update(type(gensim_model).__name__.encode('utf-8'))
+    h.update(str(len(index2word)).encode('utf-8'))
+
+    # Sample evenly spaced rows through the whole vocabulary.
+    rows = np.unique(np.linspace(0, len(index2word) - 1, n_samples).astype(np.int64))
+    for row in rows:
+        h.update(index2word[row].encode('utf-8') + b'\n')
+
+    vectors = 'vectors_norm' if getattr(gensim_model, 'norms', None) is not None else 'vectors'
+    for name in (vectors, 'norms', 'nbr_idx', 'nbr_sim', 'centroids'):
+        array = getattr(gensim_model, name, None)
+        if array is not None:
+            h.update(np.ascontiguousarray(array[rows[rows < len(array)]]).tobytes())
+
+    return h.hexdigest()
+
+
+class CardStore:
+    """
+    A persistent store of generated cards in an SQLite file, keyed by main word, deck seed and version (the probability
+    distribution, model and settings the card was generated with). Several versions can share one file, e.g. services
+    running with different embeddings: each only sees its own cards, and cards of versions nobody uses any more age out
+    like any other. The store holds at most max_entries cards; beyond that the least recently used cards are evicted.
+
+    Only seeded cards are stored, since only those are meant to come out the same every time.
+    """
+
+    def __init__(self, filename=CARD_STORE_FILE, prob_hash='', emb_hash='', max_entries=100000, options=''):
+        """
+        Args:
+            filename: (default 'cards.sqlite') path of the SQLite file (created if needed).
+            prob_hash: the probdist_hash() of the probability distribution the cards are generated with.
+            emb_hash: the model_hash() of the embeddings the cards are generated with.
+            max_entries: (default 100000) the maximum number of cards to keep.
+            options: (default '') a string naming any other settings that change the cards.
+        """
+        self.filename = filename
+        self.version = '%d:%s:%s:%s' % (STORE_VERSION, prob_hash, emb_hash, options)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        with self._lock:
+            conn = self._connection()
+            conn.execute('CREATE TABLE IF NOT EXISTS cards (mw TEXT, seed INTEGER, version TEXT, tws TEXT, '
+                         'last_access REAL, PRIMARY KEY (mw, seed, version))')
+            conn.execute('CREATE INDEX IF NOT EXISTS cards_last_access ON cards (last_access)')
+            conn.commit()
+
+    def _connection(self):
+        # Each process opens its own connection (e.g. the deck builder's workers share one store file).
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.filename, timeout=30, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._pid = os.getpid()
+        return self._conn
+
+    def get_many(self, mws, seed):
+        """
+        Looks up the stored cards for a list of main words.
+
+        Args:
+            mws: A list of strings, the main words.
+            seed: An integer, the deck seed.
+        Returns:
+            A dictionary with the main words that were found as keys and their taboo word lists (or False, for words
+            that weren't in the vocabulary) as values.
+        """
+        found = {}
+        with self._lock:
+            conn = self._connection()
+
+            # Query in slices, since SQLite limits the number of parameters per statement.
+            for start in range(0, len(mws), 500):
+                part = mws[start:start + 500]
+                query = ('SELECT mw, tws FROM cards WHERE seed = ? AND version = ? AND mw IN (%s)' %
+                         ', '.join('?' * len(part)))
+                for mw, tws in conn.execute(query, [seed, self.version] + part):
+                    found[mw] = json.loads(tws)
+
+            if found:
+                now = time.time()
+                conn.executemany('UPDATE cards SET last_access = ? WHERE mw = ? AND seed = ? AND version = ?',
+                                 [(now, mw, seed, self.version) for mw in found])
+                conn.commit()
+
+        self.hits += len(found)
+        self.misses += len(set(mws)) - len(found)
+        return found
+
+    def stored(self, mws, seed):
+        """
+        Checks which of a list of main words have a stored card, without counting hits and misses or touching the
+        cards' last access (e.g. to skip preparing work for the cards the store is going to serve).
+
+        Args:
+            mws: A list of strings, the main words.
+            seed: An integer, the deck seed.
+        Returns:
+            The set of the main words that have a stored card.
+        """
+        found = set()
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(mws), 500):
+                part = mws[start:start + 500]
+                query = ('SELECT mw FROM cards WHERE seed = ? AND version = ? AND mw IN (%s)' %
+                         ', '.join('?' * len(part)))
+                found.update(mw for mw, in conn.execute(query, [seed, self.version] + part))
+        return found
+
+    def get(self, mw, seed):
+        """
+        Looks up the stored card for one main word.
+
+        Args:
+            mw: A string, the main word.
+            seed: An integer, the deck seed.
+        Returns:
+            The list of taboo words (False if the word wasn't in the vocabulary), or None if no card is stored.
+        """
+        return self.get_many([mw], seed).get(mw)
+
+    def put_many(self, cards, seed):
+        """
+        Stores cards, evicting the least recently used ones if the store gets too big.
+
+        Args:
+            cards: A dictionary with main words as keys and taboo word lists (or False) as values.
+            seed: An integer, the deck seed.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.executemany('INSERT OR REPLACE INTO cards VALUES (?, ?, ?, ?, ?)',
+                             [(mw, seed, self.version, json.dumps(tws), now) for mw, tws in cards.items()])
+
+            # Evict down to 90% of the limit, so that eviction doesn't have to run on every single insert.
+            n_cards = conn.execute('SELECT COUNT(*) FROM cards').fetchone()[0]
+            if n_cards > self.max_entries:
+                conn.execute('DELETE FROM cards WHERE rowid IN (SELECT rowid FROM cards ORDER BY last_access LIMIT ?)',
+                             (n_cards - int(0.9 * self.max_entries),))
+            conn.commit()
+
+    def put(self, mw, seed, tws):
+        """
+        Stores one card.
+
+        Args:
+            mw: A string, the main word.
+            seed: An integer, the deck seed.
+            tws: The list of taboo words (or False).
+        """
+        self.put_many({mw: tws}, seed)
+
+    def __len__(self):
+        # All the cards in the file, of every version (that is what max_entries limits).
+        with self._lock:
+            return self._connection().execute('SELECT COUNT(*) FROM cards').fetchone()[0]
+
+    def clear(self):
+        """
+        Removes all stored cards.
+        """
+        with self._lock:
+            conn = self._connection()
+            conn.execute('DELETE FROM cards')
+            conn.commit()
+
+    def stats(self):
+        """
+        Returns the store's statistics.
+
+        Returns:
+            A dictionary with the number of stored cards, the limit, and the hit and miss counts of this process.
+        """
+        return {'size': len(self), 'max_entries': self.max_entries, 'hits': self.hits, 'misses': self.misses}
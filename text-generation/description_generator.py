@@ -1,7 +1,4 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import nltk
-import pandas as pd
 from random import sample
 import string
 import torch
@@ -12,9 +9,14 @@ import os
 import time
 import gs_probdist as gspd
 import semrel as sr
-import gensim
 import cardgen as cg
+import profiling as prof
+import gru_decoder as gd
+from gru_decoder import GRU
+from vocabulary import Vocabulary
 
+#steps through all trigrams as one sequence, with one optimiser step per epoch; for training on large corpora, use
+#train_gru.py (shuffled mini-batches)
 def train(context, target):
     hidden = decoder.init_hidden()
     decoder.zero_grad()
@@ -29,7 +31,8 @@ def train(context, target):
 
     return loss.data.item() / len(trigrams)
 
-def model_selection(x):
+#quantized = True returns an int8 copy of the model, for faster inference (see gru_decoder.quantize and bench_quantized.py)
+def model_selection(x, quantized = False):
     if x ==1:
         path = os.getcwd()+'/test5_trained_inference.pt'
         hidden_s = 150
@@ -43,36 +46,64 @@ def model_selection(x):
     decoder = GRU(voc_length, hidden_s, voc_length, n_layers)
     decoder_optimizer = torch.optim.Adam(decoder.parameters(), lr=lr)
     criterion = nn.CrossEntropyLoss()
-    decoder = torch.load(path)
-    decoder.eval()
+    #the checkpoint can be a state_dict or a whole pickled model (as saved by train_gru.py or a notebook, whose GRU
+    #only runs one text at a time); either way its weights end up in a gru_decoder.GRU, which can also run batches
+    decoder = gd.load_checkpoint(path)
+    if quantized:
+        decoder = gd.quantize(decoder)
     return decoder
 
+#the decoding engine for the current decoder and word_to_freq, and the (decoder, word_to_freq) it was made for
+_engine = None
+_engine_for = None
+
+def get_decoding_engine():
+    #made once and reused, so that the vocabulary array is only built again when decoder or word_to_freq are replaced
+    global _engine, _engine_for
+    if _engine_for is None or _engine_for[0] is not decoder or _engine_for[1] is not word_to_freq:
+        _engine = gd.DecodingEngine(decoder, Vocabulary.from_word_to_freq(word_to_freq))
+        _engine_for = (decoder, word_to_freq)
+    return _engine
+
+def load_bundle(filename, quantized = False):
+    #loads a model bundle (see gru_decoder.save_bundle) and makes it the model that evaluate() and gen_input_words() use
+    #returns voc, voc_length, word_to_freq and decoder, like load_model() in Demo.ipynb, without reading any trigrams
+    #quantized = True loads an int8 copy of the model, for faster inference
+    #the hidden state is carried from word to word or reset, as the bundle says the model was trained
+    global decoder, word_to_freq, voc, voc_length, _engine, _engine_for
+    decoder, vocab, metadata = gd.load_bundle(filename, quantized)
+    word_to_freq = vocab.word_to_id
+    voc = set(word_to_freq)
+    voc_length = len(vocab)
+    _engine = gd.DecodingEngine(decoder, vocab, metadata.get('hidden_state', 'carry'))
+    _engine_for = (decoder, word_to_freq)
+    return voc, voc_length, word_to_freq, decoder
+
+@prof.timed()
 def evaluate(prime_str='this process', predict_len=100, temperature=0.8):
-    hidden = decoder.init_hidden()
-
-    for p in range(predict_len):
-
-        prime_input = torch.tensor([word_to_freq[w] for w in prime_str.split()], dtype=torch.long)
-        cont = prime_input[-2:] #last two words as input
-        output, hidden = decoder(cont, hidden)
+    #each token is one GRU step on the last two words (carrying the hidden state) plus one sample; see gru_decoder.py
+    prime_str = get_decoding_engine().generate(prime_str, predict_len, temperature)
 
-        # Sample from the network as a multinomial distribution
-        output_dist = output.data.view(-1).div(temperature).exp()
-        top_i = torch.multinomial(output_dist, 1)[0]
+    prof.count('evaluate.tokens', predict_len)
+    return prime_str
 
-        # Add predicted word to string and use as next input
-        predicted_word = list(word_to_freq.keys())[list(word_to_freq.values()).index(top_i)]
-        prime_str += " " + predicted_word
-#         inp = torch.tensor(word_to_ix[predicted_word], dtype=torch.long)
+@prof.timed()
+def evaluate_batch(primes, predict_len=100, n_candidates=1, temperature=0.8):
+    #n_candidates continuations of each of the primes, sampled together (one forward pass per token for all of them)
+    #returns a list with a list of n_candidates strings per prime
+    candidates = get_decoding_engine().generate_batch(primes, predict_len, temperature, n_candidates)
 
-    return prime_str
+    prof.count('evaluate.tokens', predict_len * n_candidates * len(primes))
+    return candidates
 
-def gen_input_words(mw, model):
+@prof.timed()
+def gen_input_words(mw, model, rng = None):
     #mw = main word
     #model = embeddings used to generate the cards
+    #rng = seed or numpy Generator for drawing the card (None = global random state)
 
     #generating the corresponding taboo card
-    card_words = cg.card_generator(mw, cg.get_gold_probdist(), model)
+    card_words = cg.get_engine(model).generate(mw, rng=rng)
     #set of words that we hope will appear in the description
     input_words = card_words[mw] + [mw]
 
@@ -95,16 +126,18 @@ def gen_input_words(mw, model):
     input_words = [word for word in input_words if word in voc]
     return input_words
 
-def description_generator(mw, model, n_seeds = 3, n_iterations = 10, debugging = False, printing = False):
+@prof.timed()
+def description_generator(mw, model, n_seeds = 3, n_iterations = 10, debugging = False, printing = False, seed = None):
     #mw = main word
     #model = embeddings used to generate the cards
     #n_seeds = if we are using 2 or 3 seeds during the sentence generation step
     #n_iterations = how many iterations we will do in the generation step
     #debugging = True if we want to print some statistics about the process. False if we only want the last 5 generated sentences.
     #printing = True will print something, based on debugging. If false, it will only return the final sentence
+    #seed = if given, the card behind the input words is drawn reproducibly from (mw, seed)
 
     #generating the input_words we are aiming to include in our description
-    input_words = gen_input_words(mw, model)
+    input_words = gen_input_words(mw, model, cg.card_rng(mw, seed) if seed is not None else None)
     #on average a descriptive sentence had 27 words/symbols.
     # we will equally divide them between our seeds
 
@@ -228,6 +261,7 @@ def description_generator(mw, model, n_seeds = 3, n_iterations = 10, debugging =
                         print(sentence)
             scores[i] = score
             i +=1
+            prof.count('description_generator.iterations')
 
     #if we are using 2 seeds
     #the 2 most frequent ones in our corpus were "x is" and 'x means'
@@ -326,14 +360,61 @@ def description_generator(mw, model, n_seeds = 3, n_iterations = 10, debugging =
                         print(sentence)
             scores[i] = score
             i +=1
+            prof.count('description_generator.iterations')
     return sentence
 
-def sentence_cleaner(sentence, mw, model):
+#the seeds of the sentence segments and how many words to generate after each, for 3 and for 2 seeds
+#the most frequent ones in our corpus were "x is", 'x means' and "x can be found"
+SEGMENTS = {3: [(' means', 7), (' is', 7), (' can be found', 5)],
+            2: [(' means', 11), (' is', 12)]}
+
+@prof.timed()
+def batched_description_generator(mw, model, n_seeds = 3, n_candidates = 10, printing = False, seed = None):
+    #mw = main word
+    #model = embeddings used to generate the cards
+    #n_seeds = if we are using 2 or 3 seeds during the sentence generation step
+    #n_candidates = how many continuations of every seed we sample to choose from
+    #printing = True will print the chosen segments and how many input words each of them contains
+    #seed = if given, the card behind the input words is drawn reproducibly from (mw, seed)
+
+    #instead of regenerating segments round after round (like description_generator does), all the candidates of all
+    #the seeds are sampled in one batch, and for every seed the candidate that covers the most input words is kept
+    if n_seeds not in SEGMENTS:
+        raise ValueError('n_seeds must be one of %s, not %r' % (sorted(SEGMENTS), n_seeds))
+    input_words = gen_input_words(mw, model, cg.card_rng(mw, seed) if seed is not None else None)
+
+    primes = [mw + opening for opening, length in SEGMENTS[n_seeds]]
+    lengths = [length for opening, length in SEGMENTS[n_seeds]]
+
+    #every candidate gets the length of the longest segment and is cut to the length of its own segment afterwards
+    candidates = evaluate_batch(primes, max(lengths), n_candidates, temperature = 1)
+
+    #scoring: the input words a segment adds (not counting the seed), where words already covered by an earlier
+    #segment don't count again
+    covered = set()
+    sentence_parts = []
+    for prime, length, prime_candidates in zip(primes, lengths, candidates):
+        n_prime = len(prime.split())
+        generated = [c.split()[n_prime:n_prime + length] for c in prime_candidates]
+        scores = [len(set(words).intersection(input_words) - covered) for words in generated]
+        best = int(np.argmax(scores))
+        covered.update(set(generated[best]).intersection(input_words))
+        sentence_parts.append(' '.join([prime] + generated[best]))
+        if printing:
+            print(scores[best], sentence_parts[-1])
+
+    prof.count('batched_description_generator.candidates', n_candidates * len(primes))
+    return ' '.join(sentence_parts)
+
+@prof.timed()
+def sentence_cleaner(sentence, mw, model, rng = None):
     #replacing MW with "the main word" and TWs appearing in the sentence with one of their synonyms
+    #rng = seed or numpy Generator for drawing the card and the synonyms (None = global random state)
+    rng = cg.make_rng(rng)
     sentence = sentence.replace(mw, 'The main word')
 
     #replacing any TWs appearing in our sentence with some allowed synonym
-    taboo_words = cg.card_generator(mw, cg.get_gold_probdist(), model)[mw]
+    taboo_words = cg.get_engine(model).generate(mw, rng=rng)[mw]
 
     spl = np.array(sentence.split())
     for tw in taboo_words:
@@ -341,12 +422,21 @@ def sentence_cleaner(sentence, mw, model):
            #getting synonyms of detected tw
             syns = sr.get_synonyms(tw)
             if len(syns) > 0:
-                syns = list(syns)
-                choice = np.random.choice(syns)
+                #sorted, so that a seeded choice doesn't depend on set order
+                syns = sorted(syns)
+                choice = (rng if rng is not None else np.random).choice(syns)
                 sentence = sentence.replace(tw, choice)
     return sentence
 
-def final_output(mw, model, n_seeds = 3, n_iterations = 10, debugging = False, printing = False):
-    sentence = description_generator(mw, model, n_seeds, n_iterations, debugging, printing)
-    output = sentence_cleaner(sentence, mw, model)
+def final_output(mw, model, n_seeds = 3, n_iterations = 10, debugging = False, printing = False, seed = None, n_candidates = None):
+    #with a seed, description_generator and sentence_cleaner draw the same card for mw
+    #with n_candidates, the segments are chosen from that many candidates sampled in one batch instead of being
+    #regenerated for up to n_iterations rounds (see batched_description_generator)
+    #with profiling enabled, each description is recorded as one request (see profiling.py)
+    with prof.request('description', mw=mw):
+        if n_candidates is not None:
+            sentence = batched_description_generator(mw, model, n_seeds, n_candidates, printing, seed)
+        else:
+            sentence = description_generator(mw, model, n_seeds, n_iterations, debugging, printing, seed)
+        output = sentence_cleaner(sentence, mw, model, cg.card_rng(mw, seed) if seed is not None else None)
     return output
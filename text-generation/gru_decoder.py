@@ -0,0 +1,343 @@
+import pickle
+import types
+import torch
+import torch.nn as nn
+from vocabulary import Vocabulary
+
+
+# The model predicts each word from the two words before it (it is trained on trigrams).
+CONTEXT_SIZE = 2
+
+# How the hidden state is handled from one generated token to the next, which should match how the model was trained:
+# 'carry' passes it on (the notebooks train on all trigrams as one sequence), 'reset' starts every step from zeros
+# (train_gru.py trains on shuffled trigrams, each from a fresh hidden state).
+HIDDEN_STATES = ('carry', 'reset')
+
+# What identifies a model bundle (see save_bundle() ), and the version of its layout.
+BUNDLE_FORMAT = 'taboo-gru-bundle'
+BUNDLE_VERSION = 1
+
+
+class GRU(nn.Module):
+    #init for input size, hidden size, output size and number of hidden layers.
+    def __init__(self, input_s, hidden_s, output_s,n_layers = 1):
+        super(GRU, self).__init__()
+        self.input_s = input_s
+        self.hidden_s = hidden_s
+        self.output_s = output_s
+        self.n_layers = n_layers
+        # our encoder will be nn.Embedding
+        # reminder: the encoder takes the input and outputs a feature tensor holding the information representing the input.
+        self.encoder = nn.Embedding(input_s, hidden_s)
+        #defining the GRU cell, still have to determine which parameters work best
+        self.gru = nn.GRU(2*hidden_s, hidden_s, n_layers, batch_first=True, bidirectional=False)
+        # defining linear decoder
+        self.decoder = nn.Linear(hidden_s, output_s)
+
+    def forward(self, input, hidden):
+        #input is the two context word ids, or a (batch size, 2) tensor of them to run several texts at once
+        batch_size = input.shape[0] if input.dim() > 1 else 1
+        #making sure that each row of the input is one example
+        input = self.encoder(input.view(batch_size, -1))
+        output, hidden = self.gru(input.view(batch_size, 1, -1), hidden)
+        output = self.decoder(output.view(batch_size, -1))
+        return output, hidden
+
+    def init_hidden(self, batch_size = 1):
+        return torch.zeros(self.n_layers, batch_size, self.hidden_s)
+
+
+def as_batched(decoder):
+    """
+    Returns a GRU that can run batches with the weights of any trigram GRU. The GRU class the notebooks define has
+    the same layers as GRU, but its forward() only takes one text at a time and its init_hidden() no batch size.
+
+    Arg:
+        decoder: A GRU, or a model with the same hyperparameters and layers (e.g. the notebooks' GRU).
+    Returns:
+        decoder itself if it is a GRU, or else a new GRU with its weights (in the same train or eval mode).
+    """
+    if isinstance(decoder, GRU):
+        return decoder
+    try:
+        batched = GRU(decoder.input_s, decoder.hidden_s, decoder.output_s, decoder.n_layers)
+        batched.load_state_dict(decoder.state_dict())
+    except (AttributeError, RuntimeError) as e:
+        raise TypeError('%s is not a trigram GRU with the layers of gru_decoder.GRU, so it can\'t generate text in '
+                        'batches (%s)' % (type(decoder).__name__, e)) from e
+    batched.train(decoder.training)
+    return batched
+
+
+class _CheckpointUnpickler(pickle.Unpickler):
+    # Whole models pickled in a notebook refer to their class as __main__.GRU; they are loaded as a GRU instead.
+    def find_class(self, module, name):
+        if module == '__main__' and name == 'GRU':
+            return GRU
+        return super().find_class(module, name)
+
+
+# What torch.load() is given as its pickle module, so that it unpickles with _CheckpointUnpickler.
+_checkpoint_pickle = types.ModuleType('_checkpoint_pickle')
+_checkpoint_pickle.Unpickler = _CheckpointUnpickler
+_checkpoint_pickle.load = lambda file, **kwargs: _CheckpointUnpickler(file, **kwargs).load()
+
+
+def load_checkpoint(filename):
+    """
+    Loads a GRU saved by the notebooks or by train_gru.py, either as its state_dict (the hyperparameters are read
+    off the shapes of the weights) or as a whole pickled model. Either way the result is a GRU, whatever class the
+    model was pickled as.
+
+    Arg:
+        filename: The path of the checkpoint.
+    Returns:
+        A GRU in eval mode.
+    """
+    # A whole model is unpickled, which runs code from the file: only load checkpoints you trust.
+    checkpoint = torch.load(filename, map_location='cpu', weights_only=False, pickle_module=_checkpoint_pickle)
+    if isinstance(checkpoint, nn.Module):
+        checkpoint = checkpoint.state_dict()
+
+    input_s, hidden_s = checkpoint['encoder.weight'].shape
+    output_s = checkpoint['decoder.weight'].shape[0]
+    n_layers = sum(1 for key in checkpoint if key.startswith('gru.weight_ih_l'))
+    decoder = GRU(input_s, hidden_s, output_s, n_layers)
+    decoder.load_state_dict(checkpoint)
+    decoder.eval()
+    return decoder
+
+
+def quantize(decoder):
+    """
+    Makes an int8 copy of a GRU for faster inference on CPU: the weights of the GRU layers and of the projection onto
+    the vocabulary (where most of the work is) are stored as 8-bit integers, and the activations are quantised on the
+    fly (PyTorch's dynamic quantisation). The embeddings stay as they are.
+
+    Arg:
+        decoder: A GRU.
+    Returns:
+        A quantised copy of the decoder, in eval mode (for inference only; it can't be trained).
+    """
+    quantize_dynamic = torch.ao.quantization.quantize_dynamic if hasattr(torch, 'ao') else torch.quantization.quantize_dynamic
+    quantized = quantize_dynamic(decoder, {nn.GRU, nn.Linear}, dtype=torch.qint8)
+    quantized.eval()
+    return quantized
+
+
+def save_bundle(decoder, vocab, filename, **metadata):
+    """
+    Saves everything needed to generate text with a GRU in one file: its weights, its hyperparameters and its
+    vocabulary in the order of the ids.
+
+    Args:
+        decoder: A GRU.
+        vocab: The vocabulary.Vocabulary the decoder was trained with.
+        filename: The path of the file to write.
+        metadata: Keyword arguments with anything else worth keeping (strings and numbers), e.g. the training data,
+           and hidden_state (see HIDDEN_STATES), which the decoding engine of description_generator.load_bundle()
+           follows.
+    """
+    if len(vocab) != decoder.input_s or len(vocab) != decoder.output_s:
+        raise ValueError('the vocabulary has %d words, the decoder %d inputs and %d outputs'
+                         % (len(vocab), decoder.input_s, decoder.output_s))
+    torch.save({
+        'format': BUNDLE_FORMAT,
+        'version': BUNDLE_VERSION,
+        'hyperparameters': {'input_s': decoder.input_s, 'hidden_s': decoder.hidden_s, 'output_s': decoder.output_s,
+                            'n_layers': decoder.n_layers},
+        'vocabulary': vocab.id_to_word.tolist(),
+        'state_dict': decoder.state_dict(),
+        'metadata': metadata
+    }, filename)
+
+
+def load_bundle(filename, quantized=False):
+    """
+    Loads a model saved with save_bundle(). Only the weights and the word list are read (no training data), and
+    since the vocabulary is stored in the order of the ids, the ids always match the weights.
+
+    Args:
+        filename: The path of the bundle.
+        quantized: (default False) return an int8 copy of the GRU for faster inference (see quantize() ).
+    Returns:
+        A tuple (GRU in eval mode, vocabulary.Vocabulary, dictionary of metadata).
+    """
+    # The bundle only holds tensors, numbers and strings, so it can be read without unpickling any code.
+    bundle = torch.load(filename, map_location='cpu', weights_only=True)
+    if not isinstance(bundle, dict) or bundle.get('format') != BUNDLE_FORMAT:
+        raise ValueError(filename + ' is not a model bundle')
+    if bundle['version'] > BUNDLE_VERSION:
+        raise ValueError('%s has version %d; this code reads up to version %d' % (filename, bundle['version'],
+                                                                                  BUNDLE_VERSION))
+
+    h = bundle['hyperparameters']
+    decoder = GRU(h['input_s'], h['hidden_s'], h['output_s'], h['n_layers'])
+    decoder.load_state_dict(bundle['state_dict'])
+    decoder.eval()
+    if quantized:
+        decoder = quantize(decoder)
+    return decoder, Vocabulary(bundle['vocabulary']), bundle['metadata']
+
+
+class TokenBuffer:
+    """
+    The token ids of a batch of texts being generated side by side, one row per text, kept in a tensor that grows in
+    place (doubling its capacity when it is full), so that appending a token to every row and reading the context
+    both take constant time.
+    """
+
+    def __init__(self, rows, capacity=64):
+        """
+        Args:
+            rows: A list of equally long lists of integers, the ids of the tokens each text starts with.
+            capacity: (default 64) the number of tokens per row to make room for up front.
+        """
+        self.length = len(rows[0])
+        self._ids = torch.empty(len(rows), max(capacity, self.length, 1), dtype=torch.long)
+        self._ids[:, :self.length] = torch.as_tensor(rows, dtype=torch.long)
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def batch_size(self):
+        return self._ids.shape[0]
+
+    def append(self, token_ids):
+        """
+        Adds a token id at the end of each row.
+
+        Arg:
+            token_ids: A tensor with one id per row.
+        """
+        if self.length == self._ids.shape[1]:
+            grown = torch.empty(self.batch_size, 2 * self._ids.shape[1], dtype=torch.long)
+            grown[:, :self.length] = self._ids
+            self._ids = grown
+        self._ids[:, self.length] = token_ids
+        self.length += 1
+
+    def context(self, size=CONTEXT_SIZE):
+        """
+        Returns a view of the last size token ids of each row.
+        """
+        return self._ids[:, self.length - size:self.length]
+
+    def ids(self, start=0):
+        """
+        Returns a view of the token ids of each row from position start on.
+        """
+        return self._ids[:, start:self.length]
+
+
+class DecodingEngine:
+    """
+    Generates text with a GRU one token at a time. Each step feeds the last two token ids to the model, carries the
+    hidden state over to the next step (or starts from zeros again, for models trained on separate trigrams) and
+    samples one token, so a step costs one GRU step plus one sample no matter how long the text has grown; words are
+    only looked up once, at the end. Several texts (e.g. a number of
+    candidate continuations of each of several primes) can be generated together as one batch, with one forward pass
+    per step for all of them.
+    """
+
+    def __init__(self, decoder, vocab, hidden_state='carry'):
+        """
+        Args:
+            decoder: A trained GRU (in eval mode). Other models with the same layers, like the notebooks' GRU, are
+               copied into a GRU (see as_batched() ).
+            vocab: The vocabulary.Vocabulary the decoder was trained with.
+            hidden_state: (default 'carry') 'carry' to pass the hidden state on from step to step, as the notebooks
+               train, or 'reset' to start every step from zeros, as train_gru.py trains (see HIDDEN_STATES).
+        """
+        if hidden_state not in HIDDEN_STATES:
+            raise ValueError('hidden_state must be one of %s, not %r' % (HIDDEN_STATES, hidden_state))
+        self.decoder = as_batched(decoder)
+        self.vocab = vocab
+        self.hidden_state = hidden_state
+
+    def begin(self, primes, capacity=100, n_candidates=1):
+        """
+        Starts generating text after some primes.
+
+        Args:
+            primes: A list of strings of at least two words from the vocabulary.
+            capacity: (default 100) the number of tokens that are going to be generated.
+            n_candidates: (default 1) the number of texts to generate after each prime.
+        Returns:
+            A tuple (TokenBuffer with n_candidates rows per prime, in the order of primes, holding the ids of the last
+            two words of the prime; initial hidden state).
+        """
+        rows = []
+        for prime_str in primes:
+            ids = self.vocab.ids(prime_str.split())
+            if len(ids) < CONTEXT_SIZE:
+                raise ValueError('the prime needs at least %d words: %r' % (CONTEXT_SIZE, prime_str))
+            # Only the context is needed: the model never looks further back than that.
+            rows.extend([ids[-CONTEXT_SIZE:]] * n_candidates)
+        hidden = torch.zeros(self.decoder.n_layers, len(rows), self.decoder.hidden_s)
+        return TokenBuffer(rows, CONTEXT_SIZE + capacity), hidden
+
+    @torch.no_grad()
+    def step(self, buffer, hidden, temperature=0.8, generator=None):
+        """
+        Samples the next token of every row and appends it to the buffer.
+
+        Args:
+            buffer: The TokenBuffer of the texts so far.
+            hidden: The hidden state after the previous step (ignored if hidden_state is 'reset').
+            temperature: (default 0.8) higher values make unlikely words likelier.
+            generator: (optional) a torch.Generator to sample with. Defaults to torch's global random state.
+        Returns:
+            A tuple (tensor with the ids of the new tokens, new hidden state).
+        """
+        if self.hidden_state == 'reset':
+            hidden = hidden.new_zeros(hidden.shape)
+        output, hidden = self.decoder(buffer.context(), hidden)
+        if output.shape[0] != buffer.batch_size:
+            # E.g. a subclass of GRU whose forward() only runs one text at a time, like the notebooks' GRU.
+            raise RuntimeError('%s returned %d rows of scores for a batch of %d texts; batched generation needs a '
+                               'forward() like that of gru_decoder.GRU' % (type(self.decoder).__name__,
+                                                                          output.shape[0], buffer.batch_size))
+
+        # Sample from the network as a multinomial distribution, one token per row
+        output_dist = torch.softmax(output / temperature, -1)
+        token_ids = torch.multinomial(output_dist, 1, generator=generator).view(-1)
+        buffer.append(token_ids)
+        return token_ids, hidden
+
+    def generate_batch(self, primes, predict_len=100, temperature=0.8, n_candidates=1, generator=None):
+        """
+        Generates n_candidates texts after each of the primes, all in one batch.
+
+        Args:
+            primes: A list of strings of at least two words from the vocabulary.
+            predict_len: (default 100) the number of tokens to generate.
+            temperature: (default 0.8) higher values make unlikely words likelier.
+            n_candidates: (default 1) the number of texts to generate after each prime.
+            generator: (optional) a torch.Generator to sample with.
+        Returns:
+            A list with, for each prime, a list of n_candidates strings: the prime followed by the generated words,
+            separated by spaces.
+        """
+        buffer, hidden = self.begin(primes, predict_len, n_candidates)
+        for _ in range(predict_len):
+            token_ids, hidden = self.step(buffer, hidden, temperature, generator)
+
+        words = self.vocab.words(buffer.ids(CONTEXT_SIZE))
+        return [[' '.join([prime_str] + words[i * n_candidates + j]) for j in range(n_candidates)]
+                for i, prime_str in enumerate(primes)]
+
+    def generate(self, prime_str, predict_len=100, temperature=0.8, generator=None):
+        """
+        Generates text after a prime.
+
+        Args:
+            prime_str: A string of at least two words from the vocabulary.
+            predict_len: (default 100) the number of tokens to generate.
+            temperature: (default 0.8) higher values make unlikely words likelier.
+            generator: (optional) a torch.Generator to sample with.
+        Returns:
+            The prime followed by the generated words, separated by spaces.
+        """
+        return self.generate_batch([prime_str], predict_len, temperature, 1, generator)[0][0]
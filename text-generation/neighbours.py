@@ -0,0 +1,202 @@
+import numpy as np
+
+
+def unit_vectors(gensim_model):
+    """
+    Returns the matrix of L2-normalised word vectors of the given embeddings, one row per vocabulary entry.
+
+    Arg:
+        gensim_model: The pre-trained word embeddings.
+    Returns:
+        A 2D numpy array (vocabulary size x dimensions) of unit-length vectors.
+    """
+    # gensim only computes the normalised vectors on demand (the first most_similar() call does the same thing).
+    if getattr(gensim_model, 'vectors_norm', None) is None:
+        gensim_model.init_sims()
+    return gensim_model.vectors_norm
+
+
+def word_index(gensim_model, word):
+    """
+    Returns the row of the given word in the embedding matrix.
+
+    Args:
+        gensim_model: The pre-trained word embeddings.
+        word: A string that is in the model's vocabulary.
+    Returns:
+        An integer, the row index of the word.
+    """
+    # gensim's vocab maps words to Vocab objects carrying the index, lighter-weight models map words to the index directly.
+    entry = gensim_model.vocab[word]
+    return getattr(entry, 'index', entry)
+
+
+def top_k_rows(queries, vectors, k, max_block_elems=2**25):
+    """
+    Finds the k rows of vectors with the highest dot product with each of the query vectors, streaming through
+    vectors block by block so that the whole similarity matrix never has to fit in memory at once.
+
+    Args:
+        queries: A 2D numpy array of unit-length query vectors.
+        vectors: A 2D numpy array (or memory map) of unit-length vectors to search.
+        k: An integer, how many neighbours to keep per query.
+        max_block_elems: (default 2**25) upper bound on the size of each intermediate similarity block.
+    Returns:
+        A tuple (indices, similarities) of two 2D arrays with one row per query, sorted by descending similarity.
+    """
+    n_queries = len(queries)
+    k = min(k, len(vectors))
+
+    # Choose the number of vocabulary rows per block so that n_queries x block_rows stays within the budget.
+    block_rows = max(1024, max_block_elems // max(n_queries, 1))
+
+    best_idx = np.empty((n_queries, 0), dtype=np.int64)
+    best_sim = np.empty((n_queries, 0), dtype=np.float32)
+
+    for start in range(0, len(vectors), block_rows):
+        block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+        sims = queries @ block.T
+
+        # Keep only this block's k best candidates per query...
+        kk = min(k, sims.shape[1])
+        part = np.argpartition(-sims, kk - 1, axis=1)[:, :kk]
+        part_sim = np.take_along_axis(sims, part, axis=1)
+
+        # ... and merge them with the best candidates seen so far.
+        all_idx = np.concatenate([best_idx, part + start], axis=1)
+        all_sim = np.concatenate([best_sim, part_sim], axis=1)
+        kk = min(k, all_sim.shape[1])
+        keep = np.argpartition(-all_sim, kk - 1, axis=1)[:, :kk]
+        best_idx = np.take_along_axis(all_idx, keep, axis=1)
+        best_sim = np.take_along_axis(all_sim, keep, axis=1)
+
+    # Finally sort the survivors by descending similarity.
+    order = np.argsort(-best_sim, axis=1, kind='stable')
+    return np.take_along_axis(best_idx, order, axis=1), np.take_along_axis(best_sim, order, axis=1)
+
+
+def most_similar_batch(words, gensim_model, topn=10):
+    """
+    Finds the most similar words for a whole batch of words with one blocked pass over the embedding matrix, instead
+    of calling gensim's most_similar() (which scans the full matrix) once per word.
+
+    Args:
+        words: An iterable of strings.
+        gensim_model: The pre-trained word embeddings.
+        topn: (default 10) the number of most similar words to return per word.
+    Returns:
+        A dictionary with the words found in the vocabulary as keys and lists of (word, cosine similarity) tuples as
+        values, in the same format and order as gensim's most_similar(). Words not in the vocabulary are left out.
+    """
+    # Look up each distinct in-vocabulary word once.
+    known = [w for w in dict.fromkeys(words) if w in gensim_model.vocab]
+    if not known:
+        return {}
+
+    # Models that narrow down the candidates themselves (an ANN index or a neighbour table) answer word by word.
+    if hasattr(gensim_model, 'candidate_similarities'):
+        return {w: gensim_model.most_similar(w, topn=topn) for w in known}
+
+    vectors = unit_vectors(gensim_model)
+    rows = np.array([word_index(gensim_model, w) for w in known])
+    queries = np.asarray(vectors[rows], dtype=np.float32)
+
+    # Ask for one extra neighbour, since every word is its own nearest neighbour and most_similar() leaves it out.
+    nbr_idx, nbr_sim = top_k_rows(queries, vectors, topn + 1)
+
+    similar = {}
+    for i, w in enumerate(known):
+        similar[w] = [(gensim_model.index2word[j], float(s)) for j, s in zip(nbr_idx[i], nbr_sim[i]) if j != rows[i]][:topn]
+    return similar
+
+
+def candidate_similarities(gensim_model, row):
+    """
+    Computes the cosine similarity between the vector in the given row and the candidate neighbours. For a plain model
+    all vocabulary entries are candidates; models that can narrow the candidates down (like ann.IVFIndex) provide
+    their own candidate_similarities() method, which is used instead.
+
+    Args:
+        gensim_model: The pre-trained word embeddings.
+        row: An integer, the row of the query word.
+    Returns:
+        A tuple (rows, similarities): a 1D array of candidate rows (or None, meaning all rows in order) and a 1D array
+        of their similarities to the query.
+    """
+    if hasattr(gensim_model, 'candidate_similarities'):
+        return gensim_model.candidate_similarities(row)
+
+    vectors = unit_vectors(gensim_model)
+    query = np.asarray(vectors[row], dtype=np.float32)
+    return None, np.dot(vectors, query)
+
+
+def iter_similar_rows(word, gensim_model, neighbours=None, chunk_size=32):
+    """
+    Lazily yields the rows of the words most similar to the given word in chunks, most similar first. The
+    similarities to all candidates are computed once, and then ranked chunk by chunk with argpartition (each chunk
+    twice the size of the previous one), so stopping early never pays for sorting the whole vocabulary.
+
+    Args:
+        word: A string that is in the model's vocabulary.
+        gensim_model: The pre-trained word embeddings.
+        neighbours: (optional) a precomputed list of the word's most similar (word, similarity) tuples. These are
+           yielded first, and the similarities are only computed if more candidates are needed.
+        chunk_size: (default 32) the number of candidates in the first chunk.
+    Yields:
+        (rows, similarities) tuples of two 1D numpy arrays.
+    """
+    skip = 0
+    hi = chunk_size
+    if neighbours:
+        nbr_rows = np.array([word_index(gensim_model, w) for w, s in neighbours], dtype=np.int64)
+        nbr_sims = np.array([s for w, s in neighbours], dtype=np.float32)
+        lo = 0
+        while lo < len(neighbours):
+            yield nbr_rows[lo:hi], nbr_sims[lo:hi]
+            lo = hi
+            hi *= 2
+        skip = len(neighbours)
+
+    row = word_index(gensim_model, word)
+    rows, sims = candidate_similarities(gensim_model, row)
+
+    # Make sure the word itself comes last, and don't count it as a candidate.
+    sims = np.array(sims, dtype=np.float32)
+    sims[np.flatnonzero(rows == row) if rows is not None else row] = -np.inf
+    n_candidates = int(np.isfinite(sims).sum())
+
+    lo = skip
+    hi = max(hi, skip + chunk_size)
+    while lo < n_candidates:
+        hi = min(hi, n_candidates)
+
+        # Find the hi best candidates, sort them, and yield the ones not yielded yet.
+        if hi < len(sims):
+            top = np.argpartition(-sims, hi - 1)[:hi]
+        else:
+            top = np.arange(len(sims))
+        top = top[np.argsort(-sims[top], kind='stable')][lo:hi]
+
+        yield (top if rows is None else rows[top]), sims[top]
+
+        lo = hi
+        hi *= 2
+
+
+def iter_similar(word, gensim_model, neighbours=None, chunk_size=32):
+    """
+    Lazily yields the words most similar to the given word, most similar first (see iter_similar_rows() ).
+
+    Args:
+        word: A string that is in the model's vocabulary.
+        gensim_model: The pre-trained word embeddings.
+        neighbours: (optional) a precomputed list of the word's most similar (word, similarity) tuples. These are
+           yielded first, and the similarities are only computed if more candidates are needed.
+        chunk_size: (default 32) the number of candidates to rank in the first chunk.
+    Yields:
+        (word, cosine similarity) tuples.
+    """
+    for rows, sims in iter_similar_rows(word, gensim_model, neighbours, chunk_size):
+        for j, sim in zip(rows, sims):
+            yield gensim_model.index2word[j], float(sim)
@@ -0,0 +1,349 @@
+import bisect
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+
+# Instrumentation shared by the card and description generators. Functions report how long their stages take (with
+# stage() or the timed() decorator) and count what they do (with count()); while profiling is disabled, which is the
+# default, these calls return straight away. Once enable() has been called, the timings are collected in histograms,
+# and everything reported within a request() is also kept as a trace of that one request.
+
+
+# Upper bounds (in milliseconds) of the latency histogram buckets; the last bucket takes everything slower.
+BUCKETS_MS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+# The most stages a single trace keeps (a loop inside a request can report a great many).
+MAX_TRACE_EVENTS = 10000
+
+
+class Histogram:
+    """
+    Counts values (latencies, by default) in fixed buckets, so that recording is cheap and the memory use doesn't grow.
+    """
+
+    def __init__(self, bounds=BUCKETS_MS, unit='ms'):
+        """
+        Args:
+            bounds: (default BUCKETS_MS) the increasing upper bounds of the buckets.
+            unit: (default 'ms') the unit of the values, for the statistics.
+        """
+        self.bounds = bounds
+        self.unit = unit
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        """
+        Adds one value.
+
+        Arg:
+            value: A number, e.g. a latency in milliseconds.
+        """
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q):
+        """
+        Estimates a percentile as the upper bound of the bucket it falls into.
+
+        Arg:
+            q: A number between 0 and 100.
+        Returns:
+            A float, or None if nothing has been recorded.
+        """
+        n = sum(self.counts)
+        if n == 0:
+            return None
+        rank = q / 100 * n
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return float(min(bound, self.max))
+        return self.max
+
+    def stats(self):
+        """
+        Returns the histogram and a summary of it.
+
+        Returns:
+            A dictionary with the unit, count, mean, estimated median/95th/99th percentiles, the maximum and the
+            bucket counts.
+        """
+        n = sum(self.counts)
+        labels = ['<=%g' % bound for bound in self.bounds] + ['>%g' % self.bounds[-1]]
+        return {
+            'unit': self.unit,
+            'count': n,
+            'mean': self.total / n if n else None,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+            'buckets': dict(zip(labels, self.counts))
+        }
+
+
+_enabled = False
+_memory = False
+_lock = threading.Lock()
+_local = threading.local()
+_histograms = {}
+_counters = {}
+_traces = deque(maxlen=1000)
+
+
+class _NullContext:
+    # What stage() and request() return while profiling is disabled.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL = _NullContext()
+
+
+def enable(memory=False, max_traces=1000):
+    """
+    Starts profiling.
+
+    Args:
+        memory: (default False) also record the peak memory use of each request, with tracemalloc. This slows
+           everything down considerably, so leave it off when only the timings matter.
+        max_traces: (default 1000) how many of the most recent request traces to keep.
+    """
+    global _enabled, _memory, _traces
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    with _lock:
+        if max_traces != _traces.maxlen:
+            _traces = deque(_traces, maxlen=max_traces)
+    _memory = memory
+    _enabled = True
+
+
+def disable():
+    """
+    Stops profiling. What has been recorded is kept until reset() is called.
+    """
+    global _enabled, _memory
+    _enabled = False
+    if _memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _memory = False
+
+
+def is_enabled():
+    """
+    Returns:
+        True if profiling is enabled.
+    """
+    return _enabled
+
+
+def reset():
+    """
+    Discards all recorded timings, counters and traces.
+    """
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _traces.clear()
+
+
+def _record(name, ms):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.record(ms)
+
+
+class _Trace:
+    # Everything reported during one request, in the thread that handles it.
+
+    def __init__(self, name, info):
+        self.name = name
+        self.info = info
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        self.stages = []
+        self.counters = {}
+        self.depth = 0
+        self.dropped = 0
+
+    def to_dict(self, duration_ms, peak_memory):
+        return {
+            'name': self.name,
+            'info': self.info,
+            'start': self.wall_start,
+            'duration_ms': duration_ms,
+            'peak_memory_bytes': peak_memory,
+            'stages': self.stages,
+            'dropped_stages': self.dropped,
+            'counters': self.counters
+        }
+
+
+class _Stage:
+    __slots__ = ('name', 'start', 'trace', 'depth')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.trace = getattr(_local, 'trace', None)
+        if self.trace is not None:
+            self.depth = self.trace.depth
+            self.trace.depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        ms = 1000 * (time.perf_counter() - self.start)
+        _record(self.name, ms)
+
+        trace = self.trace
+        if trace is not None:
+            trace.depth -= 1
+            if len(trace.stages) < MAX_TRACE_EVENTS:
+                trace.stages.append({'name': self.name, 'depth': self.depth,
+                                     'start_ms': 1000 * (self.start - trace.start), 'duration_ms': ms})
+            else:
+                trace.dropped += 1
+        return False
+
+
+class _RequestContext:
+    __slots__ = ('trace', 'previous')
+
+    def __init__(self, name, info):
+        self.trace = _Trace(name, info)
+
+    def __enter__(self):
+        self.previous = getattr(_local, 'trace', None)
+        _local.trace = self.trace
+        if _memory and tracemalloc.is_tracing() and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        self.trace.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        ms = 1000 * (time.perf_counter() - self.trace.start)
+        peak = tracemalloc.get_traced_memory()[1] if _memory and tracemalloc.is_tracing() else None
+        _local.trace = self.previous
+        _record('request:' + self.trace.name, ms)
+        with _lock:
+            _traces.append(self.trace.to_dict(ms, peak))
+        return False
+
+
+def stage(name):
+    """
+    Times a stage, as in `with profiling.stage('neighbours'): ...`.
+
+    Arg:
+        name: A string naming the stage.
+    Returns:
+        A context manager.
+    """
+    return _Stage(name) if _enabled else _NULL
+
+
+def timed(name=None):
+    """
+    Decorator that times every call of a function as a stage.
+
+    Arg:
+        name: (optional) the name of the stage. Defaults to the name of the function.
+    Returns:
+        The decorator.
+    """
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Stage(label):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, n=1):
+    """
+    Adds to a counter, e.g. of loop iterations, sampled tokens or cache hits.
+
+    Args:
+        name: A string naming the counter.
+        n: (default 1) the number to add.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.counters[name] = trace.counters.get(name, 0) + n
+
+
+def request(name, **info):
+    """
+    Keeps a trace of everything reported during one request (e.g. making one card or one description), as in
+    `with profiling.request('card', mw=mw): ...`. Inside another request, it is only timed as a stage of that one.
+
+    Args:
+        name: A string naming the kind of request.
+        info: Keyword arguments describing the request, which are stored in the trace.
+    Returns:
+        A context manager.
+    """
+    if not _enabled:
+        return _NULL
+    if getattr(_local, 'trace', None) is not None:
+        return _Stage(name)
+    return _RequestContext(name, info)
+
+
+def report(traces=True):
+    """
+    Returns everything recorded so far.
+
+    Arg:
+        traces: (default True) include the individual request traces.
+    Returns:
+        A dictionary with the histogram of every stage (and of every kind of request, as 'request:<name>'), the
+        counters and, optionally, the most recent request traces.
+    """
+    with _lock:
+        result = {
+            'stages': {name: histogram.stats() for name, histogram in sorted(_histograms.items())},
+            'counters': dict(sorted(_counters.items()))
+        }
+        if traces:
+            result['traces'] = list(_traces)
+    return result
+
+
+def export_json(filename, traces=True):
+    """
+    Writes report() to a JSON file.
+
+    Args:
+        filename: The path of the file to write.
+        traces: (default True) include the individual request traces.
+    """
+    with open(filename, 'w', encoding='utf-8') as json_out:
+        json.dump(report(traces), json_out, indent=2)
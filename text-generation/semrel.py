@@ -1,7 +1,150 @@
-from nltk.corpus import wordnet as wn
-from nltk.stem import WordNetLemmatizer
-from nltk.metrics import edit_distance
+import os
+import sqlite3
+import threading
+from types import MappingProxyType
+import numpy as np
+import memo
+import neighbours as nb
+import profiling as prof
+import wordfilter as wf
 
+
+# NLTK is only imported once it is actually needed (importing it is slow, and when the relation index is loaded, the
+# semantic relations are looked up there instead of in WordNet).
+
+# A single lemmatiser is shared by all calls (see get_lemmatizer()).
+_lemmatizer = None
+
+# The relation index used by make_semrel_dict() and get_synonyms(), if one has been loaded (see load_relation_index()).
+_relation_index = None
+
+RELATION_INDEX_FILE = 'wordnet-relations.sqlite'
+
+# Size limit and time-to-live (in seconds, None = never expire) of each of the caches of WordNet lookups below.
+CACHE_SIZE = 10000
+CACHE_TTL = None
+SEMRELS = ('semrel_synonym', 'semrel_antonym', 'semrel_hypernym', 'semrel_hyponym')
+
+
+def wordnet():
+    """
+    Returns NLTK's WordNet corpus reader, importing NLTK on the first call.
+
+    Returns:
+        The nltk.corpus.wordnet object.
+    """
+    from nltk.corpus import wordnet as wn
+    return wn
+
+
+def get_lemmatizer():
+    """
+    Returns the shared WordNet lemmatiser, creating it (and loading WordNet) on the first call.
+
+    Returns:
+        A WordNetLemmatizer object.
+    """
+    global _lemmatizer
+    if _lemmatizer is None:
+        from nltk.stem import WordNetLemmatizer
+        wordnet().ensure_loaded()
+        _lemmatizer = WordNetLemmatizer()
+    return _lemmatizer
+
+
+class RelationIndex:
+    """
+    Precomputed semantic relations (the output of make_semrel_dict() for every WordNet lemma), stored in an SQLite
+    file with one row per word, so that looking up a word is a single indexed read instead of a walk through WordNet.
+    The file is built by build_relation_index.py.
+    """
+
+    def __init__(self, filename):
+        """
+        Arg:
+            filename: Path of the SQLite file.
+        """
+        self.filename = filename
+        self._conn = None
+        self._pid = None
+        # The connection is shared by all threads (e.g. the card service's thread pool), one query at a time.
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        # SQLite connections must not be shared with forked worker processes, so each process opens its own.
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect('file:' + self.filename + '?mode=ro', uri=True, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._conn
+
+    def lookup(self, word):
+        """
+        Returns the precomputed semantic relations of the given word.
+
+        Arg:
+            word: a string like 'cat'
+        Returns:
+            A dictionary like the one make_semrel_dict() returns, or None if the word isn't in the index.
+        """
+        with self._lock:
+            row = self._connection().execute('SELECT synonym, antonym, hypernym, hyponym FROM semrels WHERE word = ?',
+                                             (word,)).fetchone()
+        if row is None:
+            return None
+        return {label: set(words.split('\t')) if words else set() for label, words in zip(SEMRELS, row)}
+
+
+def load_relation_index(filename=RELATION_INDEX_FILE):
+    """
+    Makes make_semrel_dict() and get_synonyms() answer from the given relation index (falling back to WordNet for
+    words that aren't in it).
+
+    Arg:
+        filename: (default 'wordnet-relations.sqlite') path of the file written by build_relation_index.py.
+    Returns:
+        The RelationIndex object now in use.
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(filename)
+    return set_relation_index(RelationIndex(filename))
+
+
+def set_relation_index(index):
+    """
+    Makes make_semrel_dict() and get_synonyms() answer from the given relation index, or from WordNet itself if it is
+    None.
+
+    Arg:
+        index: a RelationIndex, or any object with the same lookup() method, or None.
+    Returns:
+        The relation index now in use.
+    """
+    global _relation_index
+    _relation_index = index
+
+    # Results cached so far came from the previous source.
+    clear_caches()
+    return _relation_index
+
+
+def set_lemmatizer(lemmatizer):
+    """
+    Replaces the shared lemmatiser that get_lemmatizer() returns (None makes the next call create a WordNet one).
+
+    Arg:
+        lemmatizer: a WordNetLemmatizer, or any object with the same lemmatize() method, or None.
+    """
+    global _lemmatizer
+    _lemmatizer = lemmatizer
+    clear_caches()
+
+
+def _freeze_semrel_dict(semrel_dict):
+    # Read-only view of a semrel dictionary with its sets frozen, safe to hand out from the cache.
+    return MappingProxyType({label: frozenset(words) for label, words in semrel_dict.items()})
+
+
+@memo.memoize(CACHE_SIZE, CACHE_TTL, freeze=tuple)
 def word_to_synsets(word):
     """
     Converts the given word to a synset object.
@@ -10,11 +153,11 @@ def word_to_synsets(word):
         word: a string like 'cat'
         pos: the desired part of speech (choices: wn.NOUN, wn.VERB, wn.ADJ, wn.ADV)
     Returns:
-        A string containing the first synset ID, formatted according to WordNet's conventions, e.g. 'cat.n.01',
-        corresponding to that word.
+        A tuple of the synsets corresponding to that word (e.g. the one with ID 'cat.n.01', formatted according to
+        WordNet's conventions).
     """
     # Convert word string to the synset with the corresponding part of speech.
-    return wn.synsets(word)
+    return wordnet().synsets(word)
 
 
 def synset_to_word(synset):
@@ -72,6 +215,7 @@ def get_hyponyms(synset):
     return [synset_to_word(hypo) for hypo in synset.hyponyms()]
 
 
+@memo.memoize(CACHE_SIZE, CACHE_TTL, freeze=frozenset)
 def get_synonyms(word):
     """
     Returns a set of synonyms, according to WordNet, for the given input word (using all of its senses, if
@@ -80,8 +224,14 @@ def get_synonyms(word):
     Arg:
         word: a string representing the word whose synonyms we want.
     Returns:
-        A set containing all of the other words in the same WordNet synset as the given word.
+        A frozenset containing all of the other words in the same WordNet synset as the given word.
     """
+    # If the relation index is loaded and knows the word, the synonyms are already there.
+    if _relation_index is not None:
+        semrel_dict = _relation_index.lookup(word)
+        if semrel_dict is not None:
+            return semrel_dict['semrel_synonym']
+
     # Initialise set that will collect the synonyms.
     synonym_set = set()
 
@@ -106,6 +256,8 @@ def get_synonyms(word):
     return synonym_set.difference(to_rm)
 
 
+@prof.timed()
+@memo.memoize(CACHE_SIZE, CACHE_TTL, freeze=_freeze_semrel_dict)
 def make_semrel_dict(word):
     """
     Creates a dictionary that contains all words standing in the given semantic relation to the main word.
@@ -113,10 +265,16 @@ def make_semrel_dict(word):
     Arg:
         word: a string like 'cat' (the main word)
     Returns:
-        A dictionary with the semantic relations as keys and a set of words that have that relation to all senses
-        of the input word, according to WordNet, as values.
+        A read-only dictionary with the semantic relations as keys and a frozenset of words that have that relation
+        to all senses of the input word, according to WordNet, as values.
     """
 
+    # If the relation index is loaded and knows the word, just read its relations from there.
+    if _relation_index is not None:
+        semrel_dict = _relation_index.lookup(word)
+        if semrel_dict is not None:
+            return semrel_dict
+
     # Initialise dictionary (and we can get synonyms right away).
     semrel_dict = {
         'semrel_synonym': get_synonyms(word),
@@ -138,46 +296,132 @@ def make_semrel_dict(word):
     return semrel_dict
 
 
-def get_collocations(word, forbidden_wds, gensim_model, num_collocates, num_to_check = 10):
+# The cached functions above, by name.
+_cached = {
+    'word_to_synsets': word_to_synsets,
+    'get_synonyms': get_synonyms,
+    'make_semrel_dict': make_semrel_dict
+}
+
+
+def cache_stats():
+    """
+    Returns the hit/miss/eviction statistics of the caches of WordNet lookups.
+
+    Returns:
+        A dictionary with the cached functions' names as keys and their cache statistics as values.
+    """
+    return {name: func.cache.stats() for name, func in _cached.items()}
+
+
+def configure_caches(maxsize=None, ttl=None):
+    """
+    Changes the size limit and/or time-to-live of the caches of WordNet lookups.
+
+    Args:
+        maxsize: (optional) the maximum number of cached results per function.
+        ttl: (optional) the number of seconds after which a cached result expires.
+    """
+    for func in _cached.values():
+        func.cache.resize(maxsize, ttl)
+
+
+def clear_caches():
+    """
+    Empties the caches of WordNet lookups.
+    """
+    for func in _cached.values():
+        func.cache.clear()
+
+
+class NotEnoughCollocates(LookupError):
+    """
+    Raised by get_collocations() when fewer than the requested number of collocates survive filtering among all the
+    candidates it is allowed to check. The ones that were found are available as the collocates attribute.
+    """
+
+    def __init__(self, word, collocates, num_collocates):
+        super().__init__('only found %d of %d collocates for %r' % (len(collocates), num_collocates, word))
+        self.word = word
+        self.collocates = collocates
+
+
+def get_collocations(word, forbidden_wds, gensim_model, num_collocates, num_to_check = 10, neighbours = None, max_to_check = 1000,
+                     dedupe_lemmas = False):
     """
     Returns minimum num_collocates most similar words to the given word based on gensim word embeddings.
 
     Arg:
         word: A string representing the main word.
         forbidden_wds: A set containing words as strings that may not be included as output.
-        gensim_model: The pre-trained word embeddings.
+        gensim_model: The pre-trained word embeddings (or an ann.IVFIndex built from them, for approximate search).
         num_collocates: An integer, the number of collocates to generate.
-        num_to_check: (default 10) the number of most similar words to begin with.
+        num_to_check: (default 10) the minimum number of most similar words to look at.
+        neighbours: (optional) a precomputed list of (word, similarity) tuples for the main word, most similar first
+           (e.g. from neighbours.most_similar_batch()). Used before querying the model.
+        max_to_check: (default 1000) the maximum number of most similar words to look at.
+        dedupe_lemmas: (default False) if True, a word whose lemma already came up (like 'cats' after 'cat') is skipped
+           without counting towards num_to_check and max_to_check.
     Returns:
-        A list of collocated words as strings.
+        A set of collocated words as strings.
+    Raises:
+        KeyError: if the word isn't in the word2vec vocabulary.
+        NotEnoughCollocates: if fewer than num_collocates words were found among the max_to_check most similar ones.
     """
 
-    lemmatizer = WordNetLemmatizer()
+    if word not in gensim_model.vocab:
+        raise KeyError(word)
+    is_phrase = wf.phrase_mask(gensim_model)
+
+    # With a precomputed lemma map (see build_lemma_map.py), lemmatising is a lookup.
+    lemma_map = getattr(gensim_model, 'lemma_map', None)
+    lemmatizer = get_lemmatizer() if lemma_map is None else None
+
+    # Go through the words whose embeddings are most similar to the input word's, most similar first, in chunks (the
+    # first one num_to_check words long, then doubling). The similarities are computed only once and ranked lazily, so
+    # we can stop as soon as we have enough words.
+    filtered = set()
+    seen_lemmas = set()
+    checked = 0
+    for rows, sims in nb.iter_similar_rows(word, gensim_model, neighbours, chunk_size=max(num_to_check, 1)):
+        prof.count('get_collocations.rounds')
+
+        # Lemmatise the words to remove plural/other inflections.
+        if lemma_map is not None:
+            lemmas = lemma_map.lemmas(rows)
+        else:
+            lemmas = [lemmatizer.lemmatize(gensim_model.index2word[j]) for j in rows]
 
-    # Use gensim's most_similar() function to get the (initially ten) words whose embeddings are most similar to the
-    # input word's. Lemmatise the words to remove plural/other inflections.
+        # Optionally drop the inflected forms of lemmas that were already looked at, before they take up a slot.
+        if dedupe_lemmas:
+            fresh = [lemma not in seen_lemmas and not seen_lemmas.add(lemma) for lemma in lemmas]
+            rows = rows[np.array(fresh, dtype=bool)]
+            lemmas = [lemma for lemma, new in zip(lemmas, fresh) if new]
 
-    try:  # If the MW is in the word2vec vocabulary
-        similar_tups = gensim_model.most_similar(word, topn=num_to_check)
-        similar_wds = [lemmatizer.lemmatize( tup[0] ) for tup in similar_tups]
+        rows = rows[:max_to_check - checked]
+        lemmas = lemmas[:len(rows)]
 
-        # Now save only a subset of those similar words, namely the ones that:
+        # Keep the lemmas only if they:
         # - do not contain the main word
         # - are not in the passed-in set of forbidden words
-        # - have a Levenshtein distance of up to 3 from the MW (i.e. are similar, probably typos)
-        # - words with underscores in them, indicating multi-word units (often pretty weird)
-        filtered = [wd for wd in similar_wds if (word not in wd.lower() and wd not in forbidden_wds and edit_distance(word, wd) > 4 and '_' not in wd)]
-        filtered = set(filtered)
-
-        # Recursive bit: Check if there are at least num_collocates different words in filtered (base case).
-        # If not, increase the number of words to check in each recursive iteration by three and run the function again.
-        # Will stop once there are minimum num_collocates words in filtered.
-
-        if len(filtered) >= num_collocates:
-            return filtered
-        else:
-            num_to_check += 3
-            return get_collocations(word, forbidden_wds, gensim_model, num_collocates, num_to_check)
-
-    except KeyError:  # arises when input word not in vocab
-        pass
+        # - have a Levenshtein distance of more than 4 from the MW (i.e. aren't too similar, probably typos)
+        # - have no underscores in them, indicating multi-word units (often pretty weird)
+        # The checks are done for the whole chunk at once; lemmatising never adds or removes underscores, so that
+        # check is a lookup in the vocabulary-wide mask.
+        keep = wf.keep_mask(word, lemmas, forbidden_wds) & ~is_phrase[rows]
+
+        for wd, ok in zip(lemmas, keep):
+            checked += 1
+            if ok:
+                filtered.add(wd)
+
+            # Stop once we have looked at the first num_to_check words and have at least num_collocates different words.
+            if checked >= num_to_check and len(filtered) >= num_collocates:
+                prof.count('get_collocations.candidates', checked)
+                return filtered
+
+        if checked >= max_to_check:
+            break
+
+    prof.count('get_collocations.candidates', checked)
+    raise NotEnoughCollocates(word, filtered, num_collocates)
@@ -0,0 +1,94 @@
+import pickle
+import pytest
+import torch
+import gru_decoder as gd
+import train_gru as tg
+from vocabulary import Vocabulary
+
+
+TRIGRAMS = [(['the', 'cat'], 'sat'), (['cat', 'sat'], 'on'), (['sat', 'on'], 'the'), (['on', 'the'], 'mat')] * 25
+
+
+@pytest.fixture
+def trained():
+    vocab = Vocabulary.from_trigrams(TRIGRAMS)
+    torch.manual_seed(0)
+    decoder = gd.GRU(len(vocab), 8, len(vocab), 2)
+    tg.train(decoder, tg.TrigramDataset.from_trigrams(TRIGRAMS, vocab), epochs=2, batch_size=16, printing=False)
+    return decoder, vocab
+
+
+def generate(decoder, vocab, hidden_state='carry'):
+    engine = gd.DecodingEngine(decoder, vocab, hidden_state)
+    return engine.generate_batch(['the cat', 'on the'], 10, n_candidates=3, generator=torch.Generator().manual_seed(0))
+
+
+def test_load_checkpoint(tmp_path, trained):
+    decoder, vocab = trained
+    for checkpoint in (decoder.state_dict(), decoder):
+        filename = str(tmp_path / 'checkpoint.pt')
+        torch.save(checkpoint, filename)
+        loaded = gd.load_checkpoint(filename)
+        assert (loaded.input_s, loaded.hidden_s, loaded.output_s, loaded.n_layers) == (len(vocab), 8, len(vocab), 2)
+        assert generate(loaded, vocab) == generate(decoder, vocab)
+
+
+def test_reset_generates_each_word_from_a_fresh_hidden_state(trained):
+    decoder, vocab = trained
+    engine = gd.DecodingEngine(decoder, vocab, 'reset')
+    buffer, hidden = engine.begin(['the cat', 'on the'], 10)
+    generator = torch.Generator().manual_seed(0)
+    for _ in range(10):
+        token_ids, hidden = engine.step(buffer, hidden, generator=generator)
+
+    # The same words as predicting every one like train_gru.py trains: from the last two words and zeros.
+    expected = [vocab.ids(['the', 'cat']), vocab.ids(['on', 'the'])]
+    generator = torch.Generator().manual_seed(0)
+    with torch.no_grad():
+        for _ in range(10):
+            contexts = torch.tensor([ids[-2:] for ids in expected])
+            output, _ = decoder(contexts, decoder.init_hidden(len(expected)))
+            token_ids = torch.multinomial(torch.softmax(output / 0.8, -1), 1, generator=generator).view(-1)
+            for ids, token_id in zip(expected, token_ids.tolist()):
+                ids.append(token_id)
+    assert buffer.ids(2).tolist() == [ids[2:] for ids in expected]
+
+    with pytest.raises(ValueError):
+        gd.DecodingEngine(decoder, vocab, 'keep')
+
+
+def test_bundle_round_trip(tmp_path, trained):
+    decoder, vocab = trained
+    filename = str(tmp_path / 'model.bundle')
+    gd.save_bundle(decoder, vocab, filename, epochs=2, hidden_state='reset')
+
+    loaded, loaded_vocab, metadata = gd.load_bundle(filename)
+    assert loaded_vocab.id_to_word.tolist() == vocab.id_to_word.tolist()
+    assert metadata == {'epochs': 2, 'hidden_state': 'reset'}
+    for name, weights in decoder.state_dict().items():
+        assert torch.equal(loaded.state_dict()[name], weights)
+    assert generate(loaded, loaded_vocab, 'reset') == generate(decoder, vocab, 'reset')
+
+    quantized, _, _ = gd.load_bundle(filename, quantized=True)
+    assert len(generate(quantized, loaded_vocab)[0]) == 3
+
+
+def test_bundle_rejects_other_files(tmp_path, trained):
+    decoder, vocab = trained
+    filename = str(tmp_path / 'weights.pt')
+    torch.save(decoder.state_dict(), filename)
+    with pytest.raises(ValueError):
+        gd.load_bundle(filename)
+
+
+def test_heldout_split_round_trip(tmp_path):
+    filename = str(tmp_path / 'trigrams.pkl')
+    with open(filename, 'wb') as fp:
+        pickle.dump(TRIGRAMS, fp)
+    vocab = Vocabulary.from_trigrams(TRIGRAMS)
+    valid = tg.TrigramDataset.from_trigrams(TRIGRAMS, vocab).split(0.2, seed=3)[1]
+    metadata = {'trigrams': filename, 'valid_fraction': 0.2, 'split_seed': 3, 'heldout_sha256': valid.fingerprint()}
+
+    assert torch.equal(tg.heldout_split(metadata, vocab).targets, valid.targets)
+    with pytest.raises(ValueError):
+        tg.heldout_split(dict(metadata, split_seed=4), vocab)
@@ -0,0 +1,273 @@
+import argparse
+import hashlib
+import pickle
+import time
+import torch
+import torch.nn as nn
+from torch.utils.data import BatchSampler, DataLoader, Dataset, RandomSampler, SequentialSampler
+import gru_decoder as gd
+from gru_decoder import GRU
+from vocabulary import Vocabulary
+
+
+class TrigramDataset(Dataset):
+    """
+    Trigrams as (context, target) id pairs: a (number of trigrams, 2) tensor of context ids and a tensor of target
+    ids. Indexing it with a list of positions returns a whole mini-batch at once, so batches are cut out of the
+    tensors instead of being stacked together from single examples.
+    """
+
+    def __init__(self, contexts, targets):
+        """
+        Args:
+            contexts: A (number of trigrams, 2) long tensor, the ids of the two context words of each trigram.
+            targets: A long tensor, the id of the word following each context.
+        """
+        self.contexts = contexts
+        self.targets = targets
+
+    @classmethod
+    def from_trigrams(cls, trigrams, vocab):
+        """
+        Converts trigrams to ids.
+
+        Args:
+            trigrams: A list of ([word, word], word) tuples, like the pickled trigrams_model1.txt.
+            vocab: A vocabulary.Vocabulary containing all their words.
+        Returns:
+            A TrigramDataset.
+        """
+        word_to_id = vocab.word_to_id
+        contexts = torch.tensor([[word_to_id[w] for w in context] for context, target in trigrams], dtype=torch.long)
+        targets = torch.tensor([word_to_id[target] for context, target in trigrams], dtype=torch.long)
+        return cls(contexts, targets)
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __getitem__(self, index):
+        return self.contexts[index], self.targets[index]
+
+    def split(self, valid_fraction, seed=0):
+        """
+        Splits off a random part of the trigrams for validation.
+
+        Args:
+            valid_fraction: A number between 0 and 1, the share of trigrams to hold out.
+            seed: (default 0) an integer, the seed of the split.
+        Returns:
+            A tuple (training TrigramDataset, validation TrigramDataset).
+        """
+        order = torch.randperm(len(self), generator=torch.Generator().manual_seed(seed))
+        n_valid = int(valid_fraction * len(self))
+        valid, train = order[:n_valid], order[n_valid:]
+        return TrigramDataset(*self[train]), TrigramDataset(*self[valid])
+
+    def fingerprint(self):
+        """
+        Returns a hex string that identifies the trigrams (and their order), e.g. to check that a split made again
+        later is the one a model was validated on.
+        """
+        h = hashlib.sha256()
+        h.update(self.contexts.numpy().tobytes())
+        h.update(self.targets.numpy().tobytes())
+        return h.hexdigest()
+
+
+def read_trigrams(filename):
+    """
+    Reads pickled trigrams.
+
+    Arg:
+        filename: A pickled list of ([word, word], word) tuples, like trigrams_model1.txt.
+    Returns:
+        The list.
+    """
+    with open(filename, 'rb') as fp:
+        return pickle.load(fp)
+
+
+def heldout_split(metadata, vocab, trigrams_file=None):
+    """
+    Makes again the validation split that train_gru.py held out when it trained a bundled model, from what the bundle's
+    metadata records about it (the trigrams, the share held out and the seed), and checks that it is the same one.
+
+    Args:
+        metadata: The metadata of a bundle saved by train_gru.py --valid (see gru_decoder.load_bundle() ).
+        vocab: The vocabulary.Vocabulary of the bundle.
+        trigrams_file: (optional) the path of the trigrams, if they have moved since training.
+    Returns:
+        A TrigramDataset with the held-out trigrams, none of which the model was trained on.
+    """
+    if not metadata.get('valid_fraction'):
+        raise ValueError('the model was trained without holding out any trigrams (train it with --valid)')
+    trigrams = read_trigrams(trigrams_file or metadata['trigrams'])
+    valid = TrigramDataset.from_trigrams(trigrams, vocab).split(metadata['valid_fraction'], metadata['split_seed'])[1]
+    if valid.fingerprint() != metadata['heldout_sha256']:
+        raise ValueError('the trigrams have changed since the model was trained, so the held-out split is not the same')
+    return valid
+
+
+def make_loader(dataset, batch_size=256, shuffle=True, num_workers=0, seed=None):
+    """
+    Makes a DataLoader that hands out mini-batches of a TrigramDataset.
+
+    Args:
+        dataset: A TrigramDataset.
+        batch_size: (default 256) the number of trigrams per mini-batch.
+        shuffle: (default True) draw the mini-batches in a new random order every epoch.
+        num_workers: (default 0) the number of worker processes preparing batches. The dataset is in memory, so
+           this only pays off for very large batches.
+        seed: (optional) an integer, for the same order of mini-batches every time.
+    Returns:
+        A DataLoader yielding (contexts, targets) tensors.
+    """
+    generator = torch.Generator().manual_seed(seed) if seed is not None else None
+    sampler = RandomSampler(dataset, generator=generator) if shuffle else SequentialSampler(dataset)
+    # batch_size=None: each list of positions from the BatchSampler is passed to the dataset in one go.
+    return DataLoader(dataset, sampler=BatchSampler(sampler, batch_size, drop_last=False), batch_size=None,
+                      num_workers=num_workers)
+
+
+def train_epoch(decoder, loader, optimizer, criterion):
+    """
+    Trains the decoder for one pass over the data, with one optimiser step per mini-batch.
+
+    Args:
+        decoder: A GRU.
+        loader: A DataLoader from make_loader().
+        optimizer: A torch optimiser of the decoder's parameters.
+        criterion: The loss function, e.g. nn.CrossEntropyLoss().
+    Returns:
+        The mean loss per trigram.
+    """
+    decoder.train()
+    total_loss = 0.0
+    n = 0
+    for contexts, targets in loader:
+        # Every trigram is a separate example, so each starts from a fresh hidden state.
+        output, hidden = decoder(contexts, decoder.init_hidden(len(targets)))
+        loss = criterion(output, targets)
+
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+        total_loss += loss.item() * len(targets)
+        n += len(targets)
+    return total_loss / n
+
+
+@torch.no_grad()
+def evaluate_loss(decoder, loader, criterion):
+    """
+    Computes the mean loss of the decoder on some data, without training.
+
+    Args:
+        decoder: A GRU.
+        loader: A DataLoader from make_loader().
+        criterion: The loss function, e.g. nn.CrossEntropyLoss().
+    Returns:
+        The mean loss per trigram (its exponential is the perplexity).
+    """
+    decoder.eval()
+    total_loss = 0.0
+    n = 0
+    for contexts, targets in loader:
+        output, hidden = decoder(contexts, decoder.init_hidden(len(targets)))
+        total_loss += criterion(output, targets).item() * len(targets)
+        n += len(targets)
+    return total_loss / n
+
+
+def train(decoder, dataset, epochs=10, batch_size=256, lr=0.001, valid_fraction=0.0, n_threads=None, num_workers=0,
+          checkpoint_path=None, save_state_dict=False, seed=0, printing=True):
+    """
+    Trains a GRU on trigrams with shuffled mini-batches.
+
+    Args:
+        decoder: A GRU (new, or loaded to train further).
+        dataset: A TrigramDataset.
+        epochs: (default 10) the number of passes over the data.
+        batch_size: (default 256) the number of trigrams per mini-batch.
+        lr: (default 0.001) the learning rate of Adam. (The 0.015 of the notebooks was for one step per epoch.)
+        valid_fraction: (default 0) the share of trigrams to hold out to report the validation loss after each epoch.
+        n_threads: (optional) the number of threads torch computes each batch with. Defaults to torch's default.
+        num_workers: (default 0) the number of worker processes preparing batches (see make_loader() ).
+        checkpoint_path: (optional) where to save the decoder after every epoch, as a whole pickled model (what
+           model_selection() loads with torch.load() ) or, with save_state_dict, as its state_dict.
+        save_state_dict: (default False) save the state_dict instead of the whole model.
+        seed: (default 0) an integer, the seed of the validation split and the order of the mini-batches.
+        printing: (default True) print the loss after each epoch.
+    Returns:
+        A list with a dictionary per epoch: the epoch, training loss, validation loss (or None) and seconds taken.
+    """
+    if n_threads is not None:
+        torch.set_num_threads(n_threads)
+
+    valid_loader = None
+    if valid_fraction > 0:
+        dataset, valid = dataset.split(valid_fraction, seed)
+        valid_loader = make_loader(valid, batch_size, shuffle=False)
+    loader = make_loader(dataset, batch_size, num_workers=num_workers, seed=seed)
+
+    optimizer = torch.optim.Adam(decoder.parameters(), lr=lr)
+    criterion = nn.CrossEntropyLoss()
+
+    history = []
+    for epoch in range(1, epochs + 1):
+        start = time.perf_counter()
+        loss = train_epoch(decoder, loader, optimizer, criterion)
+        valid_loss = evaluate_loss(decoder, valid_loader, criterion) if valid_loader is not None else None
+        history.append({'epoch': epoch, 'loss': loss, 'valid_loss': valid_loss, 'seconds': time.perf_counter() - start})
+
+        if printing:
+            print('epoch %d: loss %.4f%s (%.1f s)' % (epoch, loss, '' if valid_loss is None else
+                                                     ', validation loss %.4f' % valid_loss, history[-1]['seconds']))
+        if checkpoint_path is not None:
+            torch.save(decoder.state_dict() if save_state_dict else decoder, checkpoint_path)
+
+    decoder.eval()
+    return history
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train the trigram GRU with shuffled mini-batches.')
+    parser.add_argument('trigrams', help='pickled list of ([word, word], word) trigrams, like trigrams_model1.txt')
+    parser.add_argument('output', help='file to save the trained model to (loadable with torch.load() )')
+    parser.add_argument('--hidden', type=int, default=150, help='hidden size')
+    parser.add_argument('--layers', type=int, default=1, help='number of GRU layers')
+    parser.add_argument('--epochs', type=int, default=10, help='number of passes over the trigrams')
+    parser.add_argument('--batch-size', type=int, default=256, help='trigrams per mini-batch')
+    parser.add_argument('--lr', type=float, default=0.001, help='learning rate')
+    parser.add_argument('--valid', type=float, default=0.0, help='share of trigrams to hold out for validation')
+    parser.add_argument('--threads', type=int, default=None, help='number of threads per batch')
+    parser.add_argument('--workers', type=int, default=0, help='number of batch loading processes')
+    parser.add_argument('--state-dict', action='store_true', help='save the state_dict instead of the whole model')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the initial weights, the split and the batch order')
+    parser.add_argument('--bundle', default=None, help='also save a model bundle (weights and vocabulary) to this file')
+    args = parser.parse_args()
+
+    trigrams = read_trigrams(args.trigrams)
+
+    # The ids are the line numbers of the saved vocabulary, which is needed to use the model.
+    vocab = Vocabulary.from_trigrams(trigrams)
+    vocab.save(args.output + '.vocab.txt')
+    dataset = TrigramDataset.from_trigrams(trigrams, vocab)
+    del trigrams
+
+    torch.manual_seed(args.seed)
+    decoder = GRU(len(vocab), args.hidden, len(vocab), args.layers)
+    history = train(decoder, dataset, args.epochs, args.batch_size, args.lr, args.valid, args.threads, args.workers,
+                    args.output, args.state_dict, args.seed)
+
+    if args.bundle is not None:
+        # The held-out split is recorded so that it can be made again (see heldout_split() ) to evaluate the model on
+        # trigrams it wasn't trained on.
+        heldout = {}
+        if args.valid > 0:
+            heldout = {'valid_fraction': args.valid, 'split_seed': args.seed,
+                       'heldout_sha256': dataset.split(args.valid, args.seed)[1].fingerprint()}
+        # Every trigram was trained from a fresh hidden state, so generation should start every step from one too.
+        gd.save_bundle(decoder, vocab, args.bundle, trigrams=args.trigrams, epochs=args.epochs,
+                       loss=history[-1]['loss'] if history else None, hidden_state='reset', **heldout)
@@ -0,0 +1,104 @@
+import numpy as np
+
+
+class Vocabulary:
+    """
+    The words of a language model and their ids: an array from id to word and a dictionary from word to id, so that
+    looking up either direction takes constant time.
+    """
+
+    def __init__(self, words):
+        """
+        Arg:
+            words: An iterable of distinct strings, in the order of their ids.
+        """
+        self.id_to_word = np.array(list(words), dtype=object)
+        self.word_to_id = {word: i for i, word in enumerate(self.id_to_word)}
+        if len(self.word_to_id) != len(self.id_to_word):
+            raise ValueError('the vocabulary contains duplicate words')
+
+    @classmethod
+    def from_word_to_freq(cls, word_to_freq):
+        """
+        Makes a vocabulary from the word-to-id dictionary that load_model() in Demo.ipynb returns.
+
+        Arg:
+            word_to_freq: A dictionary with the words as keys and their ids (0 to the number of words - 1) as values.
+        Returns:
+            A Vocabulary with the same ids.
+        """
+        words = [None] * len(word_to_freq)
+        for word, i in word_to_freq.items():
+            words[i] = word
+        return cls(words)
+
+    @classmethod
+    def from_trigrams(cls, trigrams):
+        """
+        Makes the vocabulary of a list of trigrams, in sorted order (so that the ids are the same every time, unlike
+        those of a vocabulary built by iterating over a set).
+
+        Arg:
+            trigrams: A list of ([word, word], word) tuples, like the pickled trigrams_model1.txt.
+        Returns:
+            A Vocabulary.
+        """
+        words = set()
+        for context, target in trigrams:
+            words.update(context)
+            words.add(target)
+        return cls(sorted(words))
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Reads a vocabulary saved with save().
+
+        Arg:
+            filename: The path of the file, with one word per line in the order of their ids.
+        Returns:
+            A Vocabulary.
+        """
+        with open(filename, encoding='utf-8') as vocab_in:
+            return cls(line.rstrip('\n') for line in vocab_in)
+
+    def save(self, filename):
+        """
+        Writes the vocabulary to a file, one word per line in the order of their ids.
+
+        Arg:
+            filename: The path of the file to write.
+        """
+        with open(filename, 'w', encoding='utf-8') as vocab_out:
+            for word in self.id_to_word:
+                vocab_out.write(word + '\n')
+
+    def __len__(self):
+        return len(self.id_to_word)
+
+    def __contains__(self, word):
+        return word in self.word_to_id
+
+    def id(self, word):
+        """
+        Returns the id of a word (raising a KeyError if it isn't in the vocabulary).
+        """
+        return self.word_to_id[word]
+
+    def ids(self, words):
+        """
+        Returns the list of ids of a list of words.
+        """
+        return [self.word_to_id[word] for word in words]
+
+    def word(self, i):
+        """
+        Returns the word with the given id.
+        """
+        return self.id_to_word[i]
+
+    def words(self, ids):
+        """
+        Returns the list of words with the given ids (a list or an array of integers).
+        """
+        return self.id_to_word[np.asarray(ids, dtype=np.int64)].tolist()